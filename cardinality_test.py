@@ -0,0 +1,73 @@
+import numpy as np
+import matplotlib.pyplot as plt
+
+from solvers.cardinality import CARDINALITY_ENCODINGS
+from solvers.model_smt import run_Z3_incremental
+from utils.environments import *
+
+"""
+Run this file to compare the encodings of the cardinality constraints (3), (4), (5) and (7) of the SMT-based model.
+As in test.py the test is performed on two-dimensional grids generated by NetworkX by varying the size of the graph and
+the number of agents, the fastest encoding is reported for each size.
+"""
+
+MIN_SIZE = 2
+MAX_SIZE = 6
+SEED = 42
+# Encoding used by Z3, "boolean" or "functions"
+ENCODING = "boolean"
+
+
+def cardinality_test(num_agents):
+    """
+    Solve the same instances with each cardinality encoding and report the solving times.
+
+    :param num_agents: the list containing for each graph the number of agents
+    :return: a dictionary containing for each encoding the list of solving times, None when unsatisfiable
+    """
+
+    if len(num_agents) != MAX_SIZE - MIN_SIZE + 1:
+        raise ValueError("sizes and number of agents must be equal.")
+
+    times = dict((cardinality, []) for cardinality in CARDINALITY_ENCODINGS)
+    sep = "=" * 50
+
+    for size, number_of_agents in zip(range(MIN_SIZE, MAX_SIZE + 1), num_agents):
+        upper_bound = 2 * size
+
+        print(sep)
+        agents, edges, graph = environments(nx.grid_2d_graph, number_of_agents, SEED, n=size, m=size, verbose=False)
+        _, max_shortest_path = min_max_shortest_path(graph, agents)
+
+        for cardinality in CARDINALITY_ENCODINGS:
+            print(sep)
+            print("%s (%d agents and %d vertices)" % (cardinality, number_of_agents, len(edges)))
+            check, solve_time, _, _, _, _, _ = \
+                run_Z3_incremental(edges, agents, max_shortest_path, upper_bound, ENCODING, True, cardinality)
+
+            times[cardinality].append(solve_time if check else None)
+
+    print(sep)
+    print("Fastest encoding per graph size:")
+    for index, size in enumerate(range(MIN_SIZE, MAX_SIZE + 1)):
+        solved = [(times[cardinality][index], cardinality) for cardinality in CARDINALITY_ENCODINGS
+                  if times[cardinality][index] is not None]
+        if solved:
+            print("%dx%d:\t%s (%.3f s)" % (size, size, min(solved)[1], min(solved)[0]))
+        else:
+            print("%dx%d:\tunsatisfiable" % (size, size))
+
+    return times
+
+
+results = cardinality_test([i for i in range(MIN_SIZE, MAX_SIZE + 1)])
+
+size_range = np.linspace(MIN_SIZE, MAX_SIZE, MAX_SIZE - MIN_SIZE + 1)
+for name, values in results.items():
+    plt.plot(size_range, [np.nan if value is None else value for value in values], label=name)
+plt.xlabel("Graph's size")
+plt.ylabel("time")
+plt.yscale('log')
+plt.title("Cardinality encodings")
+plt.legend(loc='best')
+plt.show()
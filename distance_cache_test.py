@@ -0,0 +1,35 @@
+from solvers.model_cp import window_of_vertices
+from solvers.model_smt import IncrementalZ3Model
+from utils.distances import cache_info, clear_cache
+from utils.environments import *
+
+"""
+Run this file to check that the bounds computed by min_max_shortest_path on the NetworkX graph and the models built on
+the edges of the solvers, which include the self-loops, share the distance cache: the distances to the destinations are
+computed once, by the bounds, and read from the cache by the pruning of the SMT-based model and the windows of the
+CP-based one.
+"""
+
+SIZE = 6
+SEED = 42
+number_of_agents = 4
+
+agents, edges, graph = environments(nx.grid_2d_graph, number_of_agents, SEED, n=SIZE, m=SIZE, verbose=False)
+clear_cache()
+
+min_shortest_path, max_shortest_path = min_max_shortest_path(graph, agents)
+bounds = cache_info()
+print("Bounds: %d hits, %d misses" % (bounds["hits"], bounds["misses"]))
+
+IncrementalZ3Model(edges, agents, "boolean", True)
+smt = cache_info()
+print("SMT model: %d hits, %d misses" % (smt["hits"] - bounds["hits"], smt["misses"] - bounds["misses"]))
+
+window_of_vertices(edges, agents, 2 * max_shortest_path)
+cp = cache_info()
+print("CP windows: %d hits, %d misses" % (cp["hits"] - smt["hits"], cp["misses"] - smt["misses"]))
+
+# Only the distances from the origins are computed by the models
+assert smt["misses"] - bounds["misses"] == number_of_agents, "The SMT model does not share the distances to the goals"
+assert cp["misses"] == smt["misses"], "The CP windows do not share the distances of the SMT model"
+print("The distance cache is shared")
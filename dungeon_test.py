@@ -1,7 +1,7 @@
 from utils.animation import movement_animation
 from utils.environments import *
 from solvers.model_cp import solving_MAPF, run_CPLEX
-from solvers.model_smt import run_Z3
+from solvers.model_smt import run_Z3_incremental
 
 """
 Run this file to replicate the experiment described in Dungeon subsection of the report.
@@ -24,33 +24,21 @@ sep = "=" * 50
 agents = [(4, 13), (13, 22), (22, 4)]
 dungeon = generate_dungeon(ROOM_NUM, ROOM_SIZE_MIN, ROOM_SIZE_MAX, CORRIDOR_LENGTH_MIN, CORRIDOR_LENGTH_MAX, SEED)
 
-edges = []
-
-for node, neighbors in dungeon.adj.items():
-    edges.insert(node, set())
-    edges[node].add(node)
-    for neighbor, _ in neighbors.items():
-        edges[node].add(neighbor)
+edges = CSRGraph.from_networkx(dungeon).to_edges()
 
 print(sep)
 
-print("ENVIRONMENT: ")
-[print(str(node) + ": " + str(neighbors)) for node, neighbors in enumerate(edges)]
-print("AGENTS: ")
-print(agents)
+print_environment(edges, agents)
 
 min_shortest_path, max_shortest_path = min_max_shortest_path(dungeon, agents)
 makespan = max_shortest_path
 
 print(sep)
 print("Z3")
-check, solve_time, memory_usage, number_of_conflicts, decisions, _ = run_Z3(edges, agents, makespan)
-
-while not check and makespan <= upper_bound:
-    makespan += 1
-    check, solve_time, memory_usage, number_of_conflicts, decisions, _ = run_Z3(edges, agents, makespan)
+check, solve_time, memory_usage, number_of_conflicts, decisions, _, makespan = \
+    run_Z3_incremental(edges, agents, makespan, upper_bound)
 
-if not check and makespan >= upper_bound:
+if not check:
     print("Unsatisfiable")
 
 print(sep)
@@ -59,7 +47,7 @@ print("CPLEX")
 print(sep)
 print("\nStep 1) Searching for optimal number of layers\n")
 print(sep)
-check, ret, num_layers, _, _, _, _ = \
+check, ret, num_layers, _, _, _, _, layers_paths = \
     solving_MAPF(agents, edges, upper_bound, min_shortest_path)
 print(sep)
 print("\nStep 2) Solving with %d layers\n" % num_layers)
@@ -67,7 +55,7 @@ print(sep)
 paths = None
 if check:
     _, _, _, _, _, _, paths = \
-        run_CPLEX(edges, agents, ret, num_layers)
+        run_CPLEX(edges, agents, ret, num_layers, starting_paths=layers_paths)
 else:
     print("CPLEX: unsatisfiable")
 
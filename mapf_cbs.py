@@ -0,0 +1,35 @@
+from utils.animation import movement_animation
+from solvers.cbs import run_CBS
+from utils.environments import *
+
+"""
+This file allows to call to a specific graph Conflict-Based Search, which minimizes the sum of costs instead of the
+makespan. Feel free to change graph, agents sizes etc..
+"""
+
+number_of_agents = 20
+UPPER_BOUND = 200
+SEED = 42
+# Suboptimality factor: 1 for optimal plans, greater than 1 for ECBS
+W = 1.0
+BYPASS = True
+PRIORITIZE_CONFLICTS = True
+# Seconds after which the search is stopped
+TIME_LIMIT = 60
+
+# e.g: an execution using the warehouse environment
+agents, edges, graph = environments(generate_warehouse, number_of_agents, SEED, rows=30, columns=20, shelf_length=3,
+                                    corridor_width=1, verbose=False)
+
+check, solve_time, _, splits, expanded, paths, makespan = \
+    run_CBS(edges, agents, UPPER_BOUND, W, BYPASS, PRIORITIZE_CONFLICTS, TIME_LIMIT)
+
+if check:
+    print("Makespan %d found in %.3f s splitting %d conflicts and expanding %d states" %
+          (makespan, solve_time, splits, expanded))
+else:
+    print("No plan found")
+
+# Comment to not generate gif
+if paths is not None:
+    movement_animation(graph, paths, "./resources/cbs.gif", seed=SEED)
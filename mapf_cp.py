@@ -1,5 +1,5 @@
 from utils.animation import movement_animation
-from solvers.model_cp import solving_MAPF, run_CPLEX
+from solvers.model_cp import solving_MAPF, run_CPLEX, solver_parameters
 from utils.environments import *
 
 """
@@ -11,6 +11,11 @@ number_of_agents = 2
 SIZE = 5
 UPPER_BOUND = 70
 SEED = 42
+# Parameters of CP Optimizer, e.g. workers=32 or time_limit=60, and whether to branch first on the shortest paths
+PARAMETERS = solver_parameters(random_seed=SEED)
+SEARCH_PHASES = True
+# Start from the plan of the prioritized planner, whose makespan bounds the intervals
+WARM_START = True
 
 # e.g: an execution using the dungeon environment
 """
@@ -31,8 +36,8 @@ sep = "=" * 50
 print(sep)
 print("Step 1) Searching for optimal number of layers")
 print(sep)
-check, RET, num_layers, solve_time, memory_usage, number_of_conflicts, decisions = \
-    solving_MAPF(agents, edges, UPPER_BOUND, min_shortest_path)
+check, RET, num_layers, solve_time, memory_usage, number_of_conflicts, decisions, layers_paths = \
+    solving_MAPF(agents, edges, UPPER_BOUND, min_shortest_path, PARAMETERS, SEARCH_PHASES, WARM_START)
 
 print(sep)
 print("Step 2) Solving with %d layers" % num_layers)
@@ -41,9 +46,13 @@ print(sep)
 paths = None
 if check:
     _, mksp, solve_time, memory_usage, number_of_conflicts, decisions, paths = \
-        run_CPLEX(edges, agents, RET, num_layers)
+        run_CPLEX(edges, agents, RET, num_layers, starting_paths=layers_paths, parameters=PARAMETERS,
+                  search_phases=SEARCH_PHASES)
+    if paths is None:
+        # The final solve stopped at a limit, the plan found by the first step is still valid
+        paths = layers_paths
 else:
-    print("Unsatisfiable")
+    print("No plan found")
 
 # Comment to not generate gif
 if paths is not None:
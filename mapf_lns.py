@@ -0,0 +1,34 @@
+from utils.animation import movement_animation
+from solvers.lns import run_LNS
+from utils.environments import *
+
+"""
+This file allows to call to a specific graph the large neighborhood search, which improves the plan of the prioritized
+planner re-optimizing a few agents at a time with the exact models. Feel free to change graph, agents sizes etc..
+"""
+
+number_of_agents = 60
+UPPER_BOUND = 200
+SEED = 42
+# Exact model that re-optimizes the neighborhoods: "z3" minimizes their sum of costs, "cp" their makespan
+ENGINE = "z3"
+NEIGHBORHOOD_SIZE = 4
+# Seconds after which the search is stopped
+TIME_LIMIT = 60
+
+# e.g: an execution using the warehouse environment
+agents, edges, graph = environments(generate_warehouse, number_of_agents, SEED, rows=30, columns=20, shelf_length=3,
+                                    corridor_width=1, verbose=False)
+
+check, solve_time, _, _, iterations, paths, makespan = \
+    run_LNS(edges, agents, UPPER_BOUND, engine=ENGINE, neighborhood_size=NEIGHBORHOOD_SIZE, time_limit=TIME_LIMIT,
+            seed=SEED)
+
+if check:
+    print("Makespan %d found in %.3f s re-optimizing %d neighborhoods" % (makespan, solve_time, iterations))
+else:
+    print("No plan found")
+
+# Comment to not generate gif
+if paths is not None:
+    movement_animation(graph, paths, "./resources/lns.gif", seed=SEED)
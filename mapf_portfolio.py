@@ -0,0 +1,34 @@
+from utils.animation import movement_animation
+from solvers.portfolio import run_portfolio, DEFAULT_PORTFOLIO
+from utils.environments import *
+
+"""
+This file allows to race on a specific graph the SMT-based and the CP-based solutions, each one in its own process,
+taking the first optimal plan. Feel free to change graph, agents sizes and the configurations of the portfolio.
+"""
+
+SIZE = 4
+# Maximum makespan
+UPPER_BOUND = SIZE * 4
+SEED = 42
+number_of_agents = 5
+
+agents, edges, graph = environments(nx.grid_2d_graph, number_of_agents, SEED, n=SIZE, m=SIZE)
+
+sep = "=" * 50
+print(sep)
+check, name, makespan, paths, timings = run_portfolio(edges, agents, UPPER_BOUND, DEFAULT_PORTFOLIO)
+
+print(sep)
+if check:
+    print("Optimal makespan %d found by %s" % (makespan, name))
+else:
+    print("Unsatisfiable")
+
+print("Workers:")
+for name, (outcome, seconds) in timings.items():
+    print("%s\t%s\t%.3f s" % (name, outcome, seconds))
+
+# Comment to not generate gif
+if paths is not None:
+    movement_animation(graph, paths, "./resources/portfolio.gif", seed=SEED)
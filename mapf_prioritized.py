@@ -0,0 +1,32 @@
+from utils.animation import movement_animation
+from solvers.prioritized import run_prioritized
+from utils.environments import *
+
+"""
+This file allows to call to a specific graph the prioritized planner, a fast but incomplete alternative to the exact
+solutions for instances with many agents. Feel free to change graph, agents sizes etc..
+"""
+
+number_of_agents = 40
+UPPER_BOUND = 200
+SEED = 42
+# Order in which the agents are planned: "index", "longest", "shortest" or "random"
+ORDERING = "longest"
+# Random orderings tried when the first one fails
+RESTARTS = 10
+
+# e.g: an execution using the warehouse environment
+agents, edges, graph = environments(generate_warehouse, number_of_agents, SEED, rows=30, columns=20, shelf_length=3,
+                                    corridor_width=1, verbose=False)
+
+check, solve_time, _, _, expanded, paths, makespan = \
+    run_prioritized(edges, agents, UPPER_BOUND, ORDERING, RESTARTS, SEED)
+
+if check:
+    print("Makespan %d found in %.3f s expanding %d states" % (makespan, solve_time, expanded))
+else:
+    print("No plan found")
+
+# Comment to not generate gif
+if paths is not None:
+    movement_animation(graph, paths, "./resources/prioritized.gif", seed=SEED)
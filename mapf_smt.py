@@ -1,5 +1,5 @@
 from utils.animation import movement_animation
-from solvers.model_smt import run_Z3
+from solvers.model_smt import run_Z3_incremental
 from utils.environments import *
 
 """
@@ -12,6 +12,12 @@ SIZE = 3
 UPPER_BOUND = SIZE * 2
 SEED = 42
 number_of_agents = 4
+# "boolean" for the propositional encoding, "functions" for the one with uninterpreted functions
+ENCODING = "boolean"
+# Order in which makespans are checked: "linear", "exponential" or "binary"
+STRATEGY = "linear"
+# Start from the plan of the prioritized planner: its makespan bounds the search and its moves guide the solver
+WARM_START = True
 
 # e.g. the grid environment
 agents, edges, graph = environments(nx.grid_2d_graph, number_of_agents, SEED, n=SIZE, m=SIZE)
@@ -19,14 +25,11 @@ agents, edges, graph = environments(nx.grid_2d_graph, number_of_agents, SEED, n=
 # The maximum shortest path is used as the initial makespan
 _, makespan = min_max_shortest_path(graph, agents)
 
-# The loop used to find the solution with the minimal makespan
-check, _, memory_usage, number_of_conflicts, decisions, paths = run_Z3(edges, agents, makespan)
+# The search of the solution with the minimal makespan, reusing the same solver between makespans
+check, _, memory_usage, number_of_conflicts, decisions, paths, makespan = \
+    run_Z3_incremental(edges, agents, makespan, UPPER_BOUND, ENCODING, strategy=STRATEGY, warm_start=WARM_START)
 
-while not check and makespan <= UPPER_BOUND:
-    makespan += 1
-    check, _, memory_usage, number_of_conflicts, decisions, paths = run_Z3(edges, agents, makespan)
-
-if not check and makespan >= UPPER_BOUND:
+if not check:
     print("Unsatisfiable")
 
 # Comment to not generate gif
@@ -0,0 +1,29 @@
+from solvers.cbs import run_CBS
+from solvers.model_smt import run_Z3_incremental
+from solvers.prioritized import run_prioritized
+
+"""
+Run this file to check that the solvers reject an instance whose agents share an origin: the plan would place two agents
+on the same vertex at time 0, hence no valid plan exists.
+"""
+
+UPPER_BOUND = 6
+
+# A path 0 - 1 - 2 where both agents start on the vertex 0
+edges = [{0, 1}, {0, 1, 2}, {1, 2}]
+agents = [(0, 2), (0, 1)]
+
+check, _, _, _, _, paths, _ = run_prioritized(edges, agents, UPPER_BOUND)
+assert not check and paths is None, "The prioritized planner returned a plan for agents sharing an origin"
+
+# Without a time limit CBS must terminate, since both children of the root conflict are infeasible
+check, _, _, _, _, paths, _ = run_CBS(edges, agents, UPPER_BOUND)
+assert not check and paths is None, "CBS returned a plan for agents sharing an origin"
+
+# Without the presolve the warm start must not return an invalid heuristic plan
+for strategy in ("linear", "binary"):
+    check, _, _, _, _, paths, _ = run_Z3_incremental(edges, agents, 2, UPPER_BOUND, encoding="boolean",
+                                                     strategy=strategy, warm_start=True, presolve=False)
+    assert not check and paths is None, "The warm start of the SMT model returned a plan for agents sharing an origin"
+
+print("The instance with a shared origin is rejected")
@@ -0,0 +1,103 @@
+from z3 import *
+
+"""
+This file contains the encodings of the cardinality constraints used by the SMT-based model: at most one literal of a
+list can be true, and exactly one when a condition holds.
+
+- arithmetic: linear integer arithmetic over If(literal, 1, 0), as in the original formulation of run_Z3
+- pb: the native pseudo-boolean constraints of Z3 (AtMost, PbEq)
+- pairwise: a binary clause for each pair of literals, no auxiliary variables
+- sequential: sequential counter, O(n) clauses and n - 1 auxiliary variables
+- commander: commander encoding on groups of three literals, applied recursively to the commanders
+"""
+
+CARDINALITY_ENCODINGS = ("arithmetic", "pb", "pairwise", "sequential", "commander")
+
+# Size of the groups in the commander encoding and below which it falls back to the pairwise one
+COMMANDER_GROUP_SIZE = 3
+COMMANDER_THRESHOLD = 6
+
+
+def at_most_one(literals, encoding="pb"):
+    """
+    Encode that at most one literal is true.
+
+    :param literals: list of Z3 Bool expressions
+    :param encoding: the name of the encoding, one of CARDINALITY_ENCODINGS
+    :return: a list of constraints
+    """
+
+    if encoding not in CARDINALITY_ENCODINGS:
+        raise ArgumentError("The cardinality encoding must be one of %s" % ", ".join(CARDINALITY_ENCODINGS))
+
+    if len(literals) <= 1:
+        return []
+    if encoding == "arithmetic":
+        return [Sum([If(literal, 1, 0) for literal in literals]) <= 1]
+    if encoding == "pb":
+        return [AtMost(*literals, 1)]
+    if encoding == "pairwise":
+        return _pairwise(literals)
+    if encoding == "sequential":
+        return _sequential_counter(literals)
+
+    return _commander(literals)
+
+
+def implies_exactly_one(condition, literals, encoding="pb"):
+    """
+    Encode that exactly one literal is true when the condition holds. With the clausal encodings the at most one part
+    is asserted unconditionally: this is correct as long as all the literals can be false when the condition does not
+    hold.
+
+    :param condition: a Z3 Bool expression
+    :param literals: list of Z3 Bool expressions
+    :param encoding: the name of the encoding, one of CARDINALITY_ENCODINGS
+    :return: a list of constraints
+    """
+
+    if encoding == "arithmetic":
+        return [Implies(condition, Sum([If(literal, 1, 0) for literal in literals]) == 1)]
+    if encoding == "pb":
+        return [Implies(condition, PbEq([(literal, 1) for literal in literals], 1))]
+
+    return [Implies(condition, Or(literals))] + at_most_one(literals, encoding)
+
+
+def _pairwise(literals):
+    return [Or(Not(literals[i]), Not(literals[j]))
+            for i in range(len(literals))
+            for j in range(i + 1, len(literals))]
+
+
+def _sequential_counter(literals):
+    # counters[i] is true when one of the first i + 1 literals is true
+    counters = [FreshBool("seq") for _ in range(len(literals) - 1)]
+
+    constraints = [Or(Not(literals[0]), counters[0])]
+    for i in range(1, len(literals) - 1):
+        constraints.append(Or(Not(literals[i]), counters[i]))
+        constraints.append(Or(Not(counters[i - 1]), counters[i]))
+        constraints.append(Or(Not(literals[i]), Not(counters[i - 1])))
+    constraints.append(Or(Not(literals[-1]), Not(counters[-1])))
+
+    return constraints
+
+
+def _commander(literals):
+    if len(literals) <= COMMANDER_THRESHOLD:
+        return _pairwise(literals)
+
+    constraints = []
+    commanders = []
+    for index in range(0, len(literals), COMMANDER_GROUP_SIZE):
+        group = literals[index:index + COMMANDER_GROUP_SIZE]
+        commander = FreshBool("cmd")
+        commanders.append(commander)
+
+        # At most one literal of the group, and the commander is true exactly when one of them is
+        constraints += _pairwise(group)
+        constraints += [Or(Not(literal), commander) for literal in group]
+        constraints.append(Or(Not(commander), Or(group)))
+
+    return constraints + _commander(commanders)
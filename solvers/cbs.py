@@ -0,0 +1,427 @@
+import heapq
+import itertools
+import time
+
+from utils.distances import UNREACHABLE, DistanceIndex
+from utils.graph import CSRGraph
+from utils.plans import paths_to_plan, print_plan
+
+"""
+This file contains Conflict-Based Search (CBS). The high level searches a tree of constraints: each node assigns a path
+to every agent, if two paths conflict the node is split in two children forbidding the conflict to one of the two
+agents. The low level plans a single agent under its constraints with A* in the space-time graph. CBS minimizes the
+sum of costs, i.e. the sum of the arrival times of the agents, instead of the makespan of the SMT and CP models.
+
+The speedups implemented are:
+- prioritizing conflicts: cardinal conflicts, those that increase the cost of both children, are split first, then
+  semi-cardinal ones. The conflicts are classified using the multi-valued decision diagrams (MDD) of the agents.
+- bypassing: a child whose new path has the same cost and fewer conflicts replaces the path of its parent instead of
+  being added to the tree.
+- ECBS: with a suboptimality factor w > 1 both levels use a focal search, expanding among the nodes whose cost is at
+  most w times the lower bound those with fewer conflicts. The plan found costs at most w times the optimal one.
+
+See mapf_cbs.py for a generic example.
+"""
+
+
+class FocalQueue:
+    """
+    Open list of a focal search: the items are ordered by a lower bound f, and among those whose cost is at most w
+    times the minimum f by a secondary key. When w is 1 the queue is a plain priority queue ordered by (f, secondary
+    key).
+    """
+
+    def __init__(self, w=1.0):
+        self.w = w
+        self.items = dict()
+        self.open = []
+        self.focal = []
+        self.counter = itertools.count()
+
+    def __len__(self):
+        return len(self.items)
+
+    def push(self, f, secondary, item, cost=None):
+        """
+        :param f: the lower bound of the item
+        :param secondary: the key of the focal list
+        :param item: the item
+        :param cost: the cost compared with the minimum f, by default f
+        """
+
+        identifier = next(self.counter)
+        self.items[identifier] = item
+        heapq.heappush(self.open, (f, secondary, identifier))
+        if self.w > 1:
+            heapq.heappush(self.focal, (secondary, f if cost is None else cost, identifier))
+
+    def min_f(self):
+        """
+        :return: the minimum f of the items in the queue
+        """
+
+        # The entries of the items already popped from the focal list are discarded lazily
+        while self.open[0][2] not in self.items:
+            heapq.heappop(self.open)
+
+        return self.open[0][0]
+
+    def pop(self):
+        """
+        :return: the minimum f of the queue before the pop and the next item
+        """
+
+        bound = self.min_f()
+        if self.w == 1:
+            identifier = heapq.heappop(self.open)[2]
+            return bound, self.items.pop(identifier)
+
+        skipped = []
+        while True:
+            entry = heapq.heappop(self.focal)
+            if entry[2] not in self.items:
+                continue
+            if entry[1] <= self.w * bound:
+                break
+            skipped.append(entry)
+
+        for skipped_entry in skipped:
+            heapq.heappush(self.focal, skipped_entry)
+
+        return bound, self.items.pop(entry[2])
+
+
+class Constraints:
+    """
+    The vertices and arcs forbidden to an agent at given time steps.
+    """
+
+    def __init__(self, parent=None):
+        self.vertices = set() if parent is None else set(parent.vertices)
+        self.arcs = set() if parent is None else set(parent.arcs)
+
+    def add(self, conflict, first):
+        """
+        Forbid to one of the two agents of a conflict its position in the conflict.
+
+        :param conflict: a tuple (agent, agent, vertex, neighbor, time), see find_conflicts
+        :param first: True to constrain the first agent of the conflict, False the second one
+        """
+
+        _, _, vertex, neighbor, time = conflict
+        if neighbor is None:
+            self.vertices.add((vertex, time))
+        elif first:
+            self.arcs.add((vertex, neighbor, time))
+        else:
+            self.arcs.add((neighbor, vertex, time))
+
+    def goal_time(self, destination):
+        """
+        :return: the earliest time step from which an agent can stay on its destination
+        """
+
+        return max((time + 1 for vertex, time in self.vertices if vertex == destination), default=0)
+
+
+class ConflictTable:
+    """
+    The positions of the other agents, used by the low level to count the conflicts of a path.
+    """
+
+    def __init__(self, paths, agent):
+        self.vertices = dict()
+        self.arcs = set()
+        self.parked = dict()
+
+        for other, path in enumerate(paths):
+            if other == agent or path is None:
+                continue
+            for step, vertex in enumerate(path):
+                self.vertices[(vertex, step)] = self.vertices.get((vertex, step), 0) + 1
+                if step > 0 and path[step - 1] != vertex:
+                    self.arcs.add((path[step - 1], vertex, step - 1))
+            self.parked[path[-1]] = min(self.parked.get(path[-1], len(path)), len(path))
+
+    def count(self, vertex, neighbor, time):
+        """
+        :return: the number of conflicts of a move from vertex at time to neighbor at time + 1
+        """
+
+        conflicts = self.vertices.get((neighbor, time + 1), 0)
+        if self.parked.get(neighbor, time + 2) <= time + 1:
+            conflicts += 1
+        if vertex != neighbor and (neighbor, vertex, time) in self.arcs:
+            conflicts += 1
+
+        return conflicts
+
+
+def low_level(edges, origin, destination, distances, constraints, horizon, conflict_table, w=1.0):
+    """
+    Plan an agent under its constraints with a focal search in the space-time graph. The heuristic is the distance to
+    the destination, the secondary key the number of conflicts with the other agents.
+
+    :param edges: list containing for each vertex its neighbors, e.g. the lists of CSRGraph.to_lists
+    :param origin: the origin of the agent
+    :param destination: the destination of the agent
+    :param distances: the distance of each vertex to the destination, a list is read faster than an array
+    :param constraints: the Constraints of the agent
+    :param horizon: the maximum makespan
+    :param conflict_table: the ConflictTable of the other agents
+    :param w: the suboptimality factor
+    :return: the path, None when it does not exist, a lower bound of the cost of the agent and the number of states
+    expanded
+    """
+
+    # A conflict between agents sharing an origin forbids the origin at time 0
+    if (origin, 0) in constraints.vertices:
+        return None, None, 0
+
+    goal_time = constraints.goal_time(destination)
+    queue = FocalQueue(w)
+    queue.push(max(int(distances[origin]), goal_time), (0, 0), (origin, 0))
+    parents = {(origin, 0): None}
+    conflicts = {(origin, 0): 0}
+    closed = set()
+    expanded = 0
+
+    while queue:
+        lower_bound, state = queue.pop()
+        if state in closed:
+            continue
+        closed.add(state)
+        expanded += 1
+        vertex, time = state
+
+        if vertex == destination and time >= goal_time:
+            path = []
+            while state is not None:
+                path.append(state[0])
+                state = parents[state]
+            return path[::-1], lower_bound, expanded
+
+        for neighbor in edges[vertex]:
+            child = (neighbor, time + 1)
+            if child in closed or distances[neighbor] == UNREACHABLE or time + 1 + distances[neighbor] > horizon:
+                continue
+            if child in constraints.vertices or (vertex, neighbor, time) in constraints.arcs:
+                continue
+
+            child_conflicts = conflicts[state] + conflict_table.count(vertex, neighbor, time)
+            if child in conflicts and conflicts[child] <= child_conflicts:
+                continue
+
+            parents[child] = state
+            conflicts[child] = child_conflicts
+            # Ties are broken in favour of fewer conflicts, then of later time steps
+            queue.push(max(time + 1 + int(distances[neighbor]), goal_time), (child_conflicts, -(time + 1)), child)
+
+    return None, None, expanded
+
+
+def build_mdd(edges, origin, destination, constraints, cost):
+    """
+    Build the multi-valued decision diagram of an agent: the vertices occupied at each time step by the paths of a
+    given cost that satisfy the constraints.
+
+    :return: list containing for each time step up to cost the set of vertices
+    """
+
+    layers = [{origin}]
+    for step in range(cost):
+        layers.append(set(neighbor for vertex in layers[-1] for neighbor in edges[vertex]
+                          if (neighbor, step + 1) not in constraints.vertices and
+                          (vertex, neighbor, step) not in constraints.arcs))
+
+    # Keep the vertices from which the destination is reached at time cost
+    layers[cost] = {destination} & layers[cost]
+    for step in range(cost - 1, -1, -1):
+        layers[step] = set(vertex for vertex in layers[step]
+                           if any(neighbor in layers[step + 1] and (vertex, neighbor, step) not in constraints.arcs
+                                  for neighbor in edges[vertex]))
+
+    return layers
+
+
+def find_conflicts(paths):
+    """
+    Find the vertex and swap conflicts between the paths. The agents wait on their destinations after the end of their
+    paths.
+
+    :param paths: list of lists containing the path of each agent
+    :return: list of tuples (agent, agent, vertex, neighbor, time). A vertex conflict at time has neighbor None, in a
+    swap conflict the first agent moves from vertex to neighbor between time and time + 1
+    """
+
+    conflicts = []
+    length = max(len(path) for path in paths)
+
+    def position(path, step):
+        return path[min(step, len(path) - 1)]
+
+    for step in range(length):
+        occupants = dict()
+        for agent, path in enumerate(paths):
+            vertex = position(path, step)
+            if vertex in occupants:
+                conflicts.append((occupants[vertex], agent, vertex, None, step))
+            else:
+                occupants[vertex] = agent
+
+        if step + 1 < length:
+            moves = dict()
+            for agent, path in enumerate(paths):
+                vertex, neighbor = position(path, step), position(path, step + 1)
+                if vertex != neighbor:
+                    if (neighbor, vertex) in moves:
+                        conflicts.append((agent, moves[(neighbor, vertex)], vertex, neighbor, step))
+                    moves[(vertex, neighbor)] = agent
+
+    return conflicts
+
+
+class CBSNode:
+    """
+    A node of the constraint tree.
+    """
+
+    def __init__(self, constraints, paths, lower_bounds, mdds):
+        self.constraints = constraints
+        self.paths = paths
+        self.lower_bounds = lower_bounds
+        self.mdds = mdds
+        self.update()
+
+    def update(self):
+        self.cost = sum(len(path) - 1 for path in self.paths)
+        self.lower_bound = sum(self.lower_bounds)
+        self.conflicts = find_conflicts(self.paths)
+
+
+def run_CBS(edges, agents, upper_bound, w=1.0, bypass=True, prioritize_conflicts=True, time_limit=None):
+    """
+    Search a plan minimizing the sum of costs with CBS, or with ECBS when w > 1.
+
+    :param edges: list of sets containing for each vertex (whose identifier is the index of this list) its neighbors
+    :param agents: list of tuples containing origins and destinations
+    :param upper_bound: the maximum makespan
+    :param w: the suboptimality factor, 1 for optimal plans
+    :param bypass: True to adopt the paths of the children that avoid a conflict without increasing the cost
+    :param prioritize_conflicts: True to split the cardinal conflicts first. Used only when w is 1.
+    :param time_limit: the seconds after which the search is stopped, None for no limit
+    :return True when a plan has been found, total time spent, memory usage, number of conflicts split and decisions,
+    paths is a plan, i.e. an int32 array of shape (agents, makespan + 1), and the makespan of the plan. Memory usage is
+    None, decisions is the number of states expanded by the low level.
+    """
+
+    if w < 1:
+        raise ValueError("The suboptimality factor must be greater or equal than 1")
+
+    start_time = time.time()
+    distance_index = DistanceIndex(edges)
+    # The low level reads the neighbors and the distances from lists
+    adjacency = CSRGraph.from_edges(edges).to_lists()
+    distances = [distance_index.to_goal(destination).tolist() for _, destination in agents]
+    expanded = 0
+    splits = 0
+
+    def replan(agent, constraints, paths):
+        nonlocal expanded
+        origin, destination = agents[agent]
+        path, lower_bound, agent_expanded = low_level(adjacency, origin, destination, distances[agent], constraints,
+                                                      upper_bound, ConflictTable(paths, agent), w)
+        expanded += agent_expanded
+        return path, lower_bound
+
+    def mdd(node, agent):
+        if agent not in node.mdds:
+            origin, destination = agents[agent]
+            node.mdds[agent] = build_mdd(edges, origin, destination, node.constraints[agent],
+                                         len(node.paths[agent]) - 1)
+        return node.mdds[agent]
+
+    def width_one(node, agent, vertex, neighbor, time):
+        # After its arrival an agent can only wait on its destination
+        layers = mdd(node, agent)
+        steps = [(vertex, time)] if neighbor is None else [(vertex, time), (neighbor, time + 1)]
+        return all(layers[min(step, len(layers) - 1)] == {position} for position, step in steps)
+
+    def choose_conflict(node):
+        if not prioritize_conflicts or w > 1:
+            return node.conflicts[0]
+
+        best, best_rank = None, -1
+        for conflict in node.conflicts:
+            first, second, vertex, neighbor, time = conflict
+            rank = width_one(node, first, vertex, neighbor, time) + \
+                width_one(node, second, neighbor if neighbor is not None else vertex,
+                          vertex if neighbor is not None else None, time)
+            if rank > best_rank:
+                best, best_rank = conflict, rank
+                if rank == 2:
+                    break
+
+        return best
+
+    # Root: each agent follows its own best path
+    paths = [None] * len(agents)
+    lower_bounds = [0] * len(agents)
+    for agent, (origin, destination) in enumerate(agents):
+        paths[agent], lower_bounds[agent] = replan(agent, Constraints(), paths)
+        if paths[agent] is None:
+            print("CBS: the destination of agent %d can not be reached" % agent)
+            return False, None, None, None, None, None, None
+
+    root = CBSNode([Constraints() for _ in agents], paths, lower_bounds, dict())
+    tree = FocalQueue(w)
+    tree.push(root.lower_bound if w > 1 else root.cost, (len(root.conflicts), root.cost), root, root.cost)
+
+    while tree:
+        if time_limit is not None and time.time() - start_time > time_limit:
+            print("CBS: time limit reached")
+            break
+
+        _, node = tree.pop()
+
+        if not node.conflicts:
+            plan = paths_to_plan(node.paths)
+            print("CBS: sum of costs %d, %d conflicts split" % (node.cost, splits))
+            print_plan(plan)
+            return True, time.time() - start_time, None, splits, expanded, plan, plan.shape[1] - 1
+
+        conflict = choose_conflict(node)
+        splits += 1
+        children = []
+
+        for first, agent in ((True, conflict[0]), (False, conflict[1])):
+            constraints = list(node.constraints)
+            constraints[agent] = Constraints(node.constraints[agent])
+            constraints[agent].add(conflict, first)
+
+            path, lower_bound = replan(agent, constraints[agent], node.paths)
+            if path is None:
+                continue
+
+            paths = list(node.paths)
+            paths[agent] = path
+            lower_bounds = list(node.lower_bounds)
+            lower_bounds[agent] = lower_bound
+            mdds = dict((other, layers) for other, layers in node.mdds.items() if other != agent)
+            child = CBSNode(constraints, paths, lower_bounds, mdds)
+
+            # Bypass: the new path also satisfies the constraints of the parent
+            if bypass and w == 1 and child.cost == node.cost and len(child.conflicts) < len(node.conflicts):
+                node.paths = paths
+                node.lower_bounds = lower_bounds
+                node.mdds.pop(agent, None)
+                node.update()
+                children = [node]
+                break
+
+            children.append(child)
+
+        for child in children:
+            tree.push(child.lower_bound if w > 1 else child.cost, (len(child.conflicts), child.cost), child, child.cost)
+
+    return False, None, None, None, None, None, None
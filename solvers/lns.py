@@ -0,0 +1,318 @@
+import contextlib
+import os
+import random
+import time
+
+import numpy as np
+
+from solvers.model_smt import run_Z3_optimize
+from solvers.prioritized import run_prioritized
+from utils.distances import DistanceIndex
+from utils.plans import arrival_times, empty_plan, last_visits, plan_makespan, print_plan, sum_of_costs
+
+"""
+This file contains an anytime large neighborhood search (LNS) for instances with many agents. Starting from a plan,
+e.g. found by the prioritized planner, it repeatedly selects a neighborhood of a few agents and re-optimizes their
+paths with one of the exact models, while the paths of the other agents are fixed and act as time-indexed obstacles:
+the SMT-based model minimizes the sum of costs of the neighborhood, the CP-based one its makespan.
+The exact models only have to handle the agents of the neighborhood, so they become the inner engine of a search that
+scales to fleets far larger than the ones they can solve alone.
+
+The neighborhoods are:
+- conflicting: the agent most delayed with respect to its shortest path and the agents occupying that path at the
+  time steps it would visit them, then the agents occupying the shortest paths of the latter and so on
+- random: agents chosen uniformly
+- local: the agents passing closest to a random intersection of the map
+
+The neighborhood of each iteration is chosen by roulette wheel, with weights adapted to the improvements obtained by
+each kind of neighborhood.
+
+See mapf_lns.py for a generic example.
+"""
+
+NEIGHBORHOODS = ("conflicting", "random", "local")
+
+# Exact models used to re-optimize a neighborhood
+ENGINES = ("z3", "cp")
+
+# Weight of the last improvement in the adaptive weights of the neighborhoods
+REACTION_FACTOR = 0.1
+
+
+class NeighborhoodSelector:
+    """
+    Select the agents of the neighborhoods of a plan. The agents already used as seed of a conflicting neighborhood
+    without improving the plan are not used again until the plan changes.
+    """
+
+    def __init__(self, edges, agents, distance_index, rng):
+        """
+        :param edges: list of sets containing for each vertex its neighbors
+        :param agents: list of tuples containing origins and destinations
+        :param distance_index: the DistanceIndex of the graph
+        :param rng: the random.Random generator of the search
+        """
+
+        self.edges = edges
+        self.agents = agents
+        self.distance_index = distance_index
+        self.rng = rng
+        self.shortest_paths = np.array([distance_index.distance(origin, destination) for origin, destination in agents],
+                                       dtype=np.int32)
+        # The vertices with at least three neighbors, the centers of the local neighborhoods
+        self.intersections = [vertex for vertex, neighbors in enumerate(edges)
+                              if len(neighbors.difference({vertex})) >= 3] or list(range(len(edges)))
+        self.tabu = set()
+        self.visitors = None
+
+    def update(self):
+        """
+        Forget the information computed on the previous plan.
+        """
+
+        self.tabu.clear()
+        self.visitors = None
+
+    def select(self, kind, plan, size):
+        """
+        Select a neighborhood.
+
+        :param kind: one of NEIGHBORHOODS
+        :param plan: the current plan
+        :param size: the number of agents of the neighborhood
+        :return: the sorted list of agents of the neighborhood
+        """
+
+        if kind == "conflicting":
+            neighborhood = self.conflicting(plan, size)
+        elif kind == "local":
+            neighborhood = self.local(plan, size)
+        else:
+            neighborhood = []
+
+        # Complete the neighborhood with random agents
+        if len(neighborhood) < size:
+            others = sorted(set(range(len(self.agents))).difference(neighborhood))
+            neighborhood += self.rng.sample(others, size - len(neighborhood))
+
+        return sorted(neighborhood)
+
+    def conflicting(self, plan, size):
+        arrivals = arrival_times(plan, self.agents)
+        delays = arrivals - self.shortest_paths
+        candidates = [agent for agent in range(len(self.agents)) if agent not in self.tabu]
+        if not candidates:
+            self.tabu.clear()
+            candidates = list(range(len(self.agents)))
+
+        seed = max(candidates, key=lambda agent: (delays[agent], arrivals[agent], self.rng.random()))
+        self.tabu.add(seed)
+
+        # Breadth-first visit of the agents blocking the shortest paths
+        neighborhood = [seed]
+        last = plan.shape[1] - 1
+        position = 0
+        while position < len(neighborhood) and len(neighborhood) < size:
+            origin, destination = self.agents[neighborhood[position]]
+            position += 1
+            for step, vertex in enumerate(self.distance_index.path(origin, destination)):
+                for agent in np.flatnonzero(plan[:, min(step, last)] == vertex).tolist():
+                    if agent not in neighborhood and len(neighborhood) < size:
+                        neighborhood.append(agent)
+
+        return neighborhood
+
+    def local(self, plan, size):
+        if self.visitors is None:
+            self.visitors = dict()
+            for agent, path in enumerate(plan.tolist()):
+                for vertex in set(path):
+                    self.visitors.setdefault(vertex, []).append(agent)
+
+        # Breadth-first visit of the map from the center
+        center = self.rng.choice(self.intersections)
+        neighborhood = []
+        visited = {center}
+        frontier = [center]
+        while frontier and len(neighborhood) < size:
+            for vertex in frontier:
+                for agent in self.visitors.get(vertex, []):
+                    if agent not in neighborhood and len(neighborhood) < size:
+                        neighborhood.append(agent)
+            frontier = [neighbor for vertex in frontier for neighbor in self.edges[vertex] if neighbor not in visited]
+            visited.update(frontier)
+            frontier = list(dict.fromkeys(frontier))
+
+        return neighborhood
+
+
+def layers_of(plan):
+    """
+    Compute the number of layers of the CP model required by the paths of a plan.
+
+    :param plan: the plan
+    :return: the number of layers
+    """
+    from solvers.model_cp import plan_layers
+
+    num_layers = 1
+    for path in plan.tolist():
+        while plan_layers(path, num_layers) is None:
+            num_layers += 1
+
+    return num_layers
+
+
+def merge_plans(plan, neighborhood, paths):
+    """
+    Replace the paths of the agents of a neighborhood, the shorter paths are extended by waiting on their last vertex.
+
+    :param plan: the plan of all the agents
+    :param neighborhood: the sorted list of agents replaced
+    :param paths: the plan of the agents of the neighborhood
+    :return: the new plan
+    """
+
+    length = max(plan.shape[1], paths.shape[1])
+    merged = empty_plan(plan.shape[0], length - 1)
+    merged[:, :plan.shape[1]] = plan
+    merged[:, plan.shape[1]:] = plan[:, -1:]
+    merged[neighborhood, :paths.shape[1]] = paths
+    merged[neighborhood, paths.shape[1]:] = paths[:, -1:]
+
+    return merged
+
+
+def repair(edges, agents, plan, neighborhood, distance_index, engine="z3", time_limit=None, **options):
+    """
+    Re-optimize the paths of the agents of a neighborhood, the paths of the other agents being obstacles. The SMT
+    engine minimizes the sum of costs of the neighborhood with run_Z3_optimize within its current makespan, the CP one
+    minimizes its makespan with run_CPLEX. Both start from the current paths.
+
+    :param edges: list of sets containing for each vertex its neighbors
+    :param agents: list of tuples containing origins and destinations
+    :param plan: the current plan
+    :param neighborhood: the sorted list of agents re-optimized
+    :param distance_index: the DistanceIndex of the graph
+    :param engine: the exact model, one of ENGINES
+    :param time_limit: the maximum number of seconds of the SMT engine, None for no limit
+    :param options: keyword arguments of run_Z3_optimize or run_CPLEX
+    :return: the new plan, None when the paths of the neighborhood can not be improved
+    """
+
+    others = sorted(set(range(len(agents))).difference(neighborhood))
+    neighborhood_agents = [agents[agent] for agent in neighborhood]
+    obstacles = plan[others] if others else None
+    current = plan[neighborhood]
+    current_arrivals = arrival_times(current, neighborhood_agents)
+    current_makespan = int(current_arrivals.max(initial=0))
+
+    # The agents can't arrive before their shortest paths, nor park before the last visit of the obstacles
+    arrivals = np.array([distance_index.distance(origin, destination) for origin, destination in neighborhood_agents])
+    if obstacles is not None:
+        visits = last_visits(obstacles, len(edges))
+        arrivals = np.maximum(arrivals, [int(visits[destination]) + 1 for _, destination in neighborhood_agents])
+    if arrivals.max() >= current_makespan and (engine == "cp" or arrivals.sum() >= current_arrivals.sum()):
+        return None
+
+    # The output of the models is suppressed, they are called at each iteration
+    current = current[:, :current_makespan + 1]
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        if engine == "z3":
+            _, _, _, _, _, paths, _ = run_Z3_optimize(edges, neighborhood_agents, current_makespan,
+                                                      time_limit=time_limit, obstacles=obstacles, hints=current,
+                                                      **options)
+        else:
+            from solvers.model_cp import run_CPLEX
+
+            _, _, _, _, _, _, paths = run_CPLEX(edges, neighborhood_agents, current_makespan, layers_of(current),
+                                                starting_paths=current, obstacles=obstacles, **options)
+
+    if paths is None:
+        return None
+
+    return merge_plans(plan, neighborhood, paths)
+
+
+def run_LNS(edges, agents, upper_bound, plan=None, engine="z3", neighborhood_size=4, neighborhoods=NEIGHBORHOODS,
+            iterations=None, time_limit=60, repair_time_limit=10, seed=None, **options):
+    """
+    Improve a plan with a large neighborhood search. A new plan is kept when it lowers the makespan or, with the same
+    makespan, the sum of costs.
+
+    :param edges: list of sets containing for each vertex (whose identifier is the index of this list) its neighbors
+    :param agents: list of tuples containing origins and destinations
+    :param upper_bound: the maximum makespan
+    :param plan: the initial plan, a valid plan i.e. an int32 array of shape (agents, makespan + 1). When None it is
+    found by run_prioritized.
+    :param engine: the exact model that re-optimizes the neighborhoods, one of ENGINES
+    :param neighborhood_size: the number of agents of each neighborhood, up to about 16 agents the exact models are
+    fast enough, on large maps with long paths smaller neighborhoods are re-optimized more often
+    :param neighborhoods: the kinds of neighborhoods selected, a subset of NEIGHBORHOODS
+    :param iterations: the maximum number of neighborhoods re-optimized, None for no limit
+    :param time_limit: the seconds after which the search is stopped, None for no limit
+    :param repair_time_limit: the maximum number of seconds of each re-optimization with the SMT engine, None for no
+    limit
+    :param seed: the seed of the random choices
+    :param options: keyword arguments of run_Z3_optimize or run_CPLEX, e.g. makespan_weight or parameters
+    :return True when a plan has been found, total time spent, memory usage, number of conflicts and decisions, paths
+    is a plan, i.e. an int32 array of shape (agents, makespan + 1), and the makespan of the plan. Memory usage and
+    conflicts are None, decisions is the number of neighborhoods re-optimized.
+    """
+
+    if engine not in ENGINES:
+        raise ValueError("The engine must be one of %s" % ", ".join(ENGINES))
+    if not neighborhoods or any(kind not in NEIGHBORHOODS for kind in neighborhoods):
+        raise ValueError("The neighborhoods must be a non empty subset of %s" % ", ".join(NEIGHBORHOODS))
+    if neighborhood_size < 1:
+        raise ValueError("The neighborhood must contain at least one agent")
+    if iterations is None and time_limit is None:
+        raise ValueError("Either the iterations or the time limit must be given")
+
+    start_time = time.time()
+    rng = random.Random(seed)
+
+    if plan is None:
+        check, _, _, _, _, plan, _ = run_prioritized(edges, agents, upper_bound, restarts=10, seed=seed)
+        if not check:
+            return False, None, None, None, None, None, None
+    plan = plan[:, :plan_makespan(plan, agents) + 1]
+
+    distance_index = DistanceIndex(edges)
+    selector = NeighborhoodSelector(edges, agents, distance_index, rng)
+    size = min(neighborhood_size, len(agents))
+    weights = dict((kind, 1.0) for kind in neighborhoods)
+    makespan, cost = plan_makespan(plan, agents), sum_of_costs(plan, agents)
+    # Once both the makespan and the sum of costs reach their lower bounds the plan can't be improved
+    lower_bounds = (int(selector.shortest_paths.max()), int(selector.shortest_paths.sum()))
+    print("LNS: initial makespan %d, sum of costs %d" % (makespan, cost))
+
+    iteration = 0
+    while (iterations is None or iteration < iterations) and (makespan, cost) != lower_bounds:
+        if time_limit is not None and time.time() - start_time > time_limit:
+            break
+
+        iteration += 1
+        kind = rng.choices(list(weights), [weight + 1e-6 for weight in weights.values()])[0]
+        neighborhood = selector.select(kind, plan, size)
+        repair_time = repair_time_limit
+        if time_limit is not None:
+            remaining_time = time_limit - (time.time() - start_time)
+            repair_time = remaining_time if repair_time is None else min(repair_time, remaining_time)
+        new_plan = repair(edges, agents, plan, neighborhood, distance_index, engine, repair_time, **options)
+
+        gain = 0
+        if new_plan is not None:
+            new_plan = new_plan[:, :plan_makespan(new_plan, agents) + 1]
+            new_makespan, new_cost = plan_makespan(new_plan, agents), sum_of_costs(new_plan, agents)
+            if (new_makespan, new_cost) < (makespan, cost):
+                gain = makespan - new_makespan + cost - new_cost
+                plan, makespan, cost = new_plan, new_makespan, new_cost
+                selector.update()
+                print("LNS: iteration %d, %s neighborhood, makespan %d, sum of costs %d" %
+                      (iteration, kind, makespan, cost))
+
+        weights[kind] = REACTION_FACTOR * gain + (1 - REACTION_FACTOR) * weights[kind]
+
+    print_plan(plan)
+    return True, time.time() - start_time, None, None, iteration, plan, makespan
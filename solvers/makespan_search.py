@@ -0,0 +1,79 @@
+import time
+
+"""
+This file contains the strategies used to search the minimal makespan with a solver that answers whether a plan of a
+given makespan exists, e.g. run_Z3 or IncrementalZ3Model.solve. Satisfiability is monotone in the makespan, since the
+agents can wait on their destinations, hence any makespan can be probed in any order.
+
+- linear: lower_bound, lower_bound + 1, ... as in the first version of the test files
+- exponential: probe lower_bound + 0, 1, 3, 7, ... until a plan is found, then binary search in the last gap
+- binary: check upper_bound, then bisect [lower_bound, upper_bound] keeping the greatest refuted makespan
+"""
+
+STRATEGIES = ("linear", "exponential", "binary")
+
+
+def search_makespan(check, lower_bound, upper_bound, strategy="linear"):
+    """
+    Search the minimal makespan in [lower_bound, upper_bound].
+
+    :param check: a function that given a makespan returns a tuple whose first element is True when a plan exists
+    :param lower_bound: the minimum makespan, e.g. the maximum shortest path
+    :param upper_bound: the maximum makespan
+    :param strategy: the name of the strategy, one of STRATEGIES
+    :return True when a plan has been found, the minimal makespan, the result returned by check for it and a
+    dictionary with the strategy, the number of calls and the time spent
+    """
+
+    if strategy not in STRATEGIES:
+        raise ValueError("The strategy must be one of %s" % ", ".join(STRATEGIES))
+
+    start_time = time.time()
+    results = dict()
+    calls = 0
+
+    def probe(makespan):
+        nonlocal calls
+        calls += 1
+        results[makespan] = check(makespan)
+        return results[makespan][0]
+
+    # The greatest makespan without plan and the smallest one with a plan found so far
+    refuted = lower_bound - 1
+    found = None
+
+    if strategy == "linear":
+        for makespan in range(lower_bound, upper_bound + 1):
+            if probe(makespan):
+                found = makespan
+                break
+            refuted = makespan
+
+    elif strategy == "exponential":
+        gap = 1
+        while refuted < upper_bound:
+            makespan = min(lower_bound + gap - 1, upper_bound)
+            if probe(makespan):
+                found = makespan
+                break
+            refuted = makespan
+            gap *= 2
+
+    elif upper_bound >= lower_bound and probe(upper_bound):
+        found = upper_bound
+
+    # Bisect between the greatest refuted makespan and the smallest satisfiable one
+    while found is not None and found - refuted > 1:
+        makespan = (refuted + found) // 2
+        if probe(makespan):
+            found = makespan
+        else:
+            refuted = makespan
+
+    statistics = {"strategy": strategy, "calls": calls, "time": time.time() - start_time}
+    print("Makespan search %s: %d calls in %.3f s" % (strategy, statistics["calls"], statistics["time"]))
+
+    if found is None:
+        return False, None, None, statistics
+
+    return True, found, results[found], statistics
@@ -1,6 +1,16 @@
+import builtins
+import pickle
 import re
 
+import numpy as np
 from docplex.cp.model import *
+from docplex.version import docplex_version_string
+
+from solvers.presolve import Presolve
+from solvers.prioritized import prioritized_plan
+from utils.distances import UNREACHABLE, DistanceIndex, weighted_distances
+from utils.graph import CSRGraph
+from utils.plans import PARKED, empty_plan, last_visits, print_plan, validate_plan
 
 """
 This file contains the CP-based model of the MAPF problem. Must be executed inside the algorithm proposed by the authors
@@ -10,214 +20,610 @@ See mapf_cp.py for a generic example.
 """
 
 
-def run_CPLEX(edges, agents, upper_bound, num_layers):
+def solver_parameters(workers=None, time_limit=None, fail_limit=None, search_type=None, random_seed=None):
+    """
+    Collect the parameters of CP Optimizer used by run_CPLEX and solving_MAPF, those left to None keep the default
+    value. The parallel search of CP Optimizer is deterministic only for a fixed number of workers: with the same
+    parameters, workers and random seed included, a model is solved in the same way, while changing the number of
+    workers may change the search and the solution found.
+
+    :param workers: the number of threads, by default the number of cores
+    :param time_limit: the seconds after which each solve is stopped
+    :param fail_limit: the number of failures after which each solve is stopped
+    :param search_type: "DepthFirst", "Restart", "MultiPoint" or "IterativeDiving"
+    :param random_seed: the seed of the randomized choices of the search
+    :return: a dictionary of keyword arguments of CpoModel.solve
     """
-    Create a MAPF Solver using CPLEX.
 
-    :param edges: list of OrderedDict containing for each agent (whose identifier is the index of this list) its
-    neighbors
+    parameters = {"Workers": workers, "TimeLimit": time_limit, "FailLimit": fail_limit, "SearchType": search_type,
+                  "RandomSeed": random_seed}
+
+    return dict((name, value) for name, value in parameters.items() if value is not None)
+
+
+def timed_shortest_path(edges, origin, destination, weights=None):
+    """
+    Compute a shortest path following the decreasing distances to the destination, the smallest vertex is chosen on
+    ties. With weights the path follows the length of the arcs, as the windows computed by window_of_vertices.
+
+    :param edges: list of sets containing for each vertex its neighbors
+    :param origin: the origin vertex
+    :param destination: the destination vertex
+    :param weights: dictionary containing the length of the arcs longer than 1, None when all the arcs have length 1
+    :return: list of tuples (time, vertex) containing the vertices of the path and their arrival times, empty when the
+    destination is not reachable
+    """
+
+    weights = weights or dict()
+    if weights:
+        distances = weighted_distances(edges, destination, weights, reverse=True)
+    else:
+        distances = DistanceIndex(edges).to_goal(destination)
+    if distances[origin] == UNREACHABLE:
+        return []
+
+    path = [(0, int(origin))]
+    while path[-1][1] != destination:
+        time, vertex = path[-1]
+        path.append(min((time + weights.get((vertex, neighbor), 1), int(neighbor)) for neighbor in edges[vertex]
+                        if neighbor != vertex and
+                        distances[neighbor] == distances[vertex] - weights.get((vertex, neighbor), 1)))
+
+    return path
+
+
+def window_of_vertices(edges, agents, upper_bound, weights=None):
+    """
+    Compute for each vertex and agent the time steps in which the agent can occupy the vertex in a plan whose makespan
+    does not exceed the upper bound: not before the distance of the vertex from its origin and not after the upper bound
+    minus the distance of the vertex to its destination. The window does not depend on the layer, since an agent can
+    move to the next layer at any time through an arc (x,x).
+
+    :param edges: list of sets containing for each vertex its neighbors
     :param agents: list of tuples containing origins and destinations
-    :param upper_bound: the maximum value that interval variables can assume, it represents the maximum makespan
-    possible
-    :param num_layers: the number of layers, useful for an agent to visit multiple times a vertex
-    :return True when a plan has been found, time to build the model, memory usage, number of conflicts and decisions.
-    paths is a list of lists containing paths of each agent.
+    :param upper_bound: the maximum makespan
+    :param weights: dictionary containing the length of the arcs longer than 1, None when all the arcs have length 1
+    :return: list containing for each vertex a list with the window (earliest, latest) of each agent, None when the
+    agent can not visit the vertex
+    """
+
+    distance_index = DistanceIndex(edges)
+    windows = [[None] * len(agents) for _ in range(len(edges))]
+
+    for agent, (origin, destination) in enumerate(agents):
+        if weights:
+            from_origin = weighted_distances(edges, origin, weights)
+            to_destination = weighted_distances(edges, destination, weights, reverse=True)
+        else:
+            from_origin = distance_index.from_source(origin)
+            to_destination = distance_index.to_goal(destination)
+        reachable = (from_origin != UNREACHABLE) & (to_destination != UNREACHABLE) & \
+                    (from_origin + to_destination <= upper_bound)
+
+        for vertex in np.flatnonzero(reachable):
+            windows[vertex][agent] = (int(from_origin[vertex]), upper_bound - int(to_destination[vertex]))
+
+    return windows
+
+
+def obstacle_intervals(obstacles, upper_bound):
+    """
+    Convert the plan of the agents whose paths are fixed into the fixed intervals added to the no_overlap constraints
+    (17) and (18): the time steps spent on each vertex and the arcs traversed. Each agent waits on its last vertex until
+    the upper bound.
+
+    :param obstacles: a plan, i.e. an int32 array of shape (other agents, makespan + 1)
+    :param upper_bound: the maximum makespan
+    :return: a dictionary containing for each vertex the list of its intervals (start, end), where end is the last time
+    step on the vertex, and a dictionary containing for each edge (x,y) with x < y the time steps in which it is
+    traversed
+    """
+
+    vertices = dict()
+    arcs = dict()
+    last = obstacles.shape[1] - 1
+
+    for path in obstacles.tolist():
+        start = 0
+        for time in range(1, last + 1):
+            if path[time] != path[time - 1]:
+                if start <= upper_bound:
+                    vertices.setdefault(path[time - 1], []).append((start, min(time - 1, upper_bound)))
+                if time - 1 < upper_bound:
+                    arcs.setdefault((min(path[time - 1], path[time]), max(path[time - 1], path[time])), []).append(
+                        time - 1)
+                start = time
+        if start <= upper_bound:
+            vertices.setdefault(path[last], []).append((start, upper_bound))
+
+    return vertices, arcs
+
+
+class IntervalIndex:
+    """
+    Flat storage of the interval variables of the CP model, preallocated for every vertex (or arc), agent and layer and
+    addressed by position instead of by name. The entries of the intervals pruned from the model are None.
+    """
+
+    def __init__(self, edges, agents_len, num_layers):
+        """
+        :param edges: list of sets containing for each vertex its neighbors, or a CSRGraph
+        :param agents_len: the number of agents
+        :param num_layers: the number of layers
+        """
+
+        self.agents_len = agents_len
+        self.num_layers = num_layers
+
+        # Identifier of each arc (x,y) with x != y, its position in the arrays of the CSR graph
+        graph = edges if isinstance(edges, CSRGraph) else CSRGraph.from_edges(edges)
+        sources, targets = graph.arcs()
+        self.arcs = dict(zip(zip(sources.tolist(), targets.tolist()), range(len(targets))))
+
+        size = len(graph) * agents_len * num_layers
+        self.N = [None] * size
+        self.Nin = [None] * size
+        self.Nout = [None] * size
+        # The arcs (x,x) of the last layer are never created
+        self.A_equal = [None] * size
+        self.A = [None] * (len(self.arcs) * agents_len * num_layers)
+
+    def cell(self, vertex, agent, layer):
+        """
+        :return: the position of the N, Nin, Nout and A_equal intervals of a vertex, agent and layer
+        """
+
+        return (vertex * self.agents_len + agent) * self.num_layers + layer
+
+    def arc(self, vertex, neighbor, agent, layer):
+        """
+        :return: the position of the A interval of an arc (vertex, neighbor), agent and layer
+        """
+
+        return (self.arcs[(vertex, neighbor)] * self.agents_len + agent) * self.num_layers + layer
+
+    def variables(self):
+        """
+        :return: a generator of the interval variables created
+        """
+
+        for intervals in (self.N, self.Nin, self.Nout, self.A_equal, self.A):
+            for var in intervals:
+                if var is not None:
+                    yield var
+
+    def cells(self):
+        """
+        :return: a generator of tuples (vertex, agent, N interval) over the N intervals created
+        """
+
+        for position, var in enumerate(self.N):
+            if var is not None:
+                yield position // (self.agents_len * self.num_layers), position // self.num_layers % self.agents_len, var
+
+
+def plan_layers(path, num_layers):
+    """
+    Split the path of an agent into the N intervals of the layered model. A new layer is entered, through the arc (x,x)
+    of the vertex left, every time the agent moves to a vertex already visited in the current layer. The remaining
+    layers are filled by waiting on the destination at the end of the plan. The time steps spent traversing an arc
+    longer than 1, marked with -1, are skipped.
+
+    :param path: the vertices occupied by the agent at each time step, the last one is its destination
+    :param num_layers: the number of layers
+    :return: list of tuples (vertex, layer, start, end) in temporal order, None when the path requires more layers
+    """
+
+    intervals = []
+    visited = set()
+    layer = 0
+
+    for time, vertex in enumerate(path):
+        if vertex < 0:
+            continue
+
+        if intervals and intervals[-1][0] == vertex and intervals[-1][3] == time - 1:
+            intervals[-1][3] = time
+            continue
+
+        if vertex in visited:
+            # Move to the next layer on the vertex left, when the agent leaves it
+            layer += 1
+            previous, _, _, left = intervals[-1]
+            intervals.append([previous, layer, left, left])
+            visited = {previous}
+
+        intervals.append([vertex, layer, time, time])
+        visited.add(vertex)
+
+    while layer < num_layers - 1:
+        layer += 1
+        intervals.append([path[-1], layer, len(path) - 1, len(path) - 1])
+
+    if layer >= num_layers:
+        return None
+
+    return [tuple(interval) for interval in intervals]
+
+
+def starting_point(paths, makespan, index):
+    """
+    Convert a plan into a complete starting point of the CP model, used to warm start the search.
+
+    :param paths: the plan, its makespan must not exceed the upper bound of the model
+    :param makespan: the makespan variable
+    :param index: the IntervalIndex of the model
+    :return: a CpoModelSolution, None when the plan requires more layers
+    """
+
+    present = dict()
+
+    for agent, path in enumerate(paths):
+        intervals = plan_layers([int(vertex) for vertex in path], index.num_layers)
+        if intervals is None:
+            return None
+
+        for position, (vertex, layer, start, end) in enumerate(intervals):
+            present[id(index.N[index.cell(vertex, agent, layer)])] = (start, end)
+
+            if position + 1 < len(intervals):
+                next_vertex, next_layer, next_start, _ = intervals[position + 1]
+                if next_vertex == vertex:
+                    arc = index.A_equal[index.cell(vertex, agent, layer)]
+                else:
+                    arc = index.A[index.arc(vertex, next_vertex, agent, next_layer)]
+                present[id(arc)] = (end, next_start)
+                present[id(index.Nout[index.cell(vertex, agent, layer)])] = (end, next_start)
+                present[id(index.Nin[index.cell(next_vertex, agent, next_layer)])] = (end, next_start)
+
+    solution = CpoModelSolution()
+    solution.add_integer_var_solution(makespan, len(paths[0]) - 1)
+
+    for var in index.variables():
+        if id(var) in present:
+            start, end = present[id(var)]
+            solution.add_interval_var_solution(var, presence=True, start=start, end=end, size=end - start)
+        else:
+            solution.add_interval_var_solution(var, presence=False)
+
+    return solution
+
+
+def build_model(edges, agents, upper_bound, num_layers, windows, min_makespan, obstacles=None, named=False,
+                weights=None):
+    """
+    Create the CP model of run_CPLEX.
+
+    :param edges: list of sets containing for each vertex its neighbors
+    :param agents: list of tuples containing origins and destinations
+    :param upper_bound: the maximum makespan
+    :param num_layers: the number of layers
+    :param windows: the windows of the vertices computed by window_of_vertices
+    :param min_makespan: the lower bound of the makespan
+    :param obstacles: the plan of other agents whose paths are fixed
+    :param named: True to name the variables after their vertex, agent and layer
+    :param weights: dictionary containing the length of the arcs longer than 1
+    :return: the CpoModel, its IntervalIndex and the makespan variable
     """
 
     model = CpoModel()
     agents_len = len(agents)
     edges_len = len(edges)
-    makespan = integer_var(0, upper_bound, name="MKSP")
-
-    N = [[[interval_var(start=(0, upper_bound), end=(0, upper_bound),
-                        name="N_%s_%s_%s" % (vertex, agent, layer), optional=True)
-           for layer in range(num_layers)]
-          for agent in range(agents_len)]
-         for vertex in range(edges_len)]
-
-    Nin = [[[interval_var(start=(0, upper_bound), end=(0, upper_bound),
-                          name="Nin_%s_%s_%s" % (vertex, agent, layer), optional=True)
-             for layer in range(num_layers)]
-            for agent in range(agents_len)]
-           for vertex in range(edges_len)]
-
-    Nout = [[[interval_var(start=(0, upper_bound), end=(0, upper_bound),
-                           name="Nout_%s_%s_%s" % (vertex, agent, layer), optional=True)
-              for layer in range(num_layers)]
-             for agent in range(agents_len)]
-            for vertex in range(edges_len)]
-
-    A = [dict((neighbor, [[interval_var(start=(0, upper_bound), end=(0, upper_bound), length=1,
-                                        name="A_%s_%s_%s_%s" % (vertex, neighbor, agent, layer), optional=True)
-                           for layer in range(num_layers)]
-                          for agent in range(agents_len)])
-              for neighbor in edges[vertex] if vertex != neighbor)
-         for vertex in range(edges_len)]
-
-    A_equal = [[[interval_var(start=(0, upper_bound), end=(0, upper_bound), length=0,
-                              name="Ae_%s_%s_%s_%s" % (vertex, vertex, agent, layer), optional=True)
-                 for layer in range(num_layers - 1)]
-                for agent in range(agents_len)]
-               for vertex in range(edges_len)]
+    weights = weights or dict()
+
+    # The longest arcs entering and leaving each vertex bound the Nin and Nout intervals
+    longest_in = [1] * edges_len
+    longest_out = [1] * edges_len
+    for (vertex, neighbor), length in weights.items():
+        longest_out[vertex] = max(longest_out[vertex], length)
+        longest_in[neighbor] = max(longest_in[neighbor], length)
+
+    # The pairs (vertex, agent) whose intervals are created in every layer
+    candidates = [(vertex, agent) for vertex in range(edges_len) for agent in range(agents_len)
+                  if windows[vertex][agent] is not None]
+
+    makespan = integer_var(min_makespan, upper_bound, name="MKSP")
+
+    # The variables are addressed by position, the names are only generated when debugging. The loops over the
+    # neighbors read the lists of the CSR graph, self-loops excluded.
+    graph = CSRGraph.from_edges(edges)
+    neighbors = graph.to_lists(self_loops=False)
+    index = IntervalIndex(graph, agents_len, num_layers)
+    N, Nin, Nout, A, A_equal = index.N, index.Nin, index.Nout, index.A, index.A_equal
+    cell, arc = index.cell, index.arc
+
+    for vertex, agent in candidates:
+        earliest, latest = windows[vertex][agent]
+
+        for layer in range(num_layers):
+            position = cell(vertex, agent, layer)
+
+            N[position] = interval_var(start=(earliest, latest), end=(earliest, latest), optional=True,
+                                       name="N_%s_%s_%s" % (vertex, agent, layer) if named else None)
+
+            Nin[position] = interval_var(start=(max(earliest - longest_in[vertex], 0), latest), end=(earliest, latest),
+                                         optional=True,
+                                         name="Nin_%s_%s_%s" % (vertex, agent, layer) if named else None)
+
+            Nout[position] = interval_var(start=(earliest, latest),
+                                          end=(earliest, min(latest + longest_out[vertex], upper_bound)),
+                                          optional=True,
+                                          name="Nout_%s_%s_%s" % (vertex, agent, layer) if named else None)
+
+            if layer < num_layers - 1:
+                A_equal[position] = interval_var(start=(earliest, latest), end=(earliest, latest), length=0,
+                                                 optional=True,
+                                                 name="Ae_%s_%s_%s_%s" % (vertex, vertex, agent, layer)
+                                                 if named else None)
+
+    # An arc is traversed after leaving the window of its first vertex and before the end of the one of the second.
+    # The traversal lasts the length of the arc.
+    for vertex, neighbor in index.arcs:
+        length = weights.get((vertex, neighbor), 1)
+        for agent in range(agents_len):
+            if windows[vertex][agent] is None or windows[neighbor][agent] is None:
+                continue
+
+            earliest = max(windows[vertex][agent][0], windows[neighbor][agent][0] - length)
+            latest = min(windows[vertex][agent][1], windows[neighbor][agent][1] - length)
+            if earliest <= latest:
+                for layer in range(num_layers):
+                    A[arc(vertex, neighbor, agent, layer)] = \
+                        interval_var(start=(earliest, latest), end=(earliest + length, latest + length), length=length,
+                                     optional=True,
+                                     name="A_%s_%s_%s_%s" % (vertex, neighbor, agent, layer) if named else None)
+
+    # The pairs (arc, agent) whose intervals are created in every layer
+    traversals = [(vertex, neighbor, agent) for vertex, neighbor in index.arcs for agent in range(agents_len)
+                  if A[arc(vertex, neighbor, agent, 0)] is not None]
+
+    def incoming(vertex, agent, layer):
+        arcs = (A[arc(neighbor, vertex, agent, layer)] for neighbor in neighbors[vertex])
+        return [var for var in arcs if var is not None]
+
+    def outgoing(vertex, agent, layer):
+        arcs = (A[arc(vertex, neighbor, agent, layer)] for neighbor in neighbors[vertex])
+        return [var for var in arcs if var is not None]
 
     # ======================================================================================================================
     # Constraints
     # ======================================================================================================================
 
     # (1) All agents must occupy their starting position at the first layer
-    [model.add(presence_of(N[pair[0]][a][0]) == 1) for a, pair in enumerate(agents)]
+    [model.add(presence_of(N[cell(pair[0], a, 0)]) == 1) for a, pair in enumerate(agents)]
 
     # (2) All agents must occupy their ending position at the last layer
-    [model.add(presence_of(N[pair[1]][a][num_layers - 1]) == 1) for a, pair in enumerate(agents)]
+    [model.add(presence_of(N[cell(pair[1], a, num_layers - 1)]) == 1) for a, pair in enumerate(agents)]
 
     # (3) All agents don't traverse edges to reach their first position at the first layer
-    [model.add(presence_of(Nin[pair[0]][a][0]) == 0) for a, pair in enumerate(agents)]
+    [model.add(presence_of(Nin[cell(pair[0], a, 0)]) == 0) for a, pair in enumerate(agents)]
 
     # (4) All agents don't traverse edges from their last position at the last layer
-    [model.add(presence_of(Nout[pair[1]][a][num_layers - 1]) == 0) for a, pair in enumerate(agents)]
+    [model.add(presence_of(Nout[cell(pair[1], a, num_layers - 1)]) == 0) for a, pair in enumerate(agents)]
 
     # (5) For all agents and vertex (excluding origins) each N requires a Nin (and vice versa) for each layer (excluding
     # the first)
     [model.add(logical_and(
-        if_then(presence_of(N[vertex][agent][layer]), presence_of(Nin[vertex][agent][layer])),
-        if_then(presence_of(Nin[vertex][agent][layer]), presence_of(N[vertex][agent][layer]))))
-     if pair[0] != vertex or layer != 0
-     else True
+        if_then(presence_of(N[cell(vertex, agent, layer)]), presence_of(Nin[cell(vertex, agent, layer)])),
+        if_then(presence_of(Nin[cell(vertex, agent, layer)]), presence_of(N[cell(vertex, agent, layer)]))))
+     for vertex, agent in candidates
      for layer in range(num_layers)
-     for agent, pair in enumerate(agents)
-     for vertex in range(edges_len)]
+     if agents[agent][0] != vertex or layer != 0]
 
     # (6) For all agents and vertices (excluding destinations) each N requires a Nout (and vice versa) for each layer
     # (excluding the last)
     [model.add(logical_and(
-        if_then(presence_of(N[vertex][agent][layer]), presence_of(Nout[vertex][agent][layer])),
-        if_then(presence_of(Nout[vertex][agent][layer]), presence_of(N[vertex][agent][layer]))))
-     if pair[1] != vertex or layer != num_layers - 1
-     else True
+        if_then(presence_of(N[cell(vertex, agent, layer)]), presence_of(Nout[cell(vertex, agent, layer)])),
+        if_then(presence_of(Nout[cell(vertex, agent, layer)]), presence_of(N[cell(vertex, agent, layer)]))))
+     for vertex, agent in candidates
      for layer in range(num_layers)
-     for agent, pair in enumerate(agents)
-     for vertex in range(edges_len)]
+     if agents[agent][1] != vertex or layer != num_layers - 1]
 
     # (7) For each vertex, agent and layer Nin to that vertex requires AT MOST a traverse from one neighbor
-    [model.add(
-        alternative(Nin[vertex][agent][layer],
-                    [A_equal[vertex][agent][layer - 1]] +
-                    [A[neighbor][vertex][agent][layer] for neighbor in edges[vertex].difference({vertex})]
-                    if layer > 0 else
-                    [A[neighbor][vertex][agent][layer] for neighbor in edges[vertex].difference({vertex})]
-                    ))
-        for layer in range(num_layers)
-        for agent in range(agents_len)
-        for vertex in range(edges_len)]
+    for vertex, agent in candidates:
+        for layer in range(num_layers):
+            arcs = ([A_equal[cell(vertex, agent, layer - 1)]] if layer > 0 else []) + incoming(vertex, agent, layer)
+            model.add(alternative(Nin[cell(vertex, agent, layer)], arcs) if arcs else
+                      presence_of(Nin[cell(vertex, agent, layer)]) == 0)
 
     # (8) For each vertex, agent and layer Nout from that vertex requires AT MOST a traverse to one neighbor
-    [model.add(
-        alternative(Nout[vertex][agent][layer],
-                    [A_equal[vertex][agent][layer]] +
-                    [A[vertex][neighbor][agent][layer] for neighbor in edges[vertex].difference({vertex})]
-                    if layer < num_layers - 1 else
-                    [A[vertex][neighbor][agent][layer] for neighbor in edges[vertex].difference({vertex})]
-                    ))
-        for layer in range(num_layers)
-        for agent in range(agents_len)
-        for vertex in range(edges_len)]
+    for vertex, agent in candidates:
+        for layer in range(num_layers):
+            arcs = ([A_equal[cell(vertex, agent, layer)]] if layer < num_layers - 1 else []) + \
+                   outgoing(vertex, agent, layer)
+            model.add(alternative(Nout[cell(vertex, agent, layer)], arcs) if arcs else
+                      presence_of(Nout[cell(vertex, agent, layer)]) == 0)
 
     # (9) For each arc (x,y), agent and layer a traverse implies a Nin in y
-    [model.add(if_then(presence_of(A[vertex][neighbor][agent][layer]), presence_of(Nin[neighbor][agent][layer])))
-     for vertex in range(edges_len)
-     for neighbor in edges[vertex].difference({vertex})
-     for agent in range(agents_len)
+    [model.add(if_then(presence_of(A[arc(vertex, neighbor, agent, layer)]),
+                       presence_of(Nin[cell(neighbor, agent, layer)])))
+     for vertex, neighbor, agent in traversals
      for layer in range(num_layers)]
 
     # (10) For each arc (x,y), agent and layer a traverse implies a Nout in x
-    [model.add(if_then(presence_of(A[vertex][neighbor][agent][layer]), presence_of(Nout[vertex][agent][layer])))
-     for vertex in range(edges_len)
-     for neighbor in edges[vertex].difference({vertex})
-     for agent in range(agents_len)
+    [model.add(if_then(presence_of(A[arc(vertex, neighbor, agent, layer)]),
+                       presence_of(Nout[cell(vertex, agent, layer)])))
+     for vertex, neighbor, agent in traversals
      for layer in range(num_layers)]
 
     # (11) For each arc (x,x), agent and layer (excluding the last) a traverse implies a Nin in x in the successive
     # layer
-    [model.add(if_then(presence_of(A_equal[vertex][agent][layer]), presence_of(Nin[vertex][agent][layer + 1])))
-     for vertex in range(edges_len)
-     for agent in range(agents_len)
+    [model.add(if_then(presence_of(A_equal[cell(vertex, agent, layer)]),
+                       presence_of(Nin[cell(vertex, agent, layer + 1)])))
+     for vertex, agent in candidates
      for layer in range(num_layers - 1)]
 
     # (12) For each arc (x,x), agent and layer (excluding the last) a traverse implies a Nout in x
-    [model.add(if_then(presence_of(A_equal[vertex][agent][layer]), presence_of(Nout[vertex][agent][layer])))
-     for vertex in range(edges_len)
-     for agent in range(agents_len)
+    [model.add(if_then(presence_of(A_equal[cell(vertex, agent, layer)]), presence_of(Nout[cell(vertex, agent, layer)])))
+     for vertex, agent in candidates
      for layer in range(num_layers - 1)]
 
     # (13) Each agent start their activity in their origin at time 0
-    [model.add(start_of(N[pair[0]][a][0]) == 0) for a, pair in enumerate(agents)]
+    [model.add(start_of(N[cell(pair[0], a, 0)]) == 0) for a, pair in enumerate(agents)]
 
     # (14) Each agent finish their activity in their destination at time makespan
-    [model.add(end_of(N[pair[1]][a][num_layers - 1]) == makespan) for a, pair in enumerate(agents)]
+    [model.add(end_of(N[cell(pair[1], a, num_layers - 1)]) == makespan) for a, pair in enumerate(agents)]
 
     # (15) For each vertex, agent and layer the beginning of a N activity coincides with the end of a Nin one, excluding
     # the case when the vertex it's the agent origin and the layer is the first (already considered in (13))
-    [model.add(start_of(N[vertex][agent][layer]) == end_of(Nin[vertex][agent][layer]))
-     if pair[0] != vertex or layer != 0
-     else True
+    [model.add(start_of(N[cell(vertex, agent, layer)]) == end_of(Nin[cell(vertex, agent, layer)]))
+     for vertex, agent in candidates
      for layer in range(num_layers)
-     for agent, pair in enumerate(agents)
-     for vertex in range(edges_len)]
+     if agents[agent][0] != vertex or layer != 0]
 
     # (16) For each vertex, agent and layer the beginning of a N activity coincides with the start of a Nout one,
     # excluding the case when the vertex it's the agent destination and the layer is the last (already considered
     # in (14))
-    [model.add(end_of(N[vertex][agent][layer]) == start_of(Nout[vertex][agent][layer]))
-     if pair[1] != vertex or layer != num_layers - 1
-     else True
+    [model.add(end_of(N[cell(vertex, agent, layer)]) == start_of(Nout[cell(vertex, agent, layer)]))
+     for vertex, agent in candidates
      for layer in range(num_layers)
-     for agent, pair in enumerate(agents)
-     for vertex in range(edges_len)]
+     if agents[agent][1] != vertex or layer != num_layers - 1]
 
     # (17) Prevent agents to occur at the same node at the same time
 
-    # TDM
-    tm_size = num_layers * agents_len
-    tm = transition_matrix(tm_size)
+    # TDM, the obstacles have their own type agents_len
+    types_len = agents_len + 1 if obstacles is not None else agents_len
+    tm = transition_matrix(types_len)
 
     """
-    Each vertex has the same TDM and its own no_overlap.
-    In the TDM, for each agent in different layers the distance between two N can be at least 0 (default value), whereas
-    for different agents must be at least 1.
+    Each vertex has its own no_overlap over the N intervals created for it, whose type is their agent. In the TDM, for
+    the same agent in different layers the distance between two N can be at least 0 (default value), whereas for
+    different agents must be at least 1.
     
-    Example of TDM with 2 agents and 4 layers:
-    00001111
-    00001111
-    00001111
-    00001111
-    11110000
-    11110000
-    11110000
-    11110000
+    Example of TDM with 4 agents:
+    0111
+    1011
+    1101
+    1110
     """
 
-    for i in range(tm_size):
-        for j in range(tm_size):
-            if j not in range((i // num_layers) * num_layers, (i // num_layers) * num_layers + num_layers):
+    for i in range(types_len):
+        for j in range(types_len):
+            if i != j:
                 tm.set_value(i, j, 1)
 
-    [model.add(no_overlap(sequence_var([N[vertex][agent][layer]
-                                        for agent in range(agents_len)
-                                        for layer in range(num_layers)]), tm))
-     for vertex in range(edges_len)]
-
-    # (18) Prevent agents from using an arc at the same time (no-swap constraint)
-    [model.add(no_overlap([elem for sublist in
-                           [[A[vertex][neighbor][agent][layer], A[neighbor][vertex][agent][layer]]
-                            for agent in range(agents_len)
-                            for layer in range(num_layers)] for elem in sublist]))
-     for vertex in range(edges_len)
-     for neighbor in edges[vertex].difference({vertex})]
+    obstacle_vertices, obstacle_arcs = obstacle_intervals(obstacles, upper_bound) if obstacles is not None else \
+        (dict(), dict())
+
+    for vertex in range(edges_len):
+        intervals = [(N[cell(vertex, agent, layer)], agent)
+                     for agent in range(agents_len) if windows[vertex][agent] is not None
+                     for layer in range(num_layers)]
+        if intervals:
+            # The obstacles are fixed intervals of their own type
+            intervals += [(interval_var(start=start, end=end, size=end - start), agents_len)
+                          for start, end in obstacle_vertices.get(vertex, [])]
+        if len(intervals) > 1:
+            model.add(no_overlap(sequence_var([interval for interval, _ in intervals],
+                                              types=[agent for _, agent in intervals]), tm))
+
+    # (18) Prevent agents from using an arc at the same time (no-swap constraint). An arc longer than 1, i.e. a
+    # contracted corridor, has capacity 1: a single agent traverses it at a time, in either direction
+    for vertex, neighbor in index.arcs:
+        if neighbor < vertex:
+            continue
+        arcs = [A[arc(x, y, agent, layer)]
+                for x, y in ((vertex, neighbor), (neighbor, vertex))
+                for agent in range(agents_len) if A[arc(x, y, agent, 0)] is not None
+                for layer in range(num_layers)]
+        if arcs:
+            arcs += [interval_var(start=time, end=time + 1, length=1)
+                     for time in obstacle_arcs.get((vertex, neighbor), [])]
+        if len(arcs) > 1:
+            model.add(no_overlap(arcs))
 
     # (19) Minimize makespan
     model.add(model.minimize(makespan))
 
-    result = model.solve(log_output=None)
+    return model, index, makespan
+
+
+def run_CPLEX(edges, agents, upper_bound, num_layers, starting_paths=None, parameters=None, search_phases=False,
+              debug=False, obstacles=None, cache=None, weights=None):
+    """
+    Create a MAPF Solver using CPLEX.
+
+    :param edges: list of OrderedDict containing for each agent (whose identifier is the index of this list) its
+    neighbors
+    :param agents: list of tuples containing origins and destinations
+    :param upper_bound: the maximum value that interval variables can assume, it represents the maximum makespan
+    possible
+    :param num_layers: the number of layers, useful for an agent to visit multiple times a vertex
+    :param starting_paths: a plan used as starting point of the search, e.g. found with a different number of layers,
+    ignored when its makespan exceeds upper_bound or it requires more layers
+    :param parameters: the parameters of CP Optimizer, see solver_parameters
+    :param search_phases: True to branch first on the presence of the N intervals along the shortest path of each agent
+    :param debug: True to name the variables after their vertex, agent and layer and print the intervals of the solution
+    :param obstacles: the plan of other agents whose paths are fixed, i.e. time-indexed obstacles: the agents can not
+    occupy their vertices nor swap with them, and can park on a vertex only after its last visit
+    :param cache: a ModelCache where the model is stored, pickled, and loaded instead of being built again. None to
+    always build it.
+    :param weights: dictionary containing the length of the arcs longer than 1, e.g. the corridors contracted by
+    CorridorContraction. The decoded plan contains -1 while an agent traverses one of them.
+    :return True when an optimal plan has been found, the makespan, time to build the model, memory usage, number of
+    conflicts and decisions. paths is a plan, i.e. an int32 array of shape (agents, makespan + 1), also returned when
+    the plan found is not proven optimal.
+    """
+
+    agents_len = len(agents)
+    edges_len = len(edges)
+
+    if weights and obstacles is not None:
+        raise ValueError("The obstacles are not supported on a graph with weighted arcs")
+
+    # Time window of each vertex for each agent: a vertex can be occupied from its distance from the origin until the
+    # upper bound minus its distance to the destination, None when it cannot be visited within the upper bound. The
+    # intervals of the vertices and arcs outside the windows are never created.
+    windows = window_of_vertices(edges, agents, upper_bound, weights)
+    if any(windows[pair[0]][a] is None for a, pair in enumerate(agents)):
+        print("Some destinations can not be reached within the upper bound %d" % upper_bound)
+        return False, -1, 0, None, None, None, None
+
+    min_makespan = max(windows[pair[1]][a][0] for a, pair in enumerate(agents))
+    if obstacles is not None:
+        # The agents wait on their destinations after the makespan, the obstacles can't visit them afterwards
+        visits = last_visits(obstacles, edges_len)
+        if any(visits[pair[1]] == PARKED for pair in agents):
+            print("Some destinations are occupied forever by the obstacles")
+            return False, -1, 0, None, None, None, None
+        min_makespan = max([min_makespan] + [int(visits[pair[1]]) + 1 for pair in agents])
+        if min_makespan > upper_bound:
+            print("Some destinations are visited by the obstacles after the upper bound %d" % upper_bound)
+            return False, -1, 0, None, None, None, None
+
+    model = None
+    if cache is not None:
+        # The pickle holds the model together with its index, so that the variables of both are the same objects
+        key = cache.key("pickle", edges, agents, upper_bound=upper_bound, num_layers=num_layers, obstacles=obstacles,
+                        named=debug, docplex=docplex_version_string,
+                        weights=sorted(weights.items()) if weights else None)
+        data = cache.load(key)
+        if data is not None:
+            model, index, makespan = pickle.loads(data)
+
+    if model is None:
+        model, index, makespan = build_model(edges, agents, upper_bound, num_layers, windows, min_makespan, obstacles,
+                                             debug, weights)
+        if cache is not None:
+            cache.store(key, pickle.dumps((model, index, makespan), pickle.HIGHEST_PROTOCOL))
+
+    if starting_paths is not None and len(starting_paths[0]) - 1 <= upper_bound:
+        warm_start = starting_point(starting_paths, makespan, index)
+        if warm_start is not None:
+            model.set_starting_point(warm_start)
+
+    if search_phases:
+        # The shortest paths are explored first, interleaving the agents by arrival time so that their conflicts are
+        # met as early as possible. The cells pruned by the windows have no interval and are skipped.
+        steps = sorted((time, agent, vertex)
+                       for agent, pair in enumerate(agents)
+                       for time, vertex in timed_shortest_path(edges, pair[0], pair[1], weights))
+        phase = [index.N[index.cell(vertex, agent, 0)] for _, agent, vertex in steps]
+        phase = [var for var in phase if var is not None]
+        if phase:
+            model.set_search_phases([search_phase(phase)])
+
+    result = model.solve(log_output=None, **(parameters or dict()))
     solution = result.solution
     solve_time = result.solveTime
 
@@ -228,68 +634,73 @@ def run_CPLEX(edges, agents, upper_bound, num_layers):
         # Solve model
         print("Solution with makespan %d:" % solution["MKSP"])
 
-        # Print the model variables
-        """        
-        n_result = dict()
-        a_result = dict()
-        ae_result = dict()
-        
-        for name, var in solution.var_solutions_dict.items():
-            if type(name) == str and type(var) == CpoIntervalVarSolution and var.is_present():
-                # Use regex to extract from the name the type of the variable and the agent involved
-                tokens = re.split("_", name)
-                identifier = tokens[0]
-
-                if identifier == "N":
-                    n_result.setdefault(int(tokens[2]), []).append(var)
-                elif identifier == "A":
-                    a_result.setdefault(int(tokens[3]), []).append(var)
-                elif identifier == "Ae":
-                    ae_result.setdefault(int(tokens[3]), []).append(var)
+        if debug:
+            # Print the model variables
+            n_result = dict()
+            a_result = dict()
+            ae_result = dict()
 
-        for agent in range(agents_len):
-            print("Agent %d" % agent)
-            
-            if agent in n_result:
-                print_sorted_list_of_intervals(n_result[agent])
+            for name, var in solution.var_solutions_dict.items():
+                if type(name) == str and type(var) == CpoIntervalVarSolution and var.is_present():
+                    # Use regex to extract from the name the type of the variable and the agent involved
+                    tokens = re.split("_", name)
+                    identifier = tokens[0]
 
-            if agent in a_result:
-                print_sorted_list_of_intervals(a_result[agent])
+                    if identifier == "N":
+                        n_result.setdefault(int(tokens[2]), []).append(var)
+                    elif identifier == "A":
+                        a_result.setdefault(int(tokens[3]), []).append(var)
+                    elif identifier == "Ae":
+                        ae_result.setdefault(int(tokens[3]), []).append(var)
 
-            if agent in ae_result:
-                print_sorted_list_of_intervals(ae_result[agent])
-        """
+            for agent in range(agents_len):
+                print("Agent %d" % agent)
+
+                if agent in n_result:
+                    print_sorted_list_of_intervals(n_result[agent])
+
+                if agent in a_result:
+                    print_sorted_list_of_intervals(a_result[agent])
+
+                if agent in ae_result:
+                    print_sorted_list_of_intervals(ae_result[agent])
+
+        paths = decode_plan(solution, index, agents_len)
 
         # Print the path for each agent
-        agents_path = dict()
-
-        for name, var in solution.var_solutions_dict.items():
-            if type(name) == str and type(var) == CpoIntervalVarSolution and var.is_present():
-                # Use regex to extract from the name the type of the variable, the agent involved and the vertex.
-                tokens = re.split("_", name)
-                if tokens[0] == "N":
-                    # Extract time steps from activity durations
-                    duration = -1
-                    while duration < var.end - var.start:
-                        duration += 1
-                        agents_path.setdefault(int(tokens[2]), {})[var.start + duration] = int(tokens[1])
-
-        paths = []
-        # Print the steps of each agent
-        for a in sorted(agents_path.keys()):
-            print("Agent %d:\t" % a, end="")
-            paths.append([])
-            for key in sorted(agents_path[a].keys()):
-                paths[a].append(agents_path[a][key])
-                print("%d\t" % agents_path[a][key], end="")
-            print("")
+        print_plan(paths)
 
         return True, solution["MKSP"], solve_time, memory_usage, number_of_conflicts, decisions, paths
 
+    elif result.is_solution():
+        # A plan not proven optimal, e.g. when a limit is reached, can still warm start the next solves
+        return False, solution["MKSP"], solve_time, None, None, None, decode_plan(solution, index, agents_len)
+
     else:
         return False, -1, solve_time, None, None, None, None
 
 
+def decode_plan(solution, index, agents_len):
+    """
+    Build the plan of a solution of the CP model, reading only the solutions of the N intervals.
+
+    :param solution: the CpoModelSolution
+    :param index: the IntervalIndex of the model
+    :param agents_len: the number of agents
+    :return: the plan
+    """
+
+    # Each present N interval covers the time steps from its start to its end on the same vertex
+    paths = empty_plan(agents_len, solution["MKSP"])
+
+    for vertex, agent, var in index.cells():
+        interval = solution.get_var_solution(var)
+        if interval is not None and interval.is_present():
+            paths[agent, interval.start:interval.end + 1] = vertex
+
+    return paths
+
+
 def print_sorted_list_of_intervals(intervals):
     """
     Print the list interval variables sorted in increasing order. Those that start and end before have the precedence.
@@ -302,7 +713,8 @@ def print_sorted_list_of_intervals(intervals):
         print(e)
 
 
-def solving_MAPF(agents, edges, upper_bound, shortest_path):
+def solving_MAPF(agents, edges, upper_bound, shortest_path, parameters=None, search_phases=False, warm_start=False,
+                 weights=None, presolve=True):
     """
     Find the correct number of layers and upper bound. It represents the lines 6-12 of the Algorithm1 in the cited
     paper.
@@ -313,20 +725,52 @@ def solving_MAPF(agents, edges, upper_bound, shortest_path):
     :param upper_bound: the maximum value that interval variables can assume, it represents the maximum makespan
      possible and also the maximum number of layers
     :param shortest_path: the minimum shortest path
-    :return True when a plan has been found, optimal upper bound, optimal number of layers, time to build the model,
-     memory usage, number of conflicts and decisions
+    :param parameters: the parameters of CP Optimizer used by each solve, see solver_parameters
+    :param search_phases: True to branch first on the shortest paths, see run_CPLEX
+    :param warm_start: True to compute first a plan with prioritized_plan, used as starting point of the first solve
+     and whose makespan replaces upper_bound as the maximum value of the intervals, ignored with weights
+    :param weights: dictionary containing the length of the arcs longer than 1, see run_CPLEX
+    :param presolve: True to reject first the infeasible instances, see Presolve. The agents are not removed, since the
+     number of layers found is used by run_CPLEX on the whole instance: see cp_worker for the complete presolve.
+    :return True when a plan has been found, even if its optimality was not proved within the limits of the
+     parameters, optimal upper bound, optimal number of layers, time to build the model, memory usage, number of
+     conflicts, decisions and the best plan found, to be used as starting point of the final solve
     """
 
-    num_layers = 1
+    if presolve and not Presolve(edges, agents).feasible:
+        return False, -1, 0, 0, None, None, None, None
 
-    check, ret, solve_time, memory_usage, number_of_conflicts, decisions, _ = \
-        run_CPLEX(edges, agents, upper_bound, num_layers)
-
-    while check is False and num_layers < upper_bound:
-        check, ret, solve_time, memory_usage, number_of_conflicts, decisions, _ = \
-            run_CPLEX(edges, agents, upper_bound, num_layers)
+    max_layers = upper_bound
+    num_layers = 1
+    # The prioritized planner moves along arcs of length 1
+    best_paths = prioritized_plan(edges, agents, upper_bound)[0] if warm_start and not weights else None
+    if best_paths is not None and not validate_plan(edges, agents, best_paths):
+        # An invalid heuristic plan would be returned as found, the search starts cold instead
+        best_paths = None
+
+    if best_paths is not None:
+        upper_bound = len(best_paths[0]) - 1
+
+    while True:
+        check, ret, solve_time, memory_usage, number_of_conflicts, decisions, paths = \
+            run_CPLEX(edges, agents, upper_bound, num_layers, starting_paths=best_paths, parameters=parameters,
+                      search_phases=search_phases, weights=weights)
+
+        if paths is not None:
+            # The next solves start from the best plan found and are bounded by its makespan
+            best_paths = paths
+            upper_bound = len(paths[0]) - 1
+
+        if check or num_layers >= max_layers:
+            break
         num_layers += 1
 
-    num_layers = round((ret - shortest_path) / 2 + 1)
+    if not check and best_paths is not None:
+        # No better plan was proved within the limits, but the best plan found, e.g. the warm start, is valid
+        check = True
+        ret = len(best_paths[0]) - 1
+
+    # The round of docplex.cp.model shadows the built-in one
+    num_layers = builtins.round((ret - shortest_path) / 2 + 1)
 
-    return check, ret, num_layers, solve_time, memory_usage, number_of_conflicts, decisions
+    return check, ret, num_layers, solve_time, memory_usage, number_of_conflicts, decisions, best_paths
@@ -1,5 +1,16 @@
+from bisect import bisect_right
+
+import numpy as np
 from z3 import *
 
+from solvers.cardinality import CARDINALITY_ENCODINGS, at_most_one, implies_exactly_one
+from solvers.makespan_search import search_makespan
+from solvers.presolve import Presolve
+from solvers.prioritized import prioritized_plan
+from utils.distances import UNREACHABLE, DistanceIndex, graph_key
+from utils.plans import empty_plan, last_visits, plan_makespan, plan_moves, plan_positions, print_plan, sum_of_costs, \
+    validate_plan
+
 """
 This file contains the SMT-based model of the MAPF problem. Must be executed inside a loop that iteratively increase the
 makespan to obtain an optimal solution.
@@ -43,7 +54,53 @@ at_ = Function('at', IntSort(), IntSort(), IntSort(), BoolSort())
 pass_ = Function('pass', IntSort(), IntSort(), IntSort(), IntSort(), BoolSort())
 
 
-def run_Z3(edges, agents, makespan):
+class FunctionEncoding:
+    """
+    Encoding based on the uninterpreted functions at and pass, the one used by the quantified model of run_Z3.
+    """
+
+    def at(self, vertex, agent, time):
+        return at_(vertex, agent, time)
+
+    def pass_(self, vertex, neighbor, agent, time):
+        return pass_(vertex, neighbor, agent, time)
+
+    def solver(self):
+        return Solver()
+
+
+class BooleanEncoding:
+    """
+    Propositional encoding: a plain Bool is created for each (vertex, agent, time) and for each (arc, agent, time) of
+    the arcs existing in the graph. The resulting model has no quantifiers and no uninterpreted functions, hence it is
+    solved by the SAT core of Z3 (logic QF_FD) instead of the SMT core with MBQI/E-matching.
+    """
+
+    def __init__(self):
+        self.at_vars = dict()
+        self.pass_vars = dict()
+
+    def at(self, vertex, agent, time):
+        key = (vertex, agent, time)
+        if key not in self.at_vars:
+            self.at_vars[key] = Bool("at_%d_%d_%d" % key)
+        return self.at_vars[key]
+
+    def pass_(self, vertex, neighbor, agent, time):
+        key = (vertex, neighbor, agent, time)
+        if key not in self.pass_vars:
+            self.pass_vars[key] = Bool("pass_%d_%d_%d_%d" % key)
+        return self.pass_vars[key]
+
+    def solver(self):
+        return SolverFor("QF_FD")
+
+
+# Encodings selectable in run_Z3 and IncrementalZ3Model
+ENCODINGS = {"functions": FunctionEncoding, "boolean": BooleanEncoding}
+
+
+def run_Z3(edges, agents, makespan, encoding="functions", cardinality="pb", hints=None, obstacles=None, cache=None):
     """
     Create a MAPF solver using Z3Py.
 
@@ -51,23 +108,52 @@ def run_Z3(edges, agents, makespan):
     neighbors
     :param agents: list of tuples containing origins and destinations
     :param makespan: the minimal time step that satisfies the problem
-    :return True when a plan has been found, time to build the model, memory usage, number of conflicts and decisions
+    :param encoding: "functions" for the model with uninterpreted functions and quantifiers described below, "boolean"
+    for the quantifier-free propositional one built by IncrementalZ3Model
+    :param cardinality: the encoding of the cardinality constraints of the propositional model, one of
+    CARDINALITY_ENCODINGS. The quantified model always uses the arithmetic summations.
+    :param hints: a plan, e.g. found by prioritized_plan, suggested as initial phases of the search of the propositional
+    model, see IncrementalZ3Model.set_phase_hints. Ignored by the quantified model.
+    :param obstacles: the plan of other agents whose paths are fixed, i.e. time-indexed obstacles, see
+    IncrementalZ3Model
+    :param cache: a ModelCache storing the SMT-LIB2 text of the assertions. When the model of the instance is cached it
+    is loaded and solved by solve_smt2 instead of being built, without the hints. Otherwise the model is built and
+    solved in memory and its assertions are exported to the cache.
+    :return True when a plan has been found, time to build the model, memory usage, number of conflicts and decisions,
+    paths is a plan, i.e. an int32 array of shape (agents, makespan + 1)
     """
     import time
 
     edges_len = len(edges)
     agents_len = len(agents)
 
-    if edges_len <= 0:
-        raise ArgumentError("The graph must not be empty")
-    if any([vertex not in range(edges_len) for neighbors in edges for vertex in neighbors]):
-        raise ArgumentError("Neighbors of nodes must be valid vertices")
-    if agents_len <= 0:
-        raise ArgumentError("The number of agents must be at least one")
-    if any([agent[0] not in range(edges_len) or agent[1] not in range(edges_len) for agent in agents]):
-        raise ArgumentError("Agents' destinations and origins must be at valid vertices")
-    if makespan < 0:
-        raise ArgumentError("The makespan must be greater or equal than zero")
+    check_arguments(edges, agents, makespan, obstacles)
+
+    if encoding not in ENCODINGS:
+        raise ArgumentError("The encoding must be one of %s" % ", ".join(ENCODINGS))
+
+    key = None
+    if cache is not None:
+        # The quantified model always uses the arithmetic summations
+        key = cache.key("smt2", edges, agents, makespan=makespan, encoding=encoding,
+                        cardinality=cardinality if encoding != "functions" else None, obstacles=obstacles)
+        data = cache.load(key)
+        if data is not None:
+            return solve_smt2(data.decode(), edges, agents, makespan, encoding)
+
+    if encoding != "functions":
+        if cache is not None:
+            # The model is solved in memory as below, its assertions are only written to the cache
+            incremental_model = ExportZ3Model(edges, agents, encoding, cardinality=cardinality, obstacles=obstacles)
+        else:
+            incremental_model = IncrementalZ3Model(edges, agents, encoding, cardinality=cardinality,
+                                                   obstacles=obstacles)
+        if hints is not None:
+            incremental_model.set_phase_hints(hints)
+        result = incremental_model.solve(makespan)
+        if cache is not None:
+            cache.store(key, incremental_model.export(makespan).encode())
+        return result
 
     # ==================================================================================================================
     # Variables and summations
@@ -215,6 +301,22 @@ def run_Z3(edges, agents, makespan):
            for time in range(makespan)
            for neighbor in range(len(edges[vertex]))])
 
+    if obstacles is not None:
+        # (8) Agents avoid the vertices of the obstacles, swaps with them and destinations visited after the makespan
+        s.add([Not(at_(vertex, agent, time))
+               for time in range(makespan + 1)
+               for vertex in plan_positions(obstacles, time)
+               for agent in range(agents_len)])
+        s.add([Not(pass_(neighbor, vertex, agent, time))
+               for time in range(makespan)
+               for vertex, neighbor in plan_moves(obstacles, time)
+               for agent in range(agents_len)])
+        visits = last_visits(obstacles, edges_len)
+        s.add([BoolVal(False) for pair in agents if visits[pair[1]] >= makespan])
+
+    if cache is not None:
+        cache.store(key, s.sexpr().encode())
+
     # ==================================================================================================================
     # Execution
     # ==================================================================================================================
@@ -238,9 +340,7 @@ def run_Z3(edges, agents, makespan):
         print(model)
         """
 
-        memory_usage = statistics.get_key_value('max memory')
-        number_of_conflicts = statistics.get_key_value('conflicts')
-        decisions = statistics.get_key_value('decisions')
+        memory_usage, number_of_conflicts, decisions = solver_statistics(statistics)
 
         # Uncomment to print model variables
         """
@@ -263,20 +363,901 @@ def run_Z3(edges, agents, makespan):
                         if is_true(r):
                             print("pass(%d, %d, %d, %d)" % (vertex, neighbor, agent, time))
         """
-        paths = []
-        # Print the path for each agent
-        for agent in range(agents_len):
-            paths.append([])
-            print("Agent %d:\t" % agent, end="")
-            for time in range(makespan + 1):
-                for vertex in range(edges_len):
-                    r = model.evaluate(at_(vertex, agent, time))
-                    if is_true(r):
-                        paths[agent].append(vertex)
-                        print("%d\t" % vertex, end="")
-                        break
-            print("")
+        paths = extract_paths(model, edges, list(enumerate(pair[0] for pair in agents)), makespan)
+        print_plan(paths)
 
         print(sep)
         return True, elapsed_time, memory_usage, number_of_conflicts, decisions, paths
     return False, None, None, None, None, None
+
+
+def solve_smt2(text, edges, agents, makespan, encoding="functions"):
+    """
+    Solve a model of run_Z3 given as SMT-LIB2 text, e.g. loaded from a ModelCache. The propositional model is checked
+    under the assumption literal goal_makespan created by IncrementalZ3Model.goal.
+
+    :param text: the assertions of the model
+    :param edges: list of sets containing for each vertex its neighbors
+    :param agents: list of tuples containing origins and destinations
+    :param makespan: the makespan of the model
+    :param encoding: the encoding of the model, one of ENCODINGS
+    :return True when a plan has been found, time to load the model and solve, memory usage, number of conflicts and
+    decisions, paths is a plan, i.e. an int32 array of shape (agents, makespan + 1)
+    """
+    import time
+
+    start_time = time.time()
+    model_encoding = ENCODINGS[encoding]()
+    solver = model_encoding.solver()
+    solver.from_string(text)
+
+    assumptions = [Bool("goal_%d" % makespan)] if encoding != "functions" else []
+    result = solver.check(*assumptions)
+    print("Makespan %d: %s" % (makespan, result))
+
+    if result == sat:
+        model = solver.model()
+        elapsed_time = time.time() - start_time
+        memory_usage, number_of_conflicts, decisions = solver_statistics(solver.statistics())
+        paths = extract_paths(model, edges, list(enumerate(pair[0] for pair in agents)), makespan, model_encoding.at)
+        print_plan(paths)
+
+        print("-" * 50)
+        return True, elapsed_time, memory_usage, number_of_conflicts, decisions, paths
+    return False, None, None, None, None, None
+
+
+def check_arguments(edges, agents, makespan, obstacles=None):
+    """
+    Validate the instance given to the SMT-based model.
+
+    :param edges: list of sets containing for each vertex (whose identifier is the index of this list) its neighbors
+    :param agents: list of tuples containing origins and destinations
+    :param makespan: the makespan to check
+    :param obstacles: the plan of the agents whose paths are fixed, None when there are no other agents
+    :raise ArgumentError when the graph, the agents, the makespan or the obstacles are not valid
+    """
+
+    edges_len = len(edges)
+    agents_len = len(agents)
+
+    if edges_len <= 0:
+        raise ArgumentError("The graph must not be empty")
+    if any([vertex not in range(edges_len) for neighbors in edges for vertex in neighbors]):
+        raise ArgumentError("Neighbors of nodes must be valid vertices")
+    if agents_len <= 0:
+        raise ArgumentError("The number of agents must be at least one")
+    if any([agent[0] not in range(edges_len) or agent[1] not in range(edges_len) for agent in agents]):
+        raise ArgumentError("Agents' destinations and origins must be at valid vertices")
+    if makespan < 0:
+        raise ArgumentError("The makespan must be greater or equal than zero")
+    if obstacles is not None and (obstacles.ndim != 2 or obstacles.size == 0 or obstacles.min() < 0 or
+                                  obstacles.max() >= edges_len):
+        raise ArgumentError("Obstacles must be a non empty plan of valid vertices")
+
+
+def solver_statistics(statistics):
+    """
+    Read from the Z3 statistics the values reported by the solvers. The SAT core prefixes its keys with "sat", keys
+    missing from the statistics (e.g. when the problem is solved during the preprocessing) are reported as zero.
+
+    :param statistics: the statistics of a Z3 solver
+    :return: memory usage, number of conflicts and decisions
+    """
+
+    keys = statistics.keys()
+    values = []
+    for key in ('max memory', 'conflicts', 'decisions'):
+        if key in keys:
+            values.append(statistics.get_key_value(key))
+        elif 'sat ' + key in keys:
+            values.append(statistics.get_key_value('sat ' + key))
+        else:
+            values.append(0)
+
+    return tuple(values)
+
+
+def extract_paths(model, edges, origins, makespan, at=at_):
+    """
+    Extract from a Z3 model the path followed by each agent. Starting from its origin, at each time step only the
+    terms at of the neighbors of the current vertex are evaluated, i.e. O(agents * makespan * degree) evaluations
+    instead of one for each vertex.
+
+    :param model: the Z3 model
+    :param edges: list of sets containing for each vertex its neighbors
+    :param origins: list of pairs containing the index of each agent in the encoding and its origin
+    :param makespan: the last time step of the paths
+    :param at: the function returning the term at(x, a, t) of the encoding
+    :return: a plan, i.e. an int32 array of shape (len(origins), makespan + 1)
+    """
+
+    paths = empty_plan(len(origins), makespan)
+
+    for row, (agent, vertex) in enumerate(origins):
+        paths[row, 0] = vertex
+        for time in range(1, makespan + 1):
+            vertex = next(neighbor for neighbor in edges[vertex] if is_true(model.evaluate(at(neighbor, agent, time))))
+            paths[row, time] = vertex
+
+    return paths
+
+
+class IncrementalZ3Model:
+    """
+    Incremental version of the SMT-based model. A single Solver is reused across makespans: extend() adds the time
+    layer T + 1 on top of the existing encoding, while the final position constraint (2) of each makespan is guarded by
+    an assumption literal. In this way the clauses learned while refuting a makespan are kept for the following ones.
+
+    The constraints quantified over the agents and the time steps in run_Z3 are instantiated here for each agent and
+    layer, since the number of time steps is not known in advance. The terms at and pass are provided by one of the
+    ENCODINGS. The summations are expressed with one of the CARDINALITY_ENCODINGS, by default the native ones of Z3:
+    once assumptions are used the solver gives up most of its preprocessing, and the If-based sums become much slower
+    to propagate.
+
+    When pruning is enabled, at(x, a, t) is encoded only inside the reachability window of the agent: x must be at
+    most t steps from the origin of a, and at most makespan - t steps from its destination. The first bound does not
+    depend on the makespan and limits the terms created by each layer, the second one is asserted as false under the
+    assumption literal of each makespan.
+
+    The obstacles are the plan of other agents whose paths are fixed, e.g. those outside the neighborhood repaired by
+    the large neighborhood search: the agents of the model can not occupy their vertices nor swap with them, and can
+    park on a vertex only after its last visit.
+    """
+
+    def __init__(self, edges, agents, encoding="functions", pruning=True, cardinality="pb", obstacles=None):
+        """
+        Assert the origins and the constraints of the time step 0.
+
+        :param edges: list of sets containing for each vertex (whose identifier is the index of this list) its
+        neighbors
+        :param agents: list of tuples containing origins and destinations
+        :param encoding: the name of the encoding, one of ENCODINGS
+        :param pruning: True to encode only the (vertex, agent, time) triples inside the reachability windows
+        :param cardinality: the encoding of the constraints (3), (4), (5) and (7), one of CARDINALITY_ENCODINGS
+        :param obstacles: a plan, i.e. an int32 array of shape (other agents, makespan + 1), followed by agents that are
+        not part of the model and wait forever on their last vertices, None when there are no other agents
+        """
+
+        check_arguments(edges, agents, 0, obstacles)
+        if encoding not in ENCODINGS:
+            raise ArgumentError("The encoding must be one of %s" % ", ".join(ENCODINGS))
+        if cardinality not in CARDINALITY_ENCODINGS:
+            raise ArgumentError("The cardinality encoding must be one of %s" % ", ".join(CARDINALITY_ENCODINGS))
+
+        self.edges = edges
+        self.agents = agents
+        self.edges_len = len(edges)
+        self.agents_len = len(agents)
+        self.horizon = 0
+        self.goals = dict()
+        self.hints = None
+        self.obstacles = obstacles
+        self.obstacle_visits = last_visits(obstacles, len(edges)) if obstacles is not None else None
+        self.cardinality = cardinality
+        self.encoding = ENCODINGS[encoding]()
+        self.at = self.encoding.at
+        self.pass_ = self.encoding.pass_
+        self.solver = self._create_solver()
+
+        # Distances from the origin and to the destination of each agent
+        if pruning:
+            distance_index = DistanceIndex(edges)
+            self.origin_distances = [distance_index.from_source(pair[0]) for pair in agents]
+            self.destination_distances = [distance_index.to_goal(pair[1]) for pair in agents]
+        else:
+            self.origin_distances = [np.zeros(self.edges_len, dtype=np.int32) for _ in agents]
+            self.destination_distances = self.origin_distances
+
+        # Vertices of each agent sorted by distance from the origin, the window at time t is a prefix of this list
+        self.windows = []
+        self.window_distances = []
+        for distances in self.origin_distances:
+            window = np.argsort(distances, kind="stable")
+            window = window[distances[window] != UNREACHABLE]
+            self.windows.append(window.tolist())
+            self.window_distances.append(distances[window].tolist())
+
+        self._add_origins()
+        self._add_occupation_constraints(0)
+
+    def _create_solver(self):
+        """
+        Create the solver that receives the constraints, the one of the encoding.
+        """
+
+        return self.encoding.solver()
+
+    def _add_origins(self):
+        """
+        Add the constraint (1).
+        """
+
+        # (1) Start position
+        self.solver.add([self.at(pair[0], agent, 0) for agent, pair in enumerate(self.agents)])
+
+    def window(self, agent, time):
+        """
+        Return the vertices that an agent can occupy at a given time step.
+
+        :param agent: the agent
+        :param time: the time step
+        :return: the list of vertices at most time steps far from the origin of the agent
+        """
+
+        return self.windows[agent][:bisect_right(self.window_distances[agent], time)]
+
+    def _add_occupation_constraints(self, time):
+        """
+        Add the constraints (3) and (4) of a time step.
+
+        :param time: the time step
+        """
+
+        occupants = [[] for _ in range(self.edges_len)]
+
+        # (3) Each agent occupies at most one node
+        for agent in range(self.agents_len):
+            window = self.window(agent, time)
+            self.solver.add(at_most_one([self.at(vertex, agent, time) for vertex in window], self.cardinality))
+            for vertex in window:
+                occupants[vertex].append(self.at(vertex, agent, time))
+
+        # (4) Every vertex is occupied by at most one agent
+        for literals in occupants:
+            self.solver.add(at_most_one(literals, self.cardinality))
+
+        if self.obstacles is not None:
+            # (4) The vertices occupied by the obstacles are not available
+            for vertex in plan_positions(self.obstacles, time):
+                self.solver.add([Not(literal) for literal in occupants[vertex]])
+
+    def extend(self):
+        """
+        Add the time layer horizon + 1, i.e. the movements from the current last time step and the occupation
+        constraints of the new one.
+        """
+
+        time = self.horizon
+        arcs = dict()
+        if self.obstacles is not None:
+            obstacle_positions = plan_positions(self.obstacles, time + 1)
+            obstacle_moves = plan_moves(self.obstacles, time)
+        else:
+            obstacle_positions, obstacle_moves = set(), set()
+
+        for agent in range(self.agents_len):
+            # The moves to the vertices outside the next window or occupied by the obstacles, and the swaps with the
+            # obstacles, are not encoded
+            next_window = set(self.window(agent, time + 1)).difference(obstacle_positions)
+
+            for vertex in self.window(agent, time):
+                neighbors = [neighbor for neighbor in self.edges[vertex]
+                             if neighbor in next_window and (neighbor, vertex) not in obstacle_moves]
+                if not neighbors:
+                    self.solver.add(Not(self.at(vertex, agent, time)))
+                    continue
+
+                # (5) If an agent is in a node it needs to leave by one of the outgoing arcs
+                self.solver.add(implies_exactly_one(self.at(vertex, agent, time),
+                                                    [self.pass_(vertex, neighbor, agent, time)
+                                                     for neighbor in neighbors],
+                                                    self.cardinality))
+
+                for neighbor in neighbors:
+                    # (6) If an agent is using an arc, it needs to arrive at the corresponding node in the next time
+                    # step
+                    self.solver.add(Implies(self.pass_(vertex, neighbor, agent, time),
+                                            self.at(neighbor, agent, time + 1)))
+
+                    if vertex != neighbor:
+                        arcs.setdefault((min(vertex, neighbor), max(vertex, neighbor)), []).append(
+                            self.pass_(vertex, neighbor, agent, time))
+
+        # (7) Two agents can't occupy two opposite arcs at the same time (no-swap constraint)
+        for literals in arcs.values():
+            self.solver.add(at_most_one(literals, self.cardinality))
+
+        self.horizon += 1
+        self._add_occupation_constraints(self.horizon)
+        self._add_phase_hints(self.horizon)
+
+    def set_phase_hints(self, plan):
+        """
+        Suggest the literals of a plan, e.g. found by prioritized_plan, as initial phases of the search: the solver
+        tries them first and moves away from them only where the plan conflicts with the constraints of the makespan.
+        After the end of the plan each agent is suggested to wait on its last vertex. The hints require the boolean
+        encoding and a version of Z3 providing Solver.set_initial_value, otherwise they are ignored.
+
+        :param plan: a plan, i.e. an int32 array of shape (agents, makespan + 1)
+        """
+
+        self.hints = plan
+        for time in range(self.horizon + 1):
+            self._add_phase_hints(time)
+
+    def _add_phase_hints(self, time):
+        """
+        Suggest the position of each agent at a time step, and the arc used to reach it, from the hinted plan.
+
+        :param time: the time step
+        """
+
+        if self.hints is None or not isinstance(self.encoding, BooleanEncoding) or \
+                not hasattr(self.solver, "set_initial_value"):
+            return
+
+        last = self.hints.shape[1] - 1
+        for agent in range(self.agents_len):
+            vertex = int(self.hints[agent, min(time, last)])
+            self.solver.set_initial_value(self.at(vertex, agent, time), True)
+            if time > 0:
+                previous = int(self.hints[agent, min(time - 1, last)])
+                self.solver.set_initial_value(self.pass_(previous, vertex, agent, time - 1), True)
+
+    def goal(self, makespan):
+        """
+        Return the assumption literal that activates the constraint (2) for a given makespan, creating it if needed.
+        The literal also fixes to false the triples outside the destination windows of the makespan.
+
+        :param makespan: the makespan
+        :return: a Z3 Bool that, when assumed, forces every agent to be at its destination at time makespan
+        """
+
+        if makespan not in self.goals:
+            literal = Bool("goal_%d" % makespan)
+
+            for agent, pair in enumerate(self.agents):
+                distance = self.origin_distances[agent][pair[1]]
+                if distance == UNREACHABLE or distance > makespan:
+                    self.solver.add(Not(literal))
+                    continue
+
+                # The agent waits on its destination after the makespan, an obstacle can't visit it afterwards
+                if self.obstacles is not None and self.obstacle_visits[pair[1]] >= makespan:
+                    self.solver.add(Not(literal))
+                    continue
+
+                # (2) Final position
+                self.solver.add(Implies(literal, self.at(pair[1], agent, makespan)))
+
+                destination_distances = self.destination_distances[agent]
+                self.solver.add([Implies(literal, Not(self.at(vertex, agent, time)))
+                                 for time in range(makespan + 1)
+                                 for vertex in self.window(agent, time)
+                                 if destination_distances[vertex] == UNREACHABLE or
+                                 destination_distances[vertex] > makespan - time])
+
+            self.goals[makespan] = literal
+
+        return self.goals[makespan]
+
+    def solve(self, makespan):
+        """
+        Check if there is a plan with a given makespan, extending the encoding when the makespan is greater than the
+        current horizon. Checking a makespan lower than the horizon is allowed: since the agents can wait on their
+        destinations using the self-loops, the layers beyond the makespan do not change the answer.
+
+        :param makespan: the makespan to check
+        :return True when a plan has been found, time to extend the model and solve, memory usage, number of conflicts
+        and decisions, paths is a plan, i.e. an int32 array of shape (agents, makespan + 1).
+        """
+        import time
+
+        if makespan < 0:
+            raise ArgumentError("The makespan must be greater or equal than zero")
+
+        start_time = time.time()
+
+        while self.horizon < makespan:
+            self.extend()
+
+        result = self.solver.check(self.goal(makespan))
+        print("Makespan %d: %s" % (makespan, result))
+
+        if result == sat:
+            model = self.solver.model()
+            elapsed_time = time.time() - start_time
+            memory_usage, number_of_conflicts, decisions = solver_statistics(self.solver.statistics())
+            paths = extract_paths(model, self.edges, list(enumerate(pair[0] for pair in self.agents)), makespan,
+                                  self.at)
+            print_plan(paths)
+
+            print("-" * 50)
+            return True, elapsed_time, memory_usage, number_of_conflicts, decisions, paths
+        return False, None, None, None, None, None
+
+
+class RecordingSolver:
+    """
+    Solver that forwards the assertions to the solver of an encoding and also records them, to be exported by a general
+    Solver only when requested. The other methods are the ones of the solver of the encoding.
+    """
+
+    def __init__(self, solver):
+        self.solver = solver
+        self.assertions = []
+
+    def add(self, *args):
+        self.solver.add(*args)
+        for arg in args:
+            if isinstance(arg, list):
+                self.assertions.extend(arg)
+            else:
+                self.assertions.append(arg)
+
+    def sexpr(self):
+        recorder = Solver()
+        recorder.add(self.assertions)
+        return recorder.sexpr()
+
+    def __getattr__(self, name):
+        return getattr(self.solver, name)
+
+
+class ExportZ3Model(IncrementalZ3Model):
+    """
+    Version of IncrementalZ3Model whose assertions can be exported as SMT-LIB2 text. The solver of the propositional
+    encoding translates the assertions into clauses as soon as they are added and does not keep them, so they are
+    also collected by a RecordingSolver. The model is solved as an IncrementalZ3Model.
+    """
+
+    def _create_solver(self):
+        return RecordingSolver(super()._create_solver())
+
+    def export(self, makespan):
+        """
+        Encode the time steps up to a makespan and its assumption literal, see solve_smt2.
+
+        :param makespan: the makespan of the model
+        :return: the SMT-LIB2 text of the assertions
+        """
+
+        while self.horizon < makespan:
+            self.extend()
+        self.goal(makespan)
+
+        return self.solver.sexpr()
+
+
+class MapfZ3Session(IncrementalZ3Model):
+    """
+    Session for lifelong MAPF built on the propositional encoding of IncrementalZ3Model. The graph encoding is created
+    once for a fixed number of agent slots and kept in the solver, while agents, origins and destinations are switched
+    on and off through assumption literals:
+
+    - active_a enables the slot a, an inactive slot cannot occupy any vertex
+    - at(x, a, 0) places the agent of the slot a on its origin x
+    - at(y, a, T) requires the agent of the slot a to be on its destination y at the makespan T
+
+    Adding, removing or re-targeting an agent therefore does not change the encoding, and the clauses learned by
+    previous queries are kept. The reachability windows depend on the origins, hence they are not used.
+    """
+
+    def __init__(self, edges, capacity, cardinality="pb"):
+        """
+        Create the encoding of the time step 0 for a given number of slots.
+
+        :param edges: list of sets containing for each vertex (whose identifier is the index of this list) its
+        neighbors
+        :param capacity: the maximum number of agents at the same time
+        :param cardinality: the encoding of the cardinality constraints, one of CARDINALITY_ENCODINGS
+        """
+
+        if capacity <= 0:
+            raise ArgumentError("The number of slots must be at least one")
+
+        self.slots = [None] * capacity
+        self.distance_index = DistanceIndex(edges)
+
+        # Each slot is a placeholder agent until add_agent() assigns it an origin and a destination
+        super().__init__(edges, [(0, 0)] * capacity, "boolean", False, cardinality)
+
+    def _add_origins(self):
+        """
+        Create the activation literal of each slot. Origins are given as assumptions when solving.
+        """
+
+        self.active = [Bool("active_%d" % slot) for slot in range(self.agents_len)]
+
+        # An inactive slot does not occupy any vertex at time 0, hence it never moves
+        self.solver.add([Implies(self.at(vertex, slot, 0), self.active[slot])
+                         for slot in range(self.agents_len)
+                         for vertex in range(self.edges_len)])
+
+    def _check_vertex(self, vertex):
+        if vertex not in range(self.edges_len):
+            raise ArgumentError("Agents' destinations and origins must be at valid vertices")
+
+    def _check_slot(self, slot):
+        if slot not in range(self.agents_len) or self.slots[slot] is None:
+            raise ArgumentError("The slot %s is not assigned to an agent" % slot)
+
+    def add_agent(self, origin, destination):
+        """
+        Assign a free slot to a new agent.
+
+        :param origin: the origin of the agent
+        :param destination: the destination of the agent
+        :return: the slot of the agent, used to refer to it in the other methods
+        """
+
+        self._check_vertex(origin)
+        self._check_vertex(destination)
+        if None not in self.slots:
+            raise ArgumentError("All the %d slots are in use" % self.agents_len)
+
+        slot = self.slots.index(None)
+        self.slots[slot] = (origin, destination)
+        return slot
+
+    def remove_agent(self, slot):
+        """
+        Remove an agent, freeing its slot.
+
+        :param slot: the slot of the agent
+        """
+
+        self._check_slot(slot)
+        self.slots[slot] = None
+
+    def set_origin(self, slot, origin):
+        """
+        Move the origin of an agent, e.g. to its current position when replanning.
+
+        :param slot: the slot of the agent
+        :param origin: the new origin
+        """
+
+        self._check_slot(slot)
+        self._check_vertex(origin)
+        self.slots[slot] = (origin, self.slots[slot][1])
+
+    def set_goal(self, slot, destination):
+        """
+        Assign a new destination to an agent.
+
+        :param slot: the slot of the agent
+        :param destination: the new destination
+        """
+
+        self._check_slot(slot)
+        self._check_vertex(destination)
+        self.slots[slot] = (self.slots[slot][0], destination)
+
+    def active_slots(self):
+        """
+        Return the slots assigned to an agent.
+
+        :return: the sorted list of the slots in use
+        """
+
+        return [slot for slot, pair in enumerate(self.slots) if pair is not None]
+
+    def assumptions(self, makespan):
+        """
+        Return the assumption literals describing the current agents for a given makespan.
+
+        :param makespan: the makespan
+        :return: a list of Z3 Bool expressions
+        """
+
+        literals = []
+        for slot, pair in enumerate(self.slots):
+            if pair is None:
+                literals.append(Not(self.active[slot]))
+            else:
+                literals += [self.active[slot], self.at(pair[0], slot, 0), self.at(pair[1], slot, makespan)]
+
+        return literals
+
+    def solve(self, upper_bound=None):
+        """
+        Search the minimal makespan for the current agents, starting from the maximum shortest path and extending the
+        encoding when needed.
+
+        :param upper_bound: the maximum makespan, by default the number of vertices
+        :return True when a plan has been found, time spent in the search, memory usage, number of conflicts and
+        decisions, the plan whose rows follow the order of active_slots() and the makespan of the plan.
+        """
+        import time
+
+        start_time = time.time()
+        if upper_bound is None:
+            upper_bound = self.edges_len
+
+        agents = dict((slot, pair) for slot, pair in enumerate(self.slots) if pair is not None)
+
+        # The maximum shortest path is a lower bound of the makespan
+        makespan = 0
+        for origin, destination in agents.values():
+            distance = self.distance_index.distance(origin, destination)
+            if distance == UNREACHABLE:
+                print("Destination %d not reachable from %d" % (destination, origin))
+                return False, None, None, None, None, None, None
+            makespan = max(makespan, distance)
+
+        while makespan <= upper_bound:
+            while self.horizon < makespan:
+                self.extend()
+
+            result = self.solver.check(*self.assumptions(makespan))
+            print("Makespan %d: %s" % (makespan, result))
+
+            if result == sat:
+                model = self.solver.model()
+                memory_usage, number_of_conflicts, decisions = solver_statistics(self.solver.statistics())
+                paths = extract_paths(model, self.edges, [(slot, agents[slot][0]) for slot in sorted(agents)],
+                                      makespan, self.at)
+
+                return True, time.time() - start_time, memory_usage, number_of_conflicts, decisions, paths, makespan
+
+            makespan += 1
+
+        return False, None, None, None, None, None, None
+
+
+class OptimizeZ3Model(IncrementalZ3Model):
+    """
+    Variant of the propositional model solved by Optimize, that minimizes a weighted sum of the sum of costs and the
+    makespan within a fixed horizon instead of checking a single makespan. The horizon is an upper bound of the
+    makespan, e.g. the one of a plan found by run_Z3_incremental, and it is encoded as in IncrementalZ3Model.
+
+    arrived(a, t) is true when the agent a is on its destination at t and never leaves it afterwards, so that the cost
+    of a is the number of time steps in which arrived(a, t) is false. Both the sum of costs and the makespan are given
+    to Optimize as weighted soft constraints, i.e. as a MaxSAT problem whose bounds are available even when the search
+    is interrupted.
+    """
+
+    def __init__(self, edges, agents, horizon, cost_weight=1, makespan_weight=0, pruning=True, cardinality="pb",
+                 obstacles=None):
+        """
+        Create the model up to the horizon and the objective.
+
+        :param edges: list of sets containing for each vertex (whose identifier is the index of this list) its
+        neighbors
+        :param agents: list of tuples containing origins and destinations
+        :param horizon: the maximum makespan
+        :param cost_weight: the integer weight of the sum of costs in the objective
+        :param makespan_weight: the integer weight of the makespan in the objective
+        :param pruning: True to encode only the triples inside the reachability windows of the agents
+        :param cardinality: the encoding of the cardinality constraints, one of CARDINALITY_ENCODINGS
+        :param obstacles: the plan of other agents whose paths are fixed, see IncrementalZ3Model
+        """
+
+        if cost_weight < 0 or makespan_weight < 0 or cost_weight + makespan_weight <= 0:
+            raise ArgumentError("The weights must be non negative and at least one of them positive")
+
+        # Used by window while the base model is created
+        self.max_horizon = horizon
+
+        super().__init__(edges, agents, "boolean", pruning, cardinality, obstacles)
+
+        self.objective = None
+        while self.horizon < horizon:
+            self.extend()
+        self.solver.add(self.goal(horizon))
+
+        # The agents can't arrive before their shortest paths, this part of the objective does not depend on the plan
+        self.offset = 0
+        self.shortest_paths = []
+        self.arrived = []
+        for agent, pair in enumerate(agents):
+            shortest_path = int(self.origin_distances[agent][pair[1]])
+            shortest_path = min(shortest_path, horizon) if shortest_path != UNREACHABLE else horizon
+            self.offset += cost_weight * shortest_path
+            self.shortest_paths.append(shortest_path)
+
+            arrived = [BoolVal(False)] * shortest_path + \
+                      [Bool("arrived_%d_%d" % (agent, time)) for time in range(shortest_path, horizon + 1)]
+            self.solver.add(arrived[horizon] == self.at(pair[1], agent, horizon))
+            self.solver.add([arrived[time] == And(self.at(pair[1], agent, time), arrived[time + 1])
+                             for time in range(shortest_path, horizon)])
+            self.arrived.append(arrived)
+
+            if cost_weight > 0:
+                for time in range(shortest_path, horizon):
+                    self.objective = self.solver.add_soft(arrived[time], cost_weight, "objective")
+
+        if makespan_weight > 0:
+            # The makespan can't be lower than the maximum shortest path
+            max_shortest_path = max(self.shortest_paths)
+            self.offset += makespan_weight * max_shortest_path
+            for time in range(max_shortest_path, horizon):
+                self.objective = self.solver.add_soft(And([arrived[time] for arrived in self.arrived]),
+                                                      makespan_weight, "objective")
+
+    def _create_solver(self):
+        return Optimize()
+
+    def window(self, agent, time):
+        """
+        Return the vertices that an agent can occupy at a given time step. Since the horizon is known in advance, the
+        vertices farther than horizon - time steps from the destination are excluded as well.
+        """
+
+        destination_distances = self.destination_distances[agent]
+        return [vertex for vertex in super().window(agent, time)
+                if 0 <= destination_distances[vertex] <= self.max_horizon - time]
+
+    def bounds(self):
+        """
+        Return the bounds of the objective proved by the last call to solve, including the constant part.
+
+        :return: the lower and the upper bounds, the upper one is None when no plan is known
+        """
+
+        if self.objective is None:
+            return self.offset, self.offset
+
+        lower, upper = self.objective.lower(), self.objective.upper()
+        lower = self.offset + lower.as_long() if is_int_value(lower) else self.offset
+        upper = self.offset + upper.as_long() if is_int_value(upper) else None
+
+        return lower, upper
+
+    def solve(self, time_limit=None):
+        """
+        Minimize the objective.
+
+        :param time_limit: the maximum number of seconds, None for no limit
+        :return True when a plan has been found, True when it is optimal, time to solve, the lower and upper bounds of
+        the objective proved by the solver, the plan and its makespan
+        """
+        import time
+
+        if time_limit is not None:
+            self.solver.set("timeout", int(time_limit * 1000))
+
+        start_time = time.time()
+        result = self.solver.check()
+        elapsed_time = time.time() - start_time
+        print("Horizon %d: %s" % (self.horizon, result))
+
+        if result == unsat:
+            return False, False, elapsed_time, None, None, None, None
+
+        lower_bound, upper_bound = self.bounds()
+        if upper_bound is None:
+            return False, False, elapsed_time, lower_bound, None, None, None
+
+        # When the search is interrupted the solver may report the bound of a solution without providing its model
+        model = self.solver.model()
+        if not all(is_true(model.evaluate(self.at(pair[0], agent, 0))) for agent, pair in enumerate(self.agents)):
+            return False, False, elapsed_time, lower_bound, upper_bound, None, None
+
+        paths = extract_paths(model, self.edges, list(enumerate(pair[0] for pair in self.agents)), self.horizon,
+                              self.at)
+        makespan = plan_makespan(paths, self.agents)
+        paths = paths[:, :makespan + 1]
+        print_plan(paths)
+        print("Sum of costs %d, makespan %d, objective in [%d, %d]" %
+              (sum_of_costs(paths, self.agents), makespan, lower_bound, upper_bound))
+
+        return True, result == sat, elapsed_time, lower_bound, upper_bound, paths, makespan
+
+
+def run_Z3_optimize(edges, agents, horizon, cost_weight=1, makespan_weight=0, time_limit=None, pruning=True,
+                    cardinality="pb", obstacles=None, hints=None):
+    """
+    Minimize the sum of costs, or its weighted sum with the makespan, within a horizon with a single call to
+    Optimize.
+
+    :param edges: list of sets containing for each vertex (whose identifier is the index of this list) its neighbors
+    :param agents: list of tuples containing origins and destinations
+    :param horizon: the maximum makespan
+    :param cost_weight: the integer weight of the sum of costs in the objective
+    :param makespan_weight: the integer weight of the makespan in the objective
+    :param time_limit: the maximum number of seconds, None for no limit
+    :param pruning: True to encode only the triples inside the reachability windows of the agents
+    :param cardinality: the encoding of the cardinality constraints, one of CARDINALITY_ENCODINGS
+    :param obstacles: the plan of other agents whose paths are fixed, i.e. time-indexed obstacles, see
+    IncrementalZ3Model
+    :param hints: a plan suggested as initial phases of the search, see IncrementalZ3Model.set_phase_hints
+    :return True when a plan has been found, True when it is optimal, total time to build and solve the model, the
+    lower and upper bounds of the objective, the plan and its makespan
+    """
+    import time
+
+    start_time = time.time()
+    optimize_model = OptimizeZ3Model(edges, agents, horizon, cost_weight, makespan_weight, pruning, cardinality,
+                                     obstacles)
+    if hints is not None:
+        optimize_model.set_phase_hints(hints)
+    check, optimal, _, lower_bound, upper_bound, paths, makespan = optimize_model.solve(time_limit)
+
+    return check, optimal, time.time() - start_time, lower_bound, upper_bound, paths, makespan
+
+
+def run_Z3_incremental(edges, agents, makespan, upper_bound, encoding="functions", pruning=True, cardinality="pb",
+                       strategy="linear", warm_start=False, obstacles=None, solutions=None, presolve=True,
+                       graph_hash=None):
+    """
+    Search the minimal makespan in [makespan, upper_bound], as done by the loops of the test files with run_Z3, but
+    reusing the same incremental model and its learned clauses between makespans. The initial makespan is always
+    checked, even when greater than upper_bound.
+
+    :param edges: list of sets containing for each vertex (whose identifier is the index of this list) its neighbors
+    :param agents: list of tuples containing origins and destinations
+    :param makespan: the initial makespan, e.g. the maximum shortest path
+    :param upper_bound: the maximum makespan
+    :param encoding: the name of the encoding, one of ENCODINGS
+    :param pruning: True to encode only the triples inside the reachability windows of the agents
+    :param cardinality: the encoding of the cardinality constraints, one of CARDINALITY_ENCODINGS
+    :param strategy: the order in which makespans are checked, one of makespan_search.STRATEGIES
+    :param warm_start: True to compute first a plan with prioritized_plan: its makespan minus one bounds the search,
+    since the plan itself is optimal when no shorter one exists, and its literals are used as phase hints
+    :param obstacles: the plan of other agents whose paths are fixed, i.e. time-indexed obstacles, see
+    IncrementalZ3Model
+    :param solutions: a SolutionCache returning the stored optimal plan of the instance instead of searching it, and
+    storing the plans proven optimal. Not used with obstacles.
+    :param presolve: True to reject first the infeasible instances and to remove the agents alone in their connected
+    component, see Presolve. Not used with obstacles.
+    :param graph_hash: the hash of the graph passed to the SolutionCache, see SolutionCache.canonical. Computed once
+    when None.
+    :return True when a plan has been found, total time spent in the search, memory usage, number of conflicts and
+    decisions, paths is a plan, i.e. an int32 array of shape (agents, makespan + 1), and the makespan of the plan.
+    Memory usage, conflicts and decisions are None when the plan is found in the cache or by the presolve.
+    """
+    import time
+
+    start_time = time.time()
+    if obstacles is not None:
+        solutions = None
+
+    if solutions is not None:
+        if graph_hash is None:
+            graph_hash = graph_key(edges)
+        optimal_makespan, paths = solutions.lookup(edges, agents, graph_hash=graph_hash)
+        if paths is not None and optimal_makespan <= max(makespan, upper_bound):
+            print_plan(paths)
+            return True, time.time() - start_time, None, None, None, paths, optimal_makespan
+
+    # The solver plans the agents left by the presolve, the plan of the others is merged at the end
+    instance = None
+    all_agents = agents
+    if presolve and obstacles is None:
+        instance = Presolve(edges, agents)
+        if not instance.feasible:
+            return False, None, None, None, None, None, None
+        if not instance.agents:
+            paths = instance.merge(None)
+            print_plan(paths)
+            return True, time.time() - start_time, None, None, None, paths, paths.shape[1] - 1
+        agents = instance.agents
+
+    incremental_model = IncrementalZ3Model(edges, agents, encoding, pruning, cardinality, obstacles)
+    upper_bound = max(makespan, upper_bound)
+
+    heuristic_plan = prioritized_plan(edges, agents, upper_bound, obstacles=obstacles)[0] if warm_start else None
+    if heuristic_plan is not None and not validate_plan(edges, agents, heuristic_plan):
+        # An invalid heuristic plan would be returned as found, the search starts cold instead
+        heuristic_plan = None
+    if heuristic_plan is not None:
+        upper_bound = heuristic_plan.shape[1] - 2
+        incremental_model.set_phase_hints(heuristic_plan)
+
+    initial_makespan = makespan
+    check, makespan, result, _ = search_makespan(incremental_model.solve, makespan, upper_bound, strategy)
+
+    if not check and heuristic_plan is not None:
+        # No plan is shorter than the heuristic one
+        memory_usage, number_of_conflicts, decisions = solver_statistics(incremental_model.solver.statistics())
+        print_plan(heuristic_plan)
+        paths, makespan = heuristic_plan, heuristic_plan.shape[1] - 1
+    elif not check:
+        return False, None, None, None, None, None, None
+    else:
+        _, _, memory_usage, number_of_conflicts, decisions, paths = result
+
+    if instance is not None and instance.trivial:
+        paths = instance.merge(paths)
+
+    # The plan is optimal when the makespans below it were refuted or the search started from the lower bound
+    if solutions is not None:
+        distance_index = DistanceIndex(edges)
+        lower_bound = max(distance_index.distance(pair[0], pair[1]) for pair in all_agents)
+        if makespan > initial_makespan or initial_makespan <= lower_bound:
+            solutions.store(edges, all_agents, paths, graph_hash=graph_hash)
+
+    return True, time.time() - start_time, memory_usage, number_of_conflicts, decisions, paths, paths.shape[1] - 1
@@ -0,0 +1,237 @@
+import contextlib
+import multiprocessing
+import os
+import queue
+import signal
+import time
+
+from solvers.model_smt import run_Z3_incremental
+from solvers.presolve import Presolve
+from utils.distances import DistanceIndex, graph_key
+
+"""
+This file contains a portfolio that races several solvers and configurations on the same instance, one process each.
+The first worker that proves an optimal plan wins and the others are terminated.
+
+See mapf_portfolio.py for a generic example.
+"""
+
+
+def z3_worker(edges, agents, lower_bound, upper_bound, **options):
+    """
+    Search the optimal makespan with the incremental SMT-based model.
+
+    :param edges: list of sets containing for each vertex its neighbors
+    :param agents: list of tuples containing origins and destinations
+    :param lower_bound: the maximum shortest path
+    :param upper_bound: the maximum makespan
+    :param options: keyword arguments of run_Z3_incremental, e.g. encoding and cardinality
+    :return True when an optimal plan has been found, its makespan and its paths
+    """
+
+    check, _, _, _, _, paths, makespan = run_Z3_incremental(edges, agents, lower_bound, upper_bound, **options)
+    return check, makespan, paths
+
+
+def cp_worker(edges, agents, min_shortest_path, upper_bound, solutions=None, presolve=True, parameters=None,
+              search_phases=False, warm_start=False, graph_hash=None):
+    """
+    Search the optimal makespan with the CP-based model, i.e. solving_MAPF followed by run_CPLEX with the number of
+    layers found. Both solve the agents left by the presolve, whose plan is merged with the paths of the removed ones.
+
+    :param edges: list of sets containing for each vertex its neighbors
+    :param agents: list of tuples containing origins and destinations
+    :param min_shortest_path: the minimum shortest path
+    :param upper_bound: the maximum makespan
+    :param solutions: a SolutionCache returning the stored optimal plan of the instance instead of searching it, and
+    storing the optimal plan found
+    :param presolve: True to reject first the infeasible instances and to remove the agents alone in their connected
+    component, see Presolve
+    :param parameters: the parameters of CP Optimizer used by each solve, see solver_parameters
+    :param search_phases: True to branch first on the shortest paths, see run_CPLEX
+    :param warm_start: True to start the search of the number of layers from a prioritized plan, see solving_MAPF
+    :param graph_hash: the hash of the graph passed to the SolutionCache, see SolutionCache.canonical
+    :return True when an optimal plan has been found, its makespan and its paths
+    """
+    from solvers.model_cp import run_CPLEX, solving_MAPF
+
+    if solutions is not None:
+        if graph_hash is None:
+            graph_hash = graph_key(edges)
+        makespan, paths = solutions.lookup(edges, agents, graph_hash=graph_hash)
+        if paths is not None and makespan <= upper_bound:
+            return True, makespan, paths
+
+    instance = None
+    all_agents = agents
+    if presolve:
+        instance = Presolve(edges, agents)
+        if not instance.feasible:
+            return False, None, None
+        if not instance.agents:
+            paths = instance.merge(None)
+            return True, paths.shape[1] - 1, paths
+        if instance.trivial:
+            agents = instance.agents
+            distance_index = DistanceIndex(edges)
+            min_shortest_path = min(distance_index.distance(pair[0], pair[1]) for pair in agents)
+
+    check, ret, num_layers, _, _, _, _, layers_paths = \
+        solving_MAPF(agents, edges, upper_bound, min_shortest_path, parameters, search_phases, warm_start,
+                     presolve=False)
+    if not check:
+        return False, None, None
+
+    check, makespan, _, _, _, _, paths = \
+        run_CPLEX(edges, agents, ret, num_layers, starting_paths=layers_paths, parameters=parameters,
+                  search_phases=search_phases)
+    if check and instance is not None and instance.trivial:
+        paths = instance.merge(paths)
+        makespan = paths.shape[1] - 1
+    if check and solutions is not None:
+        solutions.store(edges, all_agents, paths, graph_hash=graph_hash)
+    return check, makespan, paths
+
+
+# Configurations raced by default: name, solver, keyword arguments
+DEFAULT_PORTFOLIO = [
+    ("z3-boolean-pb", "z3", dict(encoding="boolean", cardinality="pb")),
+    ("z3-boolean-sequential", "z3", dict(encoding="boolean", cardinality="sequential")),
+    ("z3-boolean-arithmetic", "z3", dict(encoding="boolean", cardinality="arithmetic")),
+    ("z3-functions-pb", "z3", dict(encoding="functions", cardinality="pb")),
+    ("cp", "cp", dict()),
+    ("cp-phases", "cp", dict(search_phases=True)),
+]
+
+
+def _run_worker(name, solver, arguments, options, results):
+    """
+    Entry point of the processes of the portfolio: run a solver with the output suppressed and send its result. The
+    worker leads its own process group, which also contains the cpoptimizer process started by docplex, so that
+    _terminate_worker stops both.
+    """
+
+    if hasattr(os, "setpgid"):
+        os.setpgid(0, 0)
+
+    start_time = time.time()
+    try:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            worker = z3_worker if solver == "z3" else cp_worker
+            check, makespan, paths = worker(*arguments, **options)
+        results.put((name, "optimal" if check else "failed", time.time() - start_time, makespan, paths))
+    except Exception as e:
+        results.put((name, "error: %s" % e, time.time() - start_time, None, None))
+
+
+def _terminate_worker(process):
+    """
+    Terminate a worker of the portfolio together with the processes it started, i.e. its process group.
+    """
+
+    try:
+        if hasattr(os, "killpg"):
+            os.killpg(process.pid, signal.SIGTERM)
+        else:
+            process.terminate()
+    except ProcessLookupError:
+        # The worker has not created its group yet
+        process.terminate()
+    process.join()
+
+
+def run_portfolio(edges, agents, upper_bound, configurations=None, processes=None, solutions=None, graph_hash=None):
+    """
+    Race the configurations of the portfolio on an instance and return the first optimal plan.
+
+    :param edges: list of sets containing for each vertex (whose identifier is the index of this list) its neighbors
+    :param agents: list of tuples containing origins and destinations
+    :param upper_bound: the maximum makespan
+    :param configurations: list of tuples (name, solver, options) where solver is "z3" or "cp" and options are the
+    keyword arguments of run_Z3_incremental or cp_worker, DEFAULT_PORTFOLIO when None
+    :param processes: the maximum number of workers running at the same time, by default the number of CPUs
+    :param solutions: a SolutionCache checked before starting the workers, where the winning plan is stored
+    :param graph_hash: the hash of the graph passed to the SolutionCache, see SolutionCache.canonical
+    :return True when an optimal plan has been found, the name of the winning configuration, "cache" for a stored plan
+    and "presolve" when no agent is left by the presolve, the makespan, the paths and a dictionary containing for each
+    configuration its outcome and the seconds it ran
+    """
+
+    if solutions is not None:
+        if graph_hash is None:
+            graph_hash = graph_key(edges)
+        makespan, paths = solutions.lookup(edges, agents, graph_hash=graph_hash)
+        if paths is not None and makespan <= upper_bound:
+            return True, "cache", makespan, paths, dict()
+
+    if configurations is None:
+        configurations = DEFAULT_PORTFOLIO
+    if processes is None:
+        processes = os.cpu_count() or 1
+
+    # The workers race on the agents left by the presolve, done once here
+    instance = Presolve(edges, agents)
+    if not instance.feasible:
+        return False, None, None, None, dict()
+    if not instance.agents:
+        paths = instance.merge(None)
+        return True, "presolve", paths.shape[1] - 1, paths, dict()
+
+    distance_index = DistanceIndex(edges)
+    shortest_paths = [distance_index.distance(origin, destination) for origin, destination in instance.agents]
+    arguments = {"z3": (edges, instance.agents, max(shortest_paths), upper_bound),
+                 "cp": (edges, instance.agents, min(shortest_paths), upper_bound)}
+
+    results = multiprocessing.Queue()
+    pending = list(configurations)
+    running = dict()
+    timings = dict()
+    winner = None
+
+    while (pending or running) and winner is None:
+        # Start new workers while there are free processes
+        while pending and len(running) < processes:
+            name, solver, options = pending.pop(0)
+            process = multiprocessing.Process(target=_run_worker,
+                                              args=(name, solver, arguments[solver], dict(options, presolve=False),
+                                                    results),
+                                              daemon=True)
+            process.start()
+            running[name] = (process, time.time())
+
+        try:
+            name, outcome, elapsed_time, makespan, paths = results.get(timeout=0.1)
+        except queue.Empty:
+            # Detect workers terminated without sending a result, e.g. killed by the operating system
+            for name, (process, start_time) in list(running.items()):
+                if not process.is_alive() and results.empty():
+                    timings[name] = ("crashed", time.time() - start_time)
+                    del running[name]
+            continue
+
+        running.pop(name)[0].join()
+        timings[name] = (outcome, elapsed_time)
+        print("%s: %s in %.3f s" % (name, outcome, elapsed_time))
+
+        if outcome == "optimal":
+            winner = (name, makespan, paths)
+
+    # Stop the workers still running
+    for name, (process, start_time) in running.items():
+        _terminate_worker(process)
+        timings[name] = ("terminated", time.time() - start_time)
+    for name, _, _ in pending:
+        timings[name] = ("not started", 0.0)
+
+    if winner is None:
+        return False, None, None, None, timings
+
+    name, makespan, paths = winner
+    if instance.trivial:
+        paths = instance.merge(paths)
+        makespan = paths.shape[1] - 1
+
+    if solutions is not None:
+        solutions.store(edges, agents, paths, graph_hash=graph_hash)
+
+    return True, name, makespan, paths, timings
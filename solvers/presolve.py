@@ -0,0 +1,151 @@
+import time
+
+from utils.distances import DistanceIndex
+from utils.plans import empty_plan
+
+"""
+This file contains the presolve run in front of the solvers. It rejects in a single traversal of the graph the
+instances that have no plan, which the solvers would otherwise only detect after a full solve for each makespan or
+number of layers up to the upper bound:
+
+- an agent whose destination is in a different connected component from its origin
+- two agents starting or ending on the same vertex
+- a connected component without cycles whose vertices are all occupied by agents, some not on their destinations: an
+  agent moves only to a vertex left at the same time step, so the agents can only rotate along a cycle
+
+An agent alone in its component never meets the others, so it is removed from the instance and follows a shortest path:
+the solvers plan the remaining agents and merge adds the removed ones back. The graph is undirected, as the ones built
+by environments.
+"""
+
+
+def components(edges, roots):
+    """
+    Label the connected components of the graph containing some vertices, with a depth-first search from each vertex.
+
+    :param edges: list of sets containing for each vertex its neighbors
+    :param roots: the vertices whose components are labelled
+    :return: the list containing for each vertex its component, -1 when not labelled, the list of the number of
+    vertices of each component and the list of the number of its arcs, self-loops excluded
+    """
+
+    labels = [-1] * len(edges)
+    sizes = []
+    arcs = []
+
+    for root in roots:
+        if labels[root] >= 0:
+            continue
+
+        label = len(sizes)
+        labels[root] = label
+        frontier = [root]
+        size = 0
+        degrees = 0
+        while frontier:
+            vertex = frontier.pop()
+            size += 1
+            for neighbor in edges[vertex]:
+                if neighbor != vertex:
+                    degrees += 1
+                if labels[neighbor] < 0:
+                    labels[neighbor] = label
+                    frontier.append(neighbor)
+        sizes.append(size)
+        arcs.append(degrees)
+
+    return labels, sizes, arcs
+
+
+class Presolve:
+    """
+    The outcome of the presolve of an instance: whether it is feasible and the agents left to the solvers.
+    """
+
+    def __init__(self, edges, agents, verbose=True):
+        """
+        :param edges: list of sets containing for each vertex its neighbors
+        :param agents: list of tuples containing origins and destinations
+        :param verbose: True to print the outcome and the time of the presolve
+        """
+
+        start_time = time.time()
+        self.agents_len = len(agents)
+
+        labels, sizes, arcs = components(edges, [pair[0] for pair in agents])
+        agents_per_component = [0] * len(sizes)
+        for origin, _ in agents:
+            agents_per_component[labels[origin]] += 1
+
+        self.reason = self._infeasibility(agents, labels, sizes, arcs, agents_per_component)
+        self.feasible = self.reason is None
+
+        # Agents left to the solvers, in their order, and paths of the ones removed
+        self.kept = list(range(self.agents_len))
+        self.trivial = dict()
+        if self.feasible:
+            distance_index = DistanceIndex(edges)
+            self.kept = [agent for agent, pair in enumerate(agents) if agents_per_component[labels[pair[0]]] > 1]
+            self.trivial = dict((agent, distance_index.path(pair[0], pair[1])) for agent, pair in enumerate(agents)
+                                if agents_per_component[labels[pair[0]]] == 1)
+
+        self.agents = [agents[agent] for agent in self.kept]
+        self.time = time.time() - start_time
+
+        if verbose:
+            if not self.feasible:
+                print("Presolve in %.3f ms: infeasible, %s" % (self.time * 1000, self.reason))
+            else:
+                print("Presolve in %.3f ms: %d trivial agents removed, %d agents left" %
+                      (self.time * 1000, len(self.trivial), len(self.kept)))
+
+    @staticmethod
+    def _infeasibility(agents, labels, sizes, arcs, agents_per_component):
+        """
+        :return: the reason why the instance has no plan, None when no check fails
+        """
+
+        for agent, (origin, destination) in enumerate(agents):
+            if labels[destination] != labels[origin]:
+                return "the destination %d of the agent %d is not reachable from its origin %d" % \
+                       (destination, agent, origin)
+
+        for position, name in ((0, "origin"), (1, "destination")):
+            occupied = dict()
+            for agent, pair in enumerate(agents):
+                if pair[position] in occupied:
+                    return "the agents %d and %d have the same %s %d" % \
+                           (occupied[pair[position]], agent, name, pair[position])
+                occupied[pair[position]] = agent
+
+        # A tree has one edge less than its vertices, each edge is stored as two arcs
+        for agent, (origin, destination) in enumerate(agents):
+            label = labels[origin]
+            if origin != destination and agents_per_component[label] == sizes[label] and \
+                    arcs[label] == 2 * (sizes[label] - 1):
+                return "the agents fill a connected component without cycles, the agent %d can not leave its " \
+                       "origin %d" % (agent, origin)
+
+        return None
+
+    def merge(self, plan):
+        """
+        Build the plan of the whole instance from the plan of the agents left to the solvers. The agents wait on their
+        destinations until the end of the longest path.
+
+        :param plan: the plan of the agents in self.agents, None when no agent is left
+        :return: the plan of all the agents
+        """
+
+        paths = [list(self.trivial[agent]) for agent in sorted(self.trivial)]
+        length = max([len(path) for path in paths] + ([plan.shape[1]] if plan is not None else []))
+
+        merged = empty_plan(self.agents_len, length - 1)
+        if plan is not None:
+            merged[self.kept, :plan.shape[1]] = plan
+            merged[self.kept, plan.shape[1]:] = plan[:, -1:]
+        for agent, path in zip(sorted(self.trivial), paths):
+            merged[agent, :len(path)] = path
+            merged[agent, len(path):] = path[-1]
+
+        return merged
@@ -0,0 +1,247 @@
+import heapq
+import random
+import time
+
+from utils.distances import UNREACHABLE, DistanceIndex
+from utils.graph import CSRGraph
+from utils.plans import empty_plan, print_plan
+
+"""
+This file contains a prioritized planner: the agents are planned one at a time, by decreasing priority, each one with
+an A* search in the space-time graph that avoids the vertices and arcs reserved by the agents already planned. The
+planner is fast but incomplete: it scales to hundreds of agents, it is used as fallback when the exact solvers time out
+and to warm start them.
+
+See mapf_prioritized.py for a generic example.
+"""
+
+# Orders in which the agents are planned
+# - index: the order of the list of agents
+# - longest: by decreasing length of the shortest path, the agents with farther destinations are planned first
+# - shortest: by increasing length of the shortest path, the agents that park early are planned first
+# - random: a random permutation, see the seed of run_prioritized
+ORDERINGS = ("index", "longest", "shortest", "random")
+
+
+class ReservationTable:
+    """
+    The vertices and arcs used by the agents already planned. A vertex at a time step and an arc traversed from a time
+    step are both stored as a single integer in a set, and the destinations where the agents park as the time step
+    from which they are occupied forever.
+    """
+
+    def __init__(self, edges_len):
+        """
+        :param edges_len: the number of vertices
+        """
+
+        self.edges_len = edges_len
+        self.vertices = set()
+        self.arcs = set()
+        self.parked = dict()
+        # The last time step in which each vertex is reserved by a moving agent
+        self.last_reserved = dict()
+
+    def _vertex_key(self, vertex, time):
+        return time * self.edges_len + vertex
+
+    def _arc_key(self, vertex, neighbor, time):
+        return (time * self.edges_len + vertex) * self.edges_len + neighbor
+
+    def reserve(self, path):
+        """
+        Reserve the path of an agent, which parks on its last vertex.
+
+        :param path: the vertices occupied by the agent at each time step
+        """
+
+        for step, vertex in enumerate(path):
+            self.vertices.add(self._vertex_key(vertex, step))
+            self.last_reserved[vertex] = max(self.last_reserved.get(vertex, -1), step)
+            if step > 0 and path[step - 1] != vertex:
+                self.arcs.add(self._arc_key(path[step - 1], vertex, step - 1))
+
+        self.parked[path[-1]] = len(path) - 1
+
+    def is_free(self, vertex, neighbor, time):
+        """
+        Check if an agent can move from vertex at time to neighbor at time + 1.
+
+        :return: False when neighbor is occupied at time + 1 or another agent traverses the same edge in the opposite
+        direction
+        """
+
+        if self.is_occupied(neighbor, time + 1):
+            return False
+
+        return vertex == neighbor or self._arc_key(neighbor, vertex, time) not in self.arcs
+
+    def is_occupied(self, vertex, time):
+        """
+        Check if a vertex is reserved at a time step, either by a moving agent or by one parked on it.
+        """
+
+        return self._vertex_key(vertex, time) in self.vertices or \
+            (vertex in self.parked and self.parked[vertex] <= time)
+
+    def can_park(self, vertex, time):
+        """
+        Check if an agent can stay on a vertex forever from a time step.
+        """
+
+        return self.last_reserved.get(vertex, -1) < time and vertex not in self.parked
+
+
+def space_time_astar(edges, origin, destination, distances, reservations, horizon):
+    """
+    Search the earliest arrival of an agent at its destination avoiding the reservations. The states are the pairs
+    (vertex, time step), the heuristic is the distance to the destination.
+
+    :param edges: list containing for each vertex its neighbors, e.g. the lists of CSRGraph.to_lists
+    :param origin: the origin of the agent
+    :param destination: the destination of the agent
+    :param distances: the distance of each vertex to the destination, a list is read faster than an array
+    :param reservations: the ReservationTable of the agents already planned
+    :param horizon: the maximum makespan
+    :return: the path of the agent, None when it does not exist, and the number of states expanded
+    """
+
+    # The origin is reserved at time 0 by another agent starting there
+    if reservations.is_occupied(origin, 0):
+        return None, 0
+
+    parents = {(origin, 0): None}
+    # Ties on f are broken in favour of the later time steps, i.e. the states closer to the destination
+    frontier = [(int(distances[origin]), 0, origin)]
+    expanded = 0
+
+    while frontier:
+        _, negative_time, vertex = heapq.heappop(frontier)
+        time = -negative_time
+        expanded += 1
+
+        if vertex == destination and reservations.can_park(vertex, time):
+            path = []
+            state = (vertex, time)
+            while state is not None:
+                path.append(state[0])
+                state = parents[state]
+            return path[::-1], expanded
+
+        for neighbor in edges[vertex]:
+            state = (neighbor, time + 1)
+            if state in parents or distances[neighbor] == UNREACHABLE or time + 1 + distances[neighbor] > horizon:
+                continue
+            if not reservations.is_free(vertex, neighbor, time):
+                continue
+
+            parents[state] = (vertex, time)
+            heapq.heappush(frontier, (time + 1 + int(distances[neighbor]), -(time + 1), neighbor))
+
+    return None, expanded
+
+
+def priority_order(edges, agents, ordering="index", seed=None):
+    """
+    Sort the agents by priority.
+
+    :param edges: list of sets containing for each vertex its neighbors
+    :param agents: list of tuples containing origins and destinations
+    :param ordering: one of ORDERINGS or a list containing the agents from the highest priority to the lowest
+    :param seed: the seed of the random ordering
+    :return: the list of agents from the highest priority to the lowest
+    """
+
+    if not isinstance(ordering, str):
+        if sorted(ordering) != list(range(len(agents))):
+            raise ValueError("The ordering must be a permutation of the agents")
+        return list(ordering)
+
+    if ordering not in ORDERINGS:
+        raise ValueError("The ordering must be one of %s" % ", ".join(ORDERINGS))
+
+    order = list(range(len(agents)))
+    if ordering == "random":
+        random.Random(seed).shuffle(order)
+    elif ordering != "index":
+        distance_index = DistanceIndex(edges)
+        lengths = [distance_index.distance(origin, destination) for origin, destination in agents]
+        order.sort(key=lambda agent: lengths[agent], reverse=ordering == "longest")
+
+    return order
+
+
+def prioritized_plan(edges, agents, horizon, ordering="index", seed=None, obstacles=None):
+    """
+    Plan the agents one at a time, the agents with higher priority have the precedence.
+
+    :param edges: list of sets containing for each vertex (whose identifier is the index of this list) its neighbors
+    :param agents: list of tuples containing origins and destinations
+    :param horizon: the maximum makespan
+    :param ordering: one of ORDERINGS or a list containing the agents from the highest priority to the lowest
+    :param seed: the seed of the random ordering
+    :param obstacles: the plan of other agents whose paths are fixed, reserved before planning the agents
+    :return: a plan, i.e. an int32 array of shape (agents, makespan + 1), None when some agent can not be planned, and
+    the number of states expanded
+    """
+
+    distance_index = DistanceIndex(edges)
+    # The search reads the neighbors and the distances from lists
+    adjacency = CSRGraph.from_edges(edges).to_lists()
+    reservations = ReservationTable(len(edges))
+    if obstacles is not None:
+        for path in obstacles:
+            reservations.reserve(path.tolist())
+    paths = [None] * len(agents)
+    expanded = 0
+
+    for agent in priority_order(edges, agents, ordering, seed):
+        origin, destination = agents[agent]
+        path, agent_expanded = space_time_astar(adjacency, origin, destination,
+                                                distance_index.to_goal(destination).tolist(), reservations, horizon)
+        expanded += agent_expanded
+        if path is None:
+            return None, expanded
+
+        reservations.reserve(path)
+        paths[agent] = path
+
+    plan = empty_plan(len(agents), max(len(path) for path in paths) - 1)
+    for agent, path in enumerate(paths):
+        plan[agent, :len(path)] = path
+        plan[agent, len(path):] = path[-1]
+
+    print("Prioritized plan with makespan %d" % (plan.shape[1] - 1))
+
+    return plan, expanded
+
+
+def run_prioritized(edges, agents, upper_bound, ordering="longest", restarts=0, seed=None):
+    """
+    Search a plan with prioritized planning. When the ordering fails, up to restarts random orderings are tried.
+
+    :param edges: list of sets containing for each vertex (whose identifier is the index of this list) its neighbors
+    :param agents: list of tuples containing origins and destinations
+    :param upper_bound: the maximum makespan
+    :param ordering: one of ORDERINGS or a list containing the agents from the highest priority to the lowest
+    :param restarts: the number of random orderings tried after the first one
+    :param seed: the seed of the random orderings
+    :return True when a plan has been found, total time spent, memory usage, number of conflicts and decisions, paths
+    is a plan, i.e. an int32 array of shape (agents, makespan + 1), and the makespan of the plan. The planner does not
+    backtrack: memory usage and conflicts are None, decisions is the number of states expanded by A*.
+    """
+
+    start_time = time.time()
+    rng = random.Random(seed)
+    decisions = 0
+
+    for attempt in range(restarts + 1):
+        plan, expanded = prioritized_plan(edges, agents, upper_bound, ordering if attempt == 0 else "random",
+                                          seed if attempt == 0 else rng.random())
+        decisions += expanded
+
+        if plan is not None:
+            print_plan(plan)
+            return True, time.time() - start_time, None, None, decisions, plan, plan.shape[1] - 1
+
+    return False, None, None, None, None, None, None
@@ -2,7 +2,7 @@ from utils.environments import *
 from solvers.model_cp import solving_MAPF, run_CPLEX
 import networkx as nx
 import matplotlib.pyplot as plt
-from solvers.model_smt import run_Z3
+from solvers.model_smt import run_Z3_incremental
 
 """
 Run this file to replicate the experiment described in Synchronization and collision avoidance subsection of the report.
@@ -16,27 +16,20 @@ UPPER_BOUND = 1
 graph = nx.uniform_random_intersection_graph(len(edges), len(edges), 1)
 min_shortest_path, makespan = min_max_shortest_path(graph, agents)
 
-print("ENVIRONMENT: ")
-[print(str(node) + ": " + str(neighbors)) for node, neighbors in enumerate(edges)]
-print("AGENTS: ")
-print(agents)
+print_environment(edges, agents)
 
 sep = "=" * 50
 print(sep)
 print("Z3")
-check, _, _, _, _, _ = run_Z3(edges, agents, makespan)
+check, _, _, _, _, _, makespan = run_Z3_incremental(edges, agents, makespan, UPPER_BOUND)
 
-while not check and makespan <= UPPER_BOUND:
-    makespan += 1
-    check, _, _, _, _, _ = run_Z3(edges, agents, makespan)
-
-if not check and makespan >= UPPER_BOUND:
+if not check:
     print("Unsatisfiable")
 
 print(sep)
 print("CPLEX")
 print("Step 1) Searching for optimal number of layers")
-check, RET, num_layers, _, _, _, _ = \
+check, RET, num_layers, _, _, _, _, layers_paths = \
     solving_MAPF(agents, edges, UPPER_BOUND, min_shortest_path)
 
 print(sep)
@@ -44,7 +37,7 @@ print("Step 2) Solving with %d layers" % num_layers)
 print(sep)
 if check:
     _, mksp, _, _, _, _, _ = \
-        run_CPLEX(edges, agents, RET, num_layers)
+        run_CPLEX(edges, agents, RET, num_layers, starting_paths=layers_paths)
 else:
     print("Unsatisfiable")
 
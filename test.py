@@ -1,7 +1,7 @@
 import numpy as np
 import matplotlib.pyplot as plt
 
-from solvers.model_smt import run_Z3
+from solvers.model_smt import run_Z3_incremental
 from solvers.model_cp import run_CPLEX, solving_MAPF
 from utils.environments import *
 
@@ -14,6 +14,8 @@ of the graph and the number of agents.
 MIN_SIZE = 2
 MAX_SIZE = 5
 SEED = 42
+# Encoding used by Z3, "boolean" or "functions"
+ENCODING = "boolean"
 
 
 def extensive_test(num_agents):
@@ -46,7 +48,8 @@ def extensive_test(num_agents):
 
         print(sep)
         try:
-            agents, edges, graph = environments(nx.grid_2d_graph, number_of_agents, SEED, n=size, m=size)
+            agents, edges, graph = environments(nx.grid_2d_graph, number_of_agents, SEED, n=size, m=size,
+                                                verbose=False)
 
             min_shortest_path, max_shortest_path = min_max_shortest_path(graph, agents)
 
@@ -61,13 +64,10 @@ def extensive_test(num_agents):
         # Z3
         print(sep)
         print("Z3")
-        check, solve_time, memory_usage, number_of_conflicts, decisions, _ = run_Z3(edges, agents, makespan)
+        check, solve_time, memory_usage, number_of_conflicts, decisions, _, makespan = \
+            run_Z3_incremental(edges, agents, makespan, upper_bound, ENCODING)
 
-        while not check and makespan <= upper_bound:
-            makespan += 1
-            check, solve_time, memory_usage, number_of_conflicts, decisions, _ = run_Z3(edges, agents, makespan)
-
-        if not check and makespan >= upper_bound:
+        if not check:
             print("Unsatisfiable")
 
         time_Z3.append(solve_time)
@@ -80,13 +80,13 @@ def extensive_test(num_agents):
         print(sep)
         print("CPLEX")
         print("\nStep 1) Searching for optimal number of layers\n")
-        check, ret, num_layers, solve_time, memory_usage, _, _ = \
+        check, ret, num_layers, solve_time, memory_usage, _, _, layers_paths = \
             solving_MAPF(agents, edges, upper_bound, min_shortest_path)
 
         print("\nStep 2) Solving with %d layers\n" % num_layers)
         if check:
             _, _, solve_time, memory_usage, _, _, _ = \
-                run_CPLEX(edges, agents, ret, num_layers)
+                run_CPLEX(edges, agents, ret, num_layers, starting_paths=layers_paths)
         else:
             print("CPLEX: unsatisfiable")
 
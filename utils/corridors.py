@@ -0,0 +1,129 @@
+import numpy as np
+
+"""
+This file contains the contraction of the corridors of a graph, e.g. the aisles of the warehouses and the corridors of
+the dungeons. A corridor is a maximal chain of at least two cells with exactly two neighbors, not adjacent to each
+other and none of them the origin or the destination of an agent, between two junctions, i.e. vertices with at least
+three neighbors, or dead ends. Room corners and doorways of a single cell are not corridors. The chain is replaced by a
+single arc in both directions whose length is the number of steps needed to traverse it. The CP model (run_CPLEX with
+weights) then creates intervals for the endpoints only, so its size shrinks in proportion to the length of the
+corridors.
+
+The contraction is a heuristic, not an exact reduction: a contracted corridor has capacity 1, a single agent traverses
+it at a time, without waiting inside or following another agent, so the optimal makespan of the contracted instance is
+only an upper bound of the original one. The plans found are expanded back to the cells of the original graph with
+expand.
+"""
+
+
+class CorridorContraction:
+    """
+    The contracted instance of a graph and its agents, with the mapping between the vertices of the two graphs.
+    """
+
+    def __init__(self, edges, agents):
+        """
+        :param edges: list of sets containing for each vertex its neighbors
+        :param agents: list of tuples containing origins and destinations
+        """
+
+        edges_len = len(edges)
+        neighbors = [edges[vertex].difference({vertex}) for vertex in range(edges_len)]
+        endpoints = set(vertex for pair in agents for vertex in pair)
+
+        # The cells of a corridor have two neighbors, reached in both directions and not adjacent to each other
+        internal = [len(neighbors[vertex]) == 2 and vertex not in endpoints and
+                    all(vertex in edges[neighbor] for neighbor in neighbors[vertex]) and
+                    not any(neighbor in edges[other] for neighbor in neighbors[vertex]
+                            for other in neighbors[vertex].difference({neighbor}))
+                    for vertex in range(edges_len)]
+
+        # Cells of each contracted corridor, in order from its first endpoint to the second one
+        corridors = dict()
+        contracted = [False] * edges_len
+
+        for vertex in range(edges_len):
+            # A corridor starts from a junction or a dead end
+            if internal[vertex] or len(neighbors[vertex]) == 2:
+                continue
+
+            for first in sorted(neighbors[vertex]):
+                if not internal[first] or contracted[first]:
+                    continue
+
+                # A chain started from a vertex outside a corridor ends on such a vertex
+                cells = []
+                previous, current = vertex, first
+                while internal[current]:
+                    cells.append(current)
+                    previous, current = current, next(iter(neighbors[current].difference({previous})))
+
+                # Single cells, chains not ending on a junction or a dead end, loops and arcs parallel to an existing
+                # one are not contracted, their cells remain vertices
+                if len(cells) < 2 or len(neighbors[current]) == 2 or current == vertex or \
+                        current in neighbors[vertex] or (vertex, current) in corridors:
+                    continue
+
+                for cell in cells:
+                    contracted[cell] = True
+                corridors[(vertex, current)] = cells
+                corridors[(current, vertex)] = cells[::-1]
+
+        # The vertices that remain are numbered in order
+        self.vertices = np.flatnonzero(np.logical_not(contracted)).astype(np.int32)
+        self.index = np.full(edges_len, -1, dtype=np.int32)
+        self.index[self.vertices] = np.arange(len(self.vertices), dtype=np.int32)
+
+        index = self.index.tolist()
+        self.edges = [set(index[neighbor] for neighbor in edges[vertex] if index[neighbor] >= 0)
+                      for vertex in self.vertices.tolist()]
+        for vertex, neighbor in corridors:
+            self.edges[index[vertex]].add(index[neighbor])
+
+        self.agents = [(index[origin], index[destination]) for origin, destination in agents]
+        self.corridors = dict(((index[vertex], index[neighbor]), cells)
+                              for (vertex, neighbor), cells in corridors.items())
+        # Traversing a corridor takes a step for each cell plus the step to its second endpoint
+        self.weights = dict((arc, len(cells) + 1) for arc, cells in self.corridors.items())
+
+    def removed(self):
+        """
+        :return: the number of cells removed from the graph
+        """
+
+        return len(self.index) - len(self.vertices)
+
+    def expand(self, plan):
+        """
+        Convert a plan of the contracted instance into a plan of the original one, where the time steps spent in the
+        corridors, marked with -1, visit their cells.
+
+        :param plan: the plan of the contracted instance, e.g. returned by run_CPLEX with weights
+        :return: the plan of the original instance, with the same shape
+        :raise ValueError when the plan does not traverse the corridors along their arcs and in their length
+        """
+
+        expanded = np.where(plan >= 0, self.vertices[np.maximum(plan, 0)], -1).astype(np.int32)
+
+        for agent, path in enumerate(plan.tolist()):
+            time = 0
+            while time < len(path):
+                if path[time] >= 0:
+                    time += 1
+                    continue
+
+                # The gap between the vertex left at time - 1 and the next one reached
+                end = time
+                while end < len(path) and path[end] < 0:
+                    end += 1
+                if time == 0 or end == len(path):
+                    raise ValueError("The agent %d is in a corridor at the beginning or at the end of the plan" % agent)
+
+                cells = self.corridors.get((path[time - 1], path[end]))
+                if cells is None or len(cells) != end - time:
+                    raise ValueError("The agent %d does not traverse a corridor from %d to %d in %d steps" %
+                                     (agent, path[time - 1], path[end], end - time + 1))
+                expanded[agent, time:end] = cells
+                time = end
+
+        return expanded
@@ -0,0 +1,248 @@
+import hashlib
+import heapq
+from collections import OrderedDict
+
+import numpy as np
+
+from utils.graph import CSRGraph
+
+"""
+This file contains the distance index shared by the solvers and the utilities: breadth-first search distances rooted
+at a goal (distance of each vertex to the goal) or at a source (distance of each vertex from the source), computed
+once for each graph and root and kept in a LRU cache keyed by a hash of the graph.
+
+Distances are NumPy int32 arrays, UNREACHABLE marks the vertices not connected to the root. The graphs are the lists of
+sets used by the solvers or CSRGraph objects, whose searches expand each frontier with NumPy operations.
+"""
+
+UNREACHABLE = -1
+
+# Maximum number of distance arrays kept in the cache
+CACHE_SIZE = 4096
+
+_cache = OrderedDict()
+_statistics = {"hits": 0, "misses": 0}
+
+
+def graph_key(edges, self_loops=True):
+    """
+    Compute a hash identifying a graph.
+
+    :param edges: list of sets containing for each vertex (whose identifier is the index of this list) its neighbors,
+    or a CSRGraph
+    :param self_loops: False to ignore the self-loops, which do not change the distances: the adjacency of a NetworkX
+    graph and the edges of the solvers, where every vertex is a neighbor of itself, then have the same hash
+    :return: a hexadecimal string
+    """
+
+    if isinstance(edges, CSRGraph):
+        return edges.key(self_loops)
+
+    digest = hashlib.sha1()
+    for vertex, neighbors in enumerate(edges):
+        digest.update(np.array(sorted(neighbors if self_loops else set(neighbors).difference({vertex})),
+                               dtype=np.int32).tobytes())
+        digest.update(b";")
+
+    return digest.hexdigest()
+
+
+def bfs_distances(edges, root):
+    """
+    Compute with a breadth-first search the distance of each vertex from a root.
+
+    :param edges: list of sets containing for each vertex its neighbors, or a CSRGraph
+    :param root: the root vertex
+    :return: an int32 array containing for each vertex its distance from the root, UNREACHABLE when not connected
+    """
+
+    if isinstance(edges, CSRGraph):
+        return csr_bfs_distances(edges, root)
+
+    distances = [UNREACHABLE] * len(edges)
+    distances[root] = 0
+    frontier = [root]
+    depth = 0
+
+    while frontier:
+        depth += 1
+        next_frontier = []
+        for vertex in frontier:
+            for neighbor in edges[vertex]:
+                if distances[neighbor] == UNREACHABLE:
+                    distances[neighbor] = depth
+                    next_frontier.append(neighbor)
+        frontier = next_frontier
+
+    return np.array(distances, dtype=np.int32)
+
+
+def csr_bfs_distances(graph, root):
+    """
+    Compute the distance of each vertex from a root with a breadth-first search expanding a whole frontier at a time.
+
+    :param graph: the CSRGraph
+    :param root: the root vertex
+    :return: an int32 array containing for each vertex its distance from the root, UNREACHABLE when not connected
+    """
+
+    distances = np.full(len(graph), UNREACHABLE, dtype=np.int32)
+    distances[root] = 0
+    frontier = np.array([root], dtype=np.int32)
+    depth = 0
+
+    while frontier.size:
+        depth += 1
+        neighbors = graph.gather(frontier)
+        frontier = np.unique(neighbors[distances[neighbors] == UNREACHABLE])
+        distances[frontier] = depth
+
+    return distances
+
+
+def weighted_distances(edges, root, weights, reverse=False):
+    """
+    Compute with Dijkstra's algorithm the distance of each vertex from a root, or to it, when the arcs have lengths,
+    e.g. the corridors contracted by CorridorContraction. The distances are not cached, since the hash of the graph
+    does not include the lengths.
+
+    :param edges: list of sets containing for each vertex its neighbors
+    :param root: the root vertex
+    :param weights: dictionary containing the length of the arcs (x,y) longer than 1
+    :param reverse: True to compute the distance of each vertex to the root
+    :return: an int32 array containing for each vertex its distance, UNREACHABLE when not connected
+    """
+
+    if reverse:
+        adjacency = [[] for _ in range(len(edges))]
+        for vertex, neighbors in enumerate(edges):
+            for neighbor in neighbors:
+                adjacency[neighbor].append((vertex, weights.get((vertex, neighbor), 1)))
+    else:
+        adjacency = [[(neighbor, weights.get((vertex, neighbor), 1)) for neighbor in neighbors]
+                     for vertex, neighbors in enumerate(edges)]
+
+    distances = [UNREACHABLE] * len(edges)
+    queue = [(0, root)]
+
+    while queue:
+        distance, vertex = heapq.heappop(queue)
+        if distances[vertex] != UNREACHABLE:
+            continue
+        distances[vertex] = distance
+        for neighbor, length in adjacency[vertex]:
+            if distances[neighbor] == UNREACHABLE:
+                heapq.heappush(queue, (distance + length, neighbor))
+
+    return np.array(distances, dtype=np.int32)
+
+
+def cache_info():
+    """
+    Return the statistics of the distance cache.
+
+    :return: a dictionary with the number of hits, misses and cached arrays
+    """
+
+    return {"hits": _statistics["hits"], "misses": _statistics["misses"], "size": len(_cache)}
+
+
+def clear_cache():
+    """
+    Empty the distance cache and reset its statistics.
+    """
+
+    _cache.clear()
+    _statistics["hits"] = 0
+    _statistics["misses"] = 0
+
+
+class DistanceIndex:
+    """
+    Access point to the cached distances of a graph. The hash of the graph is computed once when the index is created.
+    """
+
+    def __init__(self, edges):
+        """
+        :param edges: list of sets containing for each vertex (whose identifier is the index of this list) its
+        neighbors, or a CSRGraph
+        """
+
+        self.edges = edges
+        # The distances are shared by the graphs that differ only in their self-loops
+        self.key = graph_key(edges, self_loops=False)
+        self._predecessors = None
+
+    def _lookup(self, direction, root, adjacency):
+        key = (self.key, direction, root)
+        if key in _cache:
+            _statistics["hits"] += 1
+            _cache.move_to_end(key)
+            return _cache[key]
+
+        _statistics["misses"] += 1
+        distances = bfs_distances(adjacency(), root)
+        # The arrays are shared, they must not be modified by the callers
+        distances.setflags(write=False)
+        _cache[key] = distances
+        if len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+
+        return distances
+
+    def _reverse(self):
+        if self._predecessors is None and isinstance(self.edges, CSRGraph):
+            sources, targets = self.edges.arcs()
+            self._predecessors = CSRGraph.from_arcs(len(self.edges), targets, sources, self.edges.self_loops)
+        elif self._predecessors is None:
+            self._predecessors = [set() for _ in range(len(self.edges))]
+            for vertex, neighbors in enumerate(self.edges):
+                for neighbor in neighbors:
+                    self._predecessors[neighbor].add(vertex)
+
+        return self._predecessors
+
+    def from_source(self, source):
+        """
+        :param source: the source vertex
+        :return: the distance of each vertex from the source
+        """
+
+        return self._lookup("source", int(source), lambda: self.edges)
+
+    def to_goal(self, goal):
+        """
+        :param goal: the goal vertex
+        :return: the distance of each vertex to the goal
+        """
+
+        return self._lookup("goal", int(goal), self._reverse)
+
+    def distance(self, source, goal):
+        """
+        :param source: the source vertex
+        :param goal: the goal vertex
+        :return: the length of the shortest path from source to goal, UNREACHABLE when it does not exist
+        """
+
+        return int(self.to_goal(goal)[source])
+
+    def path(self, source, goal):
+        """
+        Compute a shortest path following the decreasing distances to the goal, the smallest vertex is chosen on ties.
+
+        :param source: the source vertex
+        :param goal: the goal vertex
+        :return: the list of vertices from source to goal, None when goal is not reachable
+        """
+
+        distances = self.to_goal(goal)
+        if distances[source] == UNREACHABLE:
+            return None
+
+        path = [int(source)]
+        while path[-1] != goal:
+            path.append(int(min(neighbor for neighbor in self.edges[path[-1]]
+                                if distances[neighbor] == distances[path[-1]] - 1)))
+
+        return path
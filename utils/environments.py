@@ -1,8 +1,12 @@
 import networkx as nx
+import numpy as np
 import random
 
+from utils.distances import UNREACHABLE, DistanceIndex
+from utils.graph import CSRGraph
 
-def environments(graph_function, agents, agents_seed, **kwargs):
+
+def environments(graph_function, agents, agents_seed, verbose=True, **kwargs):
     """
     Create an environment from a NetworkX graph.
 
@@ -12,6 +16,7 @@ def environments(graph_function, agents, agents_seed, **kwargs):
     :param agents: the number of agents or the list containing origin and destination of each agent. In the former case
     the positions will be computed randomly.
     :param agents_seed: the random seed used for agents generation
+    :param verbose: True to print the adjacency list and the agents, see print_environment
 
     :return list of agents' positions, list of neighbors for each vertex and the minimum and maximum shortest path
     lengths
@@ -24,13 +29,7 @@ def environments(graph_function, agents, agents_seed, **kwargs):
 
     graph = nx.convert_node_labels_to_integers(graph)
 
-    edges = []
-
-    for node, neighbors in graph.adj.items():
-        edges.insert(node, set())
-        edges[node].add(node)
-        for neighbor, _ in neighbors.items():
-            edges[node].add(neighbor)
+    edges = CSRGraph.from_networkx(graph).to_edges()
 
     if type(agents) is int:
         agents = generate_agents(edges, agents, agents_seed)
@@ -41,13 +40,25 @@ def environments(graph_function, agents, agents_seed, **kwargs):
             if type(a) is not tuple:
                 raise Exception("agents must be a list of tuples.")
 
+    if verbose:
+        print_environment(edges, agents)
+
+    return agents, edges, graph
+
+
+def print_environment(edges, agents):
+    """
+    Print the neighbors of each vertex and the agents.
+
+    :param edges: the list of neighbors for each vertex
+    :param agents: the origin and destination of each agent
+    """
+
     print("ENVIRONMENT: ")
     [print(str(node) + ": " + str(neighbors)) for node, neighbors in enumerate(edges)]
     print("AGENTS: ")
     print(agents)
 
-    return agents, edges, graph
-
 
 def generate_agents(edges, number_of_agents, seed=None):
     """
@@ -65,26 +76,80 @@ def generate_agents(edges, number_of_agents, seed=None):
         raise ValueError("There are too many agents.")
 
     agents = []
-    available_positions = list(range(len(edges)))
     random.seed(seed)
 
+    # The available positions are kept in a Fenwick tree counting them: the i-th one is found and removed in O(log n),
+    # drawing the same positions as popping them from a list but without shifting it
+    vertices_len = len(edges)
+    tree = [index & -index for index in range(vertices_len + 1)]
+    available = vertices_len
+    top_step = 1 << (vertices_len.bit_length() - 1) if vertices_len else 0
+
+    def pop(rank):
+        position, step = 0, top_step
+        while step:
+            if position + step <= vertices_len and tree[position + step] <= rank:
+                position += step
+                rank -= tree[position]
+            step >>= 1
+
+        index = position + 1
+        while index <= vertices_len:
+            tree[index] -= 1
+            index += index & -index
+
+        return position
+
     while len(agents) < number_of_agents:
-        agents.append((available_positions.pop(random.randrange(len(available_positions))),
-                       available_positions.pop(random.randrange(len(available_positions)))))
+        origin = pop(random.randrange(available))
+        destination = pop(random.randrange(available - 1))
+        available -= 2
+        agents.append((origin, destination))
 
     return agents
 
 
-def min_max_shortest_path(graph, agents):
+def sample_agents(vertices_len, number_of_agents, seed=None):
     """
-    Compute and return the minimum and maximum shortest path.
+    Generate random origins and destinations, all distinct, drawing them at once with NumPy. Faster than
+    generate_agents on large graphs, but the agents differ from those generated by it with the same seed.
+
+    :param vertices_len: the number of vertices
+    :param number_of_agents: the number of agents
+    :param seed: the random seed
+    :return: a list of length number_of_agents, containing for each agent its origin and destination
+
+    :raise ValueError when the number of agents is too big to fit in the graph
+    """
+
+    if number_of_agents * 2 > vertices_len:
+        raise ValueError("There are too many agents.")
+
+    positions = np.random.default_rng(seed).choice(vertices_len, 2 * number_of_agents, replace=False)
+
+    return [(int(origin), int(destination)) for origin, destination in positions.reshape(-1, 2)]
 
-    :param graph: the graph
+
+def min_max_shortest_path(graph, agents, edges=None):
+    """
+    Compute and return the minimum and maximum shortest path, using the shared distance cache.
+
+    :param graph: the graph, whose nodes must be labelled with integers from 0
     :param agents: the source and destination of each agent
+    :param edges: the list of neighbors for each vertex, when None it is obtained from the graph
     :return: the minimum and maximum shortest path
+
+    :raise NetworkXNoPath when the destination of an agent is not reachable from its origin
     """
 
-    shortest_paths = [nx.shortest_path_length(graph, source=agent[0], target=agent[1]) for agent in agents]
+    if edges is None:
+        edges = [set(graph.adj[node]) for node in range(graph.number_of_nodes())]
+
+    distance_index = DistanceIndex(edges)
+    shortest_paths = [distance_index.distance(agent[0], agent[1]) for agent in agents]
+
+    if UNREACHABLE in shortest_paths:
+        raise nx.NetworkXNoPath("The destination of an agent is not reachable from its origin")
 
     return min(shortest_paths), max(shortest_paths)
 
@@ -111,6 +176,24 @@ def grid_graph_with_obstacles(probability_obstacle, n, m, seed=None):
     return nx.convert_node_labels_to_integers(graph)
 
 
+def obstacle_grid(probability_obstacle, n, m, seed=None):
+    """
+    Create a grid graph whose cells are blocked with a given probability, drawing the obstacle mask at once with NumPy.
+    Counterpart of grid_graph_with_obstacles producing a CSRGraph, the obstacles differ from those generated by it
+    with the same seed.
+
+    :param probability_obstacle: probability to remove a node from the initial grid graph
+    :param n: number of rows
+    :param m: number of columns
+    :param seed: the random seed
+    :return: a CSRGraph, use to_networkx to obtain a NetworkX graph
+    """
+
+    blocked = np.random.default_rng(seed).random((n, m)) <= probability_obstacle
+
+    return CSRGraph.grid(n, m, blocked)
+
+
 def generate_dungeon(rooms_num, rooms_size_min, rooms_size_max, corridor_length_min, corridor_length_max, seed=None):
     """
     Generate a NetworkX graph representing a dungeon or an indoor environment. Each room is connected with at least
@@ -125,9 +208,7 @@ def generate_dungeon(rooms_num, rooms_size_min, rooms_size_max, corridor_length_
     :return: a a NetworkX graph representing a dungeon or an indoor environment
     """
 
-    if rooms_num <= 1 or rooms_size_min <= 1 or rooms_size_max <= 1 or corridor_length_min < 1 or\
-            corridor_length_max < 0:
-        raise ValueError("Some arguments are not correct")
+    check_dungeon_arguments(rooms_num, rooms_size_min, rooms_size_max, corridor_length_min, corridor_length_max)
 
     random.seed(seed)
     graph = nx.Graph()
@@ -150,15 +231,68 @@ def generate_dungeon(rooms_num, rooms_size_min, rooms_size_max, corridor_length_
     return nx.convert_node_labels_to_integers(graph)
 
 
-def generate_warehouse(rows, columns, shelf_length, corridor_width):
+def check_dungeon_arguments(rooms_num, rooms_size_min, rooms_size_max, corridor_length_min, corridor_length_max):
     """
-    Generate a warehouse style graph
-    :param rows: grid number of rows, direction of the shelves.
-    :param columns: grid number of columns, bigger at least of 2 than the shelf length.
-    :param shelf_length: length of the shelf
-    :param corridor_width: distance between shelves
-    :return: graph
+    Validate the arguments of generate_dungeon and dungeon_graph.
+
+    :raise ValueError when some arguments are not correct
+    """
+
+    if rooms_num <= 1 or rooms_size_min <= 1 or rooms_size_max <= 1 or corridor_length_min < 1 or\
+            corridor_length_max < 0:
+        raise ValueError("Some arguments are not correct")
+
+
+def dungeon_graph(rooms_num, rooms_size_min, rooms_size_max, corridor_length_min, corridor_length_max, seed=None):
+    """
+    Counterpart of generate_dungeon producing a CSRGraph: the rooms are grids whose vertices are numbered one room
+    after the other, followed by the vertices of the corridors. Each corridor connects a random vertex of a room with
+    one of the next room. The dungeons differ from those generated by generate_dungeon with the same seed.
+
+    :param rooms_num: number of rooms
+    :param rooms_size_min: minimum room's side length
+    :param rooms_size_max: maximum room's side length
+    :param corridor_length_min: minimum corridor's length
+    :param corridor_length_max: maximum corridor's length
+    :param seed: the random seed
+    :return: a CSRGraph, use to_networkx to obtain a NetworkX graph
+    """
+
+    check_dungeon_arguments(rooms_num, rooms_size_min, rooms_size_max, corridor_length_min, corridor_length_max)
+
+    rng = np.random.default_rng(seed)
+    sizes = rng.integers(rooms_size_min, rooms_size_max, size=(rooms_num, 2), endpoint=True)
+    cells = sizes.prod(axis=1)
+    starts = np.concatenate(([0], np.cumsum(cells)[:-1]))
+    links = starts + rng.integers(0, cells)
+    lengths = rng.integers(corridor_length_min, corridor_length_max, size=rooms_num - 1, endpoint=True)
+
+    sources, targets = [], []
+    for room in range(rooms_num):
+        room_sources, room_targets = CSRGraph.grid(int(sizes[room, 0]), int(sizes[room, 1])).arcs()
+        sources.append(room_sources + starts[room])
+        targets.append(room_targets + starts[room])
+
+    # Each corridor is the path from a link through its new vertices to the link of the next room
+    first_vertex = int(cells.sum())
+    corridor_starts = first_vertex + np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    for corridor in range(rooms_num - 1):
+        path = np.concatenate(([links[corridor]],
+                               np.arange(corridor_starts[corridor], corridor_starts[corridor] + lengths[corridor]),
+                               [links[corridor + 1]]))
+        sources.extend((path[:-1], path[1:]))
+        targets.extend((path[1:], path[:-1]))
+
+    return CSRGraph.from_arcs(first_vertex + int(lengths.sum()), np.concatenate(sources), np.concatenate(targets))
+
+
+def check_warehouse_arguments(rows, columns, shelf_length, corridor_width):
+    """
+    Validate the arguments of generate_warehouse and warehouse_grid.
+
+    :raise ValueError when the sizes are not correct
     """
+
     if columns <= 0 or rows <= 0:
         raise ValueError("Warehouse size is not correct.")
     if shelf_length <= 0 or shelf_length > columns - 2:
@@ -167,6 +301,18 @@ def generate_warehouse(rows, columns, shelf_length, corridor_width):
     if corridor_width <= 0 or corridor_width + 1 > rows - 2:
         raise ValueError("The corridor width is not correct.")
 
+
+def generate_warehouse(rows, columns, shelf_length, corridor_width):
+    """
+    Generate a warehouse style graph
+    :param rows: grid number of rows, direction of the shelves.
+    :param columns: grid number of columns, bigger at least of 2 than the shelf length.
+    :param shelf_length: length of the shelf
+    :param corridor_width: distance between shelves
+    :return: graph
+    """
+    check_warehouse_arguments(rows, columns, shelf_length, corridor_width)
+
     corridors_num = rows // (corridor_width + 1)
     y_offset = (columns - shelf_length) // 2
     to_remove = []
@@ -178,3 +324,27 @@ def generate_warehouse(rows, columns, shelf_length, corridor_width):
     graph.remove_nodes_from(to_remove)
 
     return nx.convert_node_labels_to_integers(graph)
+
+
+def warehouse_grid(rows, columns, shelf_length, corridor_width):
+    """
+    Counterpart of generate_warehouse producing a CSRGraph with the same vertices and edges, the shelves are placed on
+    the obstacle mask with NumPy slicing.
+
+    :param rows: grid number of rows, direction of the shelves.
+    :param columns: grid number of columns, bigger at least of 2 than the shelf length.
+    :param shelf_length: length of the shelf
+    :param corridor_width: distance between shelves
+    :return: a CSRGraph, use to_networkx to obtain a NetworkX graph
+    """
+
+    check_warehouse_arguments(rows, columns, shelf_length, corridor_width)
+
+    corridors_num = rows // (corridor_width + 1)
+    y_offset = (columns - shelf_length) // 2
+    # As in generate_warehouse, the grid has a row for each column of the warehouse
+    blocked = np.zeros((columns, rows), dtype=bool)
+    shelves = 1 + (1 + corridor_width) * np.arange(corridors_num)
+    blocked[y_offset:y_offset + shelf_length, shelves[shelves < rows]] = True
+
+    return CSRGraph.grid(columns, rows, blocked)
@@ -0,0 +1,226 @@
+import bisect
+import hashlib
+import itertools
+
+import numpy as np
+
+"""
+This file contains a compact representation of the graphs in compressed sparse row (CSR) format: the neighbors of the
+vertex x are neighbors[offsets[x]:offsets[x + 1]], sorted, as int32 arrays. The self-loops, i.e. the waits of the
+agents, are not stored in the arrays: the flag self_loops states that every vertex is also a neighbor of itself, as in
+the lists of sets used by the solvers.
+
+The graphs are built from NetworkX graphs, from the list of sets or from grids with NumPy operations on the arrays of
+arcs, without loops over the edges in Python. to_edges returns the list of sets expected by the solvers.
+"""
+
+
+class CSRGraph:
+    """
+    Immutable graph in CSR format. Indexing a vertex returns a view of its neighbors, not a copy.
+    """
+
+    def __init__(self, offsets, neighbors, self_loops=True):
+        """
+        :param offsets: int32 array of length vertices + 1, the neighbors of x start at offsets[x]
+        :param neighbors: int32 array containing the sorted neighbors of each vertex, self-loops excluded
+        :param self_loops: True when each vertex is also a neighbor of itself
+        """
+
+        self.offsets = np.ascontiguousarray(offsets, dtype=np.int32)
+        self.neighbors = np.ascontiguousarray(neighbors, dtype=np.int32)
+        self.self_loops = self_loops
+        self.offsets.flags.writeable = False
+        self.neighbors.flags.writeable = False
+
+    @classmethod
+    def from_arcs(cls, vertices_len, sources, targets, self_loops=True):
+        """
+        Create a graph from the arrays of its directed arcs. Duplicated arcs and self-loops are removed.
+
+        :param vertices_len: the number of vertices
+        :param sources: array of the first vertex of each arc
+        :param targets: array of the second vertex of each arc
+        :param self_loops: True when each vertex is also a neighbor of itself
+        :return: the graph
+        """
+
+        sources = np.asarray(sources, dtype=np.int64)
+        targets = np.asarray(targets, dtype=np.int64)
+        if sources.size and (min(sources.min(), targets.min()) < 0 or
+                             max(sources.max(), targets.max()) >= vertices_len):
+            raise ValueError("The arcs must connect vertices in [0, %d)" % vertices_len)
+
+        # Sorting the arcs by code sorts them by source, then by target
+        codes = np.unique(sources[sources != targets] * vertices_len + targets[sources != targets])
+        offsets = np.zeros(vertices_len + 1, dtype=np.int32)
+        np.cumsum(np.bincount(codes // vertices_len, minlength=vertices_len), out=offsets[1:])
+
+        return cls(offsets, codes % vertices_len, self_loops)
+
+    @classmethod
+    def from_networkx(cls, graph, self_loops=True):
+        """
+        Create a graph from a NetworkX graph, whose nodes must be labelled with integers from 0, e.g. with
+        convert_node_labels_to_integers. The edges of undirected graphs are traversed in both directions.
+
+        :param graph: the NetworkX graph
+        :param self_loops: True when each vertex is also a neighbor of itself
+        :return: the graph
+        """
+
+        edges_len = graph.number_of_edges()
+        arcs = np.fromiter(itertools.chain.from_iterable(graph.edges()), dtype=np.int64, count=2 * edges_len)
+        sources, targets = arcs[0::2], arcs[1::2]
+        if not graph.is_directed():
+            sources, targets = np.concatenate((sources, targets)), np.concatenate((targets, sources))
+
+        return cls.from_arcs(graph.number_of_nodes(), sources, targets, self_loops)
+
+    @classmethod
+    def from_edges(cls, edges):
+        """
+        Create a graph from the list of sets used by the solvers. The self-loop flag is set when every vertex is a
+        neighbor of itself, the self-loops of the remaining vertices are lost.
+
+        :param edges: list of sets containing for each vertex (whose identifier is the index of this list) its neighbors
+        :return: the graph
+        """
+
+        lengths = np.fromiter((len(neighbors) for neighbors in edges), dtype=np.int64, count=len(edges))
+        targets = np.fromiter(itertools.chain.from_iterable(edges), dtype=np.int64, count=int(lengths.sum()))
+        sources = np.repeat(np.arange(len(edges), dtype=np.int64), lengths)
+
+        return cls.from_arcs(len(edges), sources, targets,
+                             bool(np.count_nonzero(sources == targets) == len(edges)))
+
+    @classmethod
+    def grid(cls, n, m, blocked=None, self_loops=True):
+        """
+        Create a 4-connected grid of n rows and m columns. The free cells are numbered in row-major order, as the nodes
+        of nx.grid_2d_graph(n, m) after removing the blocked ones and converting the labels to integers.
+
+        :param n: the number of rows
+        :param m: the number of columns
+        :param blocked: boolean array of shape (n, m), True for the cells that are not vertices, None for no obstacles
+        :param self_loops: True when each vertex is also a neighbor of itself
+        :return: the graph
+        """
+
+        free = np.ones((n, m), dtype=bool) if blocked is None else ~np.asarray(blocked, dtype=bool)
+        if free.shape != (n, m):
+            raise ValueError("The blocked cells must be an array of shape (%d, %d)" % (n, m))
+
+        # Identifier of each free cell, -1 for the blocked ones
+        identifiers = np.where(free, np.cumsum(free.ravel()).reshape(n, m) - 1, -1)
+
+        horizontal = free[:, :-1] & free[:, 1:]
+        vertical = free[:-1, :] & free[1:, :]
+        sources = np.concatenate((identifiers[:, :-1][horizontal], identifiers[:-1, :][vertical]))
+        targets = np.concatenate((identifiers[:, 1:][horizontal], identifiers[1:, :][vertical]))
+
+        return cls.from_arcs(int(free.sum()), np.concatenate((sources, targets)), np.concatenate((targets, sources)),
+                             self_loops)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, vertex):
+        """
+        :return: a read-only view of the neighbors of a vertex, self-loop excluded
+        """
+
+        return self.neighbors[self.offsets[vertex]:self.offsets[vertex + 1]]
+
+    def __iter__(self):
+        for vertex in range(len(self)):
+            yield self[vertex]
+
+    def degrees(self):
+        """
+        :return: int32 array containing the number of neighbors of each vertex, self-loop excluded
+        """
+
+        return np.diff(self.offsets)
+
+    def arcs(self):
+        """
+        :return: the arrays of the sources and targets of the arcs, self-loops excluded
+        """
+
+        return np.repeat(np.arange(len(self), dtype=np.int32), self.degrees()), self.neighbors
+
+    def gather(self, vertices):
+        """
+        Collect the neighbors of several vertices at once, e.g. to expand the frontier of a breadth-first search.
+
+        :param vertices: int array of vertices
+        :return: int32 array containing the neighbors of each vertex, in order and with repetitions, self-loops
+        excluded
+        """
+
+        starts = self.offsets[vertices]
+        counts = self.offsets[np.asarray(vertices) + 1] - starts
+        # Position of each gathered neighbor: the start of its vertex plus its rank inside the vertex
+        positions = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+
+        return self.neighbors[positions]
+
+    def to_edges(self):
+        """
+        :return: the list of sets containing for each vertex its neighbors, used by the solvers, self-loops included
+        when the flag is set
+        """
+
+        neighbors, offsets = self.neighbors.tolist(), self.offsets.tolist()
+        edges = [set(neighbors[offsets[vertex]:offsets[vertex + 1]]) for vertex in range(len(self))]
+        if self.self_loops:
+            for vertex, vertex_neighbors in enumerate(edges):
+                vertex_neighbors.add(vertex)
+
+        return edges
+
+    def to_lists(self, self_loops=True):
+        """
+        Materialize the neighbors as Python lists, read by the loops of the solvers: indexing a list is faster than
+        reading the items of an array view one by one.
+
+        :param self_loops: False to exclude the self-loops even when the flag is set
+        :return: the list containing for each vertex the sorted list of its neighbors, self-loop included when the flag
+        is set and self_loops is True
+        """
+
+        neighbors, offsets = self.neighbors.tolist(), self.offsets.tolist()
+        lists = [neighbors[offsets[vertex]:offsets[vertex + 1]] for vertex in range(len(self))]
+        if self.self_loops and self_loops:
+            for vertex, vertex_neighbors in enumerate(lists):
+                bisect.insort(vertex_neighbors, vertex)
+
+        return lists
+
+    def to_networkx(self):
+        """
+        :return: a NetworkX graph with the same vertices and edges, without self-loops, e.g. to animate a plan
+        """
+        import networkx as nx
+
+        graph = nx.Graph()
+        graph.add_nodes_from(range(len(self)))
+        sources, targets = self.arcs()
+        graph.add_edges_from(zip(sources.tolist(), targets.tolist()))
+
+        return graph
+
+    def key(self, self_loops=True):
+        """
+        Compute a hash identifying the graph.
+
+        :param self_loops: False to ignore the self-loop flag, e.g. to share the distances of the two graphs
+        :return: a hexadecimal string
+        """
+
+        digest = hashlib.sha1(self.offsets.tobytes())
+        digest.update(self.neighbors.tobytes())
+        digest.update(b"loops" if self.self_loops and self_loops else b"")
+
+        return digest.hexdigest()
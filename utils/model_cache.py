@@ -0,0 +1,158 @@
+import hashlib
+import json
+import os
+import tempfile
+
+import numpy as np
+
+from utils.distances import graph_key
+
+"""
+This file contains the on-disk cache of the models built by the solvers: the SMT-LIB2 text of the assertions of run_Z3
+and the pickled CpoModel of run_CPLEX, which is loaded faster than its CPO text is parsed. The files are keyed by a hash
+of the instance and of the options that change the model, so that the benchmarks and the test files, which build the
+same seeded instances at every run, load the model instead of building it again with the Python APIs. The files are
+trusted: do not share a cache directory with untrusted users, since loading a pickle can execute code.
+
+The cache is bounded in size: when a new model exceeds the maximum number of bytes the least recently used files are
+removed first. The last use of a file is its modification time, updated on every hit.
+"""
+
+# Increase when the models change, the files written by previous versions are not used anymore
+MODEL_VERSION = 1
+
+DEFAULT_DIRECTORY = os.path.join(tempfile.gettempdir(), "mapf_model_cache")
+DEFAULT_MAX_BYTES = 1 << 30
+
+
+class ModelCache:
+    """
+    A directory of model files with LRU eviction and hit/miss counters.
+    """
+
+    def __init__(self, directory=DEFAULT_DIRECTORY, max_bytes=DEFAULT_MAX_BYTES):
+        """
+        :param directory: the directory of the files, created when missing
+        :param max_bytes: the maximum size of the files in the directory
+        """
+
+        if max_bytes <= 0:
+            raise ValueError("The maximum size of the cache must be positive")
+
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.statistics = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, kind, edges, agents, **options):
+        """
+        Compute the key of a model.
+
+        :param kind: the format of the model, used as extension of the file, e.g. "smt2" or "pickle"
+        :param edges: list of sets containing for each vertex its neighbors
+        :param agents: list of tuples containing origins and destinations
+        :param options: the arguments that change the model, e.g. the makespan and the encoding. NumPy arrays, such as
+        the plans of the obstacles, are hashed by content.
+        :return: the key, i.e. the name of the file
+        """
+
+        digest = hashlib.sha1()
+        digest.update(graph_key(edges).encode())
+        digest.update(json.dumps([MODEL_VERSION, [[int(origin), int(destination)] for origin, destination in agents]])
+                      .encode())
+
+        for name in sorted(options):
+            value = options[name]
+            digest.update(name.encode())
+            if isinstance(value, np.ndarray):
+                digest.update(json.dumps(value.shape).encode())
+                digest.update(np.ascontiguousarray(value, dtype=np.int32).tobytes())
+            else:
+                digest.update(json.dumps(value).encode())
+
+        return "%s.%s" % (digest.hexdigest(), kind)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key)
+
+    def load(self, key):
+        """
+        Read a model.
+
+        :param key: the key of the model
+        :return: the bytes of the model, None when it is not cached
+        """
+
+        path = self._path(key)
+        try:
+            with open(path, "rb") as model_file:
+                data = model_file.read()
+        except OSError:
+            self.statistics["misses"] += 1
+            return None
+
+        self.statistics["hits"] += 1
+        os.utime(path)
+        return data
+
+    def store(self, key, data):
+        """
+        Write a model, then remove the least recently used files until the cache fits its maximum size. A model larger
+        than the cache is not stored.
+
+        :param key: the key of the model
+        :param data: the bytes of the model
+        """
+
+        # Write to a temporary file first, so that a concurrent reader never sees a partial model
+        descriptor, temporary_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(descriptor, "wb") as model_file:
+            model_file.write(data)
+        os.replace(temporary_path, self._path(key))
+        self.statistics["stores"] += 1
+
+        self._evict()
+
+    def _files(self):
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and not entry.name.endswith(".tmp"):
+                status = entry.stat()
+                files.append((status.st_mtime, status.st_size, entry.path))
+
+        return files
+
+    def _evict(self):
+        files = sorted(self._files())
+        total_bytes = sum(size for _, size, _ in files)
+
+        for _, size, path in files:
+            if total_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total_bytes -= size
+            self.statistics["evictions"] += 1
+
+    def info(self):
+        """
+        Return the statistics of the cache.
+
+        :return: a dictionary with the number of hits, misses, stores and evictions, and the number of files and bytes
+        in the directory
+        """
+
+        files = self._files()
+        return dict(self.statistics, size=len(files), bytes=sum(size for _, size, _ in files))
+
+    def clear(self):
+        """
+        Remove all the files of the cache and reset its statistics.
+        """
+
+        for _, _, path in self._files():
+            os.remove(path)
+        for name in self.statistics:
+            self.statistics[name] = 0
@@ -0,0 +1,160 @@
+import itertools
+import os
+import tempfile
+
+import numpy as np
+
+from utils.graph import CSRGraph
+
+"""
+This file contains a loader of the MAPF benchmarks of the MovingAI repository (https://movingai.com/benchmarks/mapf/):
+
+- a .map file is a header (type, height, width) followed by the rows of the grid, where ".", "G" and "S" are passable
+  cells. The grid is memory-mapped and converted to a 4-connected CSRGraph without going through NetworkX. The free
+  cells are numbered in row-major order.
+- a .scen file lists one agent per row: bucket, map, width, height, start x, start y, goal x, goal y and the optimal
+  length, where x is the column and y the row. The rows are read lazily, so that the first k agents are taken without
+  parsing the whole file.
+
+The graph parsed from a map is cached next to it in a .npz file, used until the map is modified.
+"""
+
+# Characters of the passable cells
+PASSABLE = b".GS"
+
+CACHE_SUFFIX = ".csr.npz"
+
+
+def _read_header(path):
+    """
+    Read the header of a map.
+
+    :param path: the path of the .map file
+    :return: the height, the width and the offset of the first row of the grid
+    """
+
+    header = dict()
+    with open(path, "rb") as map_file:
+        while True:
+            line = map_file.readline()
+            if not line:
+                raise ValueError("%s: the grid of the map is missing" % path)
+            tokens = line.split()
+            if tokens == [b"map"]:
+                break
+            if len(tokens) == 2:
+                header[tokens[0].decode()] = tokens[1].decode()
+
+        offset = map_file.tell()
+
+    if "height" not in header or "width" not in header:
+        raise ValueError("%s: the header must contain the height and the width of the map" % path)
+
+    return int(header["height"]), int(header["width"]), offset
+
+
+def parse_map(path):
+    """
+    Parse the grid of a map, memory-mapping the file.
+
+    :param path: the path of the .map file
+    :return: a boolean array of shape (height, width), True for the blocked cells
+    """
+
+    height, width, offset = _read_header(path)
+    data = np.memmap(path, dtype=np.uint8, mode="r", offset=offset)
+
+    # The rows end with "\n" or "\r\n", the last one may have no line break
+    stride = width + 2 if width + 1 < len(data) and data[width] == ord("\r") else width + 1
+    if height <= 0 or width <= 0 or len(data) < (height - 1) * stride + width:
+        raise ValueError("%s: the grid is smaller than %dx%d" % (path, height, width))
+
+    grid = np.lib.stride_tricks.as_strided(data, shape=(height, width), strides=(stride, 1))
+
+    return ~np.isin(grid, np.frombuffer(PASSABLE, dtype=np.uint8))
+
+
+def load_map(path, cache=True):
+    """
+    Load a map as a graph whose vertices are its free cells.
+
+    :param path: the path of the .map file
+    :param cache: True to read and write the parsed graph in the file next to the map
+    :return: the CSRGraph and an int32 array of shape (height, width) containing the vertex of each cell, -1 for the
+    blocked ones
+    """
+
+    cache_path = path + CACHE_SUFFIX
+    status = os.stat(path)
+    source = np.array([status.st_size, status.st_mtime_ns], dtype=np.int64)
+
+    if cache and os.path.exists(cache_path):
+        with np.load(cache_path) as cached:
+            if np.array_equal(cached["source"], source):
+                return CSRGraph(cached["offsets"], cached["neighbors"]), cached["identifiers"]
+
+    blocked = parse_map(path)
+    graph = CSRGraph.grid(blocked.shape[0], blocked.shape[1], blocked)
+    identifiers = np.where(blocked, -1, np.cumsum(~blocked.ravel()).reshape(blocked.shape) - 1).astype(np.int32)
+
+    if cache:
+        # Write to a temporary file first, a missing cache is not an error (e.g. the directory is read-only)
+        try:
+            descriptor, temporary_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp")
+            with os.fdopen(descriptor, "wb") as cache_file:
+                np.savez(cache_file, source=source, offsets=graph.offsets, neighbors=graph.neighbors,
+                         identifiers=identifiers)
+            os.replace(temporary_path, cache_path)
+        except OSError:
+            pass
+
+    return graph, identifiers
+
+
+def stream_scenario(path, identifiers):
+    """
+    Read lazily the agents of a scenario.
+
+    :param path: the path of the .scen file
+    :param identifiers: the array returned by load_map, containing the vertex of each cell of the map
+    :return: a generator of tuples containing origin and destination of each agent
+    :raise ValueError when an agent starts or ends on a cell outside the map or blocked
+    """
+
+    height, width = identifiers.shape
+    with open(path) as scenario_file:
+        for number, line in enumerate(scenario_file, 1):
+            tokens = line.split("\t")
+            # The first line is the version of the format
+            if len(tokens) < 9:
+                continue
+
+            start_x, start_y, goal_x, goal_y = (int(token) for token in tokens[4:8])
+            if not (0 <= start_x < width and 0 <= goal_x < width and 0 <= start_y < height and 0 <= goal_y < height):
+                raise ValueError("%s:%d: the agent is outside the map" % (path, number))
+
+            origin, destination = int(identifiers[start_y, start_x]), int(identifiers[goal_y, goal_x])
+            if origin < 0 or destination < 0:
+                raise ValueError("%s:%d: the agent starts or ends on a blocked cell" % (path, number))
+
+            yield origin, destination
+
+
+def movingai_environment(map_path, scenario_path, agents, cache=True):
+    """
+    Create an environment from a MovingAI map and the first agents of a scenario.
+
+    :param map_path: the path of the .map file
+    :param scenario_path: the path of the .scen file
+    :param agents: the number of agents taken from the scenario
+    :param cache: True to cache the parsed map, see load_map
+    :return list of agents' positions, list of neighbors for each vertex, used by the solvers, and the CSRGraph
+    :raise ValueError when the scenario has less agents
+    """
+
+    graph, identifiers = load_map(map_path, cache)
+    pairs = list(itertools.islice(stream_scenario(scenario_path, identifiers), agents))
+    if len(pairs) < agents:
+        raise ValueError("The scenario contains only %d agents" % len(pairs))
+
+    return pairs, graph.to_edges(), graph
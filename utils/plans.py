@@ -0,0 +1,179 @@
+import numpy as np
+
+"""
+A plan is stored as a dense NumPy array of shape (agents, makespan + 1) and type int32: plan[a, t] is the vertex
+occupied by the agent a at the time step t. The rows can be used in place of the lists of vertices returned by the
+first version of the solvers, e.g. by movement_animation.
+"""
+
+
+def empty_plan(agents_len, makespan):
+    """
+    Create a plan where every position is unassigned (-1).
+
+    :param agents_len: the number of agents
+    :param makespan: the makespan of the plan
+    :return: an int32 array of shape (agents_len, makespan + 1)
+    """
+
+    return np.full((agents_len, makespan + 1), -1, dtype=np.int32)
+
+
+def paths_to_plan(paths):
+    """
+    Convert a list of paths into a plan. Shorter paths are extended by waiting on their last vertex.
+
+    :param paths: list of lists containing the path of each agent
+    :return: an int32 array of shape (agents, longest path length)
+    """
+
+    length = max(len(path) for path in paths)
+    plan = empty_plan(len(paths), length - 1)
+    for agent, path in enumerate(paths):
+        plan[agent, :len(path)] = path
+        plan[agent, len(path):] = path[-1]
+
+    return plan
+
+
+def print_plan(plan):
+    """
+    Print the path of each agent.
+
+    :param plan: the plan
+    """
+
+    for agent, path in enumerate(plan):
+        print("Agent %d:\t" % agent + "".join("%d\t" % vertex for vertex in path))
+
+
+def arrival_times(plan, agents):
+    """
+    Compute the time step from which each agent stays on its destination.
+
+    :param plan: the plan
+    :param agents: list of tuples containing origins and destinations
+    :return: an int32 array containing the arrival time of each agent
+    """
+
+    destinations = np.array([pair[1] for pair in agents], dtype=np.int32)
+    away = plan != destinations[:, None]
+    # The last time step away from the destination plus one, zero if the agent never leaves it
+    last_away = plan.shape[1] - 1 - np.argmax(away[:, ::-1], axis=1)
+
+    return np.where(away.any(axis=1), last_away + 1, 0).astype(np.int32)
+
+
+def sum_of_costs(plan, agents):
+    """
+    Compute the sum of the arrival times of the agents.
+
+    :param plan: the plan
+    :param agents: list of tuples containing origins and destinations
+    :return: the sum of costs
+    """
+
+    return int(arrival_times(plan, agents).sum())
+
+
+def plan_makespan(plan, agents):
+    """
+    Compute the time step from which all the agents stay on their destinations.
+
+    :param plan: the plan
+    :param agents: list of tuples containing origins and destinations
+    :return: the makespan
+    """
+
+    return int(arrival_times(plan, agents).max(initial=0))
+
+
+# Last time step of the vertices where the agents of a plan wait forever
+PARKED = np.iinfo(np.int32).max
+
+
+def last_visits(plan, edges_len):
+    """
+    Compute the last time step in which each vertex is occupied by a plan, whose agents wait forever on their last
+    vertices. Used when the plan is an obstacle for other agents: they can park on a vertex only after its last visit.
+
+    :param plan: the plan
+    :param edges_len: the number of vertices
+    :return: an int32 array containing for each vertex its last visit, -1 when never visited and PARKED for the last
+    vertices of the plan
+    """
+
+    visits = np.full(edges_len, -1, dtype=np.int32)
+    for time in range(plan.shape[1]):
+        visits[plan[:, time]] = time
+    visits[plan[:, -1]] = PARKED
+
+    return visits
+
+
+def plan_moves(plan, time):
+    """
+    Return the arcs traversed by the agents of a plan from a time step to the next one, waits excluded. After the end
+    of the plan the agents do not move.
+
+    :param plan: the plan
+    :param time: the time step
+    :return: a set of pairs (vertex, neighbor)
+    """
+
+    if time + 1 >= plan.shape[1]:
+        return set()
+
+    return set((int(vertex), int(neighbor)) for vertex, neighbor in zip(plan[:, time], plan[:, time + 1])
+               if vertex != neighbor)
+
+
+def plan_positions(plan, time):
+    """
+    Return the vertices occupied by the agents of a plan at a time step. After the end of the plan the agents wait on
+    their last vertices.
+
+    :param plan: the plan
+    :param time: the time step
+    :return: a set of vertices
+    """
+
+    return set(plan[:, min(time, plan.shape[1] - 1)].tolist())
+
+
+def validate_plan(edges, agents, plan):
+    """
+    Check that a plan solves an instance: each agent starts on its origin, ends on its destination and moves along the
+    arcs of the graph, without vertex and swap conflicts.
+
+    :param edges: list of sets containing for each vertex its neighbors
+    :param agents: list of tuples containing origins and destinations
+    :param plan: the plan
+    :return: True when the plan is valid
+    """
+
+    edges_len = len(edges)
+    if plan.ndim != 2 or plan.shape[0] != len(agents) or plan.shape[1] == 0 or plan.min() < 0 or \
+            plan.max() >= edges_len:
+        return False
+
+    origins, destinations = np.array(agents, dtype=np.int32).reshape(-1, 2).T
+    if (plan[:, 0] != origins).any() or (plan[:, -1] != destinations).any():
+        return False
+
+    # Vertex conflicts: two agents on the same vertex at the same time step
+    if (np.diff(np.sort(plan, axis=0), axis=0) == 0).any():
+        return False
+
+    sources, targets = plan[:, :-1].astype(np.int64), plan[:, 1:].astype(np.int64)
+    arcs = np.unique(sources * edges_len + targets)
+    if any(int(arc) % edges_len not in edges[int(arc) // edges_len] for arc in arcs):
+        return False
+
+    # Swap conflicts: an arc traversed in both directions at the same time step
+    times = np.broadcast_to(np.arange(plan.shape[1] - 1, dtype=np.int64), sources.shape)
+    moving = sources != targets
+    forward = (times[moving] * edges_len + sources[moving]) * edges_len + targets[moving]
+    backward = (times[moving] * edges_len + targets[moving]) * edges_len + sources[moving]
+
+    return not np.isin(forward, backward).any()
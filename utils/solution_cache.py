@@ -0,0 +1,142 @@
+import hashlib
+import json
+import sqlite3
+
+import numpy as np
+
+from utils.distances import graph_key
+from utils.plans import validate_plan
+
+"""
+This file contains a persistent store of optimal plans, kept in a SQLite database in front of the solvers. Instances are
+canonicalised up to the order of the agents: the agents are sorted by origin and destination, so the same graph with
+the same pairs listed in a different order finds the same plan, whose rows are then permuted back. A stored plan is
+validated against the instance before being returned, an invalid one is deleted and reported as a miss.
+
+Hashing the graph dominates the cost of a hit on large graphs: the callers solving many instances on the same graph
+compute its hash once with graph_key and pass it as graph_hash, so that a hit costs a SQLite read and the validation of
+the plan.
+
+Only plans proven optimal must be stored, together with the objective they minimize, by default "makespan" as the SMT
+and CP models.
+"""
+
+DEFAULT_PATH = "solutions.sqlite"
+
+
+class SolutionCache:
+    """
+    SQLite database of optimal plans with hit/miss counters.
+    """
+
+    def __init__(self, path=DEFAULT_PATH):
+        """
+        :param path: the file of the database, created when missing, or ":memory:"
+        """
+
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS solutions "
+                                "(key TEXT PRIMARY KEY, makespan INTEGER NOT NULL, agents INTEGER NOT NULL, "
+                                "plan BLOB NOT NULL)")
+        self.connection.commit()
+        self.statistics = {"hits": 0, "misses": 0, "invalid": 0, "stores": 0}
+
+    def canonical(self, edges, agents, objective="makespan", graph_hash=None):
+        """
+        Compute the key of an instance and the canonical order of its agents.
+
+        :param edges: list of sets containing for each vertex its neighbors
+        :param agents: list of tuples containing origins and destinations
+        :param objective: the objective minimized by the plan
+        :param graph_hash: the hash of the graph computed by graph_key, e.g. once for the instances sharing a graph. The
+        graph must not be modified in place afterwards. By default the graph is hashed at each call.
+        :return: the key and the list of the agents in canonical order, i.e. the canonical row i is the agent order[i]
+        """
+
+        if graph_hash is None:
+            graph_hash = graph_key(edges)
+
+        order = sorted(range(len(agents)), key=lambda agent: (int(agents[agent][0]), int(agents[agent][1])))
+        pairs = [[int(agents[agent][0]), int(agents[agent][1])] for agent in order]
+
+        digest = hashlib.sha1(graph_hash.encode())
+        digest.update(json.dumps([objective, pairs]).encode())
+
+        return digest.hexdigest(), order
+
+    def lookup(self, edges, agents, objective="makespan", graph_hash=None):
+        """
+        Return the stored plan of an instance.
+
+        :param edges: list of sets containing for each vertex its neighbors
+        :param agents: list of tuples containing origins and destinations
+        :param objective: the objective minimized by the plan
+        :param graph_hash: the hash of the graph, see canonical
+        :return: the makespan and the plan, with its rows in the order of agents, or None, None when the instance is not
+        stored or its plan is not valid
+        """
+
+        key, order = self.canonical(edges, agents, objective, graph_hash)
+        row = self.connection.execute("SELECT makespan, agents, plan FROM solutions WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.statistics["misses"] += 1
+            return None, None
+
+        makespan, agents_len, data = row
+        stored = np.frombuffer(data, dtype=np.int32)
+        plan = None
+        if agents_len == len(agents) and stored.size == agents_len * (makespan + 1):
+            plan = np.empty((agents_len, makespan + 1), dtype=np.int32)
+            plan[order] = stored.reshape(agents_len, makespan + 1)
+
+        if plan is None or not validate_plan(edges, agents, plan):
+            self.connection.execute("DELETE FROM solutions WHERE key = ?", (key,))
+            self.connection.commit()
+            self.statistics["invalid"] += 1
+            self.statistics["misses"] += 1
+            return None, None
+
+        self.statistics["hits"] += 1
+        return makespan, plan
+
+    def store(self, edges, agents, plan, objective="makespan", graph_hash=None):
+        """
+        Store the optimal plan of an instance, replacing the previous one.
+
+        :param edges: list of sets containing for each vertex its neighbors
+        :param agents: list of tuples containing origins and destinations
+        :param plan: the plan, i.e. an int32 array of shape (agents, makespan + 1)
+        :param objective: the objective minimized by the plan
+        :param graph_hash: the hash of the graph, see canonical
+        """
+
+        key, order = self.canonical(edges, agents, objective, graph_hash)
+        data = np.ascontiguousarray(plan[order], dtype=np.int32).tobytes()
+
+        with self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO solutions VALUES (?, ?, ?, ?)",
+                                    (key, plan.shape[1] - 1, len(agents), data))
+        self.statistics["stores"] += 1
+
+    def info(self):
+        """
+        Return the statistics of the store.
+
+        :return: a dictionary with the number of hits, misses, invalid plans found, stores and stored plans
+        """
+
+        size = self.connection.execute("SELECT COUNT(*) FROM solutions").fetchone()[0]
+        return dict(self.statistics, size=size)
+
+    def clear(self):
+        """
+        Delete all the plans and reset the statistics.
+        """
+
+        with self.connection:
+            self.connection.execute("DELETE FROM solutions")
+        for name in self.statistics:
+            self.statistics[name] = 0
+
+    def close(self):
+        self.connection.close()